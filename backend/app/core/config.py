@@ -23,9 +23,68 @@ class Settings(BaseSettings):
     
     # Database Settings
     DATABASE_URL: str = "sqlite:///./research_agent_conversations.db"
+    DATABASE_BUSY_TIMEOUT: float = 5.0  # seconds a connection waits for another writer's lock
+    DATABASE_SYNCHRONOUS: str = "NORMAL"  # "NORMAL" (fast, safe in WAL mode) or "FULL" (fsync every commit)
+    DATABASE_CACHE_SIZE_KB: int = 16384  # page cache per connection
+    DATABASE_MMAP_SIZE: int = 64 * 1024 * 1024  # bytes of the database file read through mmap (0 disables)
+    DATABASE_EXECUTOR_WORKERS: int = 4  # threads running database calls for async code
+    DATABASE_SHARDS: int = 1  # conversation database files, users routed by consistent hashing (change with app.utils.reshard)
+    CONVERSATION_WRITE_MODE: str = "buffered"  # "buffered" (group commit) or "direct" (one transaction per exchange)
+    CONVERSATION_FLUSH_INTERVAL_MS: float = 5.0  # longest a buffered exchange waits before its batch commits
+    CONVERSATION_FLUSH_ROWS: int = 256  # exchanges committed per transaction at most
+    CONVERSATION_DURABLE_WRITES: bool = False  # make store_conversation wait for the commit
+    CONVERSATION_KEEP_TURNS: int = 50  # newest exchanges per user kept verbatim; older ones are rolled into summaries
+    CONVERSATION_SUMMARY_TURNS: int = 20  # exchanges rolled into each summary
+    CONVERSATION_MAX_SUMMARIES: int = 10  # summaries kept per user; the oldest are merged beyond this
+    CONVERSATION_SUMMARY_CHARS: int = 1200  # length cap of a summary
+    CONVERSATION_SUMMARIZER: str = "extractive"  # "extractive" (no LLM calls) or "llm"
+    CONVERSATION_SUMMARY_MODEL: str = "gpt-4.1-mini"
+    CONVERSATION_CONTEXT_SUMMARIES: int = 3  # summaries placed before the recent turns in retrieval context
+    SUMMARIZATION_BATCH_USERS: int = 100  # users summarized per run_summarization pass
     
     # Memory Settings
     MEMORY_DB_PATH: str = "./db"
+    MEMORY_COLLECTION: str = "mem0"
+    MEMORY_LLM_MODEL: str = "gpt-4o"
+    MEMORY_LLM_TEMPERATURE: float = 0.2
+    MEMORY_LLM_MAX_TOKENS: int = 2000
+    MEMORY_WARMUP: bool = True  # create the mem0 client at startup instead of on the first request
+    EMBEDDING_PROVIDER: str = "openai"  # "openai" (mem0 default) or "onnx" (local model through onnxruntime)
+    ONNX_EMBEDDING_MODEL_PATH: str = "./models/all-MiniLM-L6-v2/model.onnx"
+    ONNX_TOKENIZER_PATH: str = "./models/all-MiniLM-L6-v2/tokenizer.json"
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_CACHE_PATH: str = "./embedding_cache.db"  # "" disables the on-disk embedding cache
+    MEMORY_WRITE_MODE: str = "async"  # "async" (background ingest queue) or "sync" (write before retrieval)
+    MEMORY_QUEUE_MAX_SIZE: int = 1000
+    MEMORY_QUEUE_BATCH_SIZE: int = 16
+    MEMORY_WRITE_RETRIES: int = 3
+    MEMORY_READ_YOUR_WRITES: bool = True  # expose queued prompts to lexical retrieval until they are written
+    MEMORY_DEDUPE_WINDOW_SECONDS: float = 86400.0  # prompts resent by a user within this window skip extraction (0 disables)
+    MEMORY_PAGE_SIZE: int = 200
+    MEMORY_MAX_CANDIDATES: int = 50000  # newest memories listed per user to build their memory index (0 for no limit); older ones are left out, which is logged
+    MEMORY_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    MEMORY_CACHE_TTL_SECONDS: float = 60.0
+    COMPACTION_SIMILARITY: float = 0.8  # word-bigram Jaccard similarity at which memories are merged
+    COMPACTION_BATCH_USERS: int = 100  # users compacted per run_compaction pass
+    MEMORY_COLD_AFTER_DAYS: float = 90.0  # memories neither written, retrieved nor cited for this long move to the cold store
+    TIERING_BATCH_USERS: int = 100  # users scanned per run_tiering pass
+    
+    # Search Settings
+    SEARCH_BACKEND: str = "index"  # "index" (inverted index) or "sparse" (SciPy CSR)
+    SEARCH_ANALYZER: str = "regex"  # "regex" (fast default) or "nltk"
+    RETRIEVAL_MODE: str = "bm25"  # "bm25" (full corpus) or "hybrid" (vector + BM25 fusion)
+    VECTOR_SEARCH_K: int = 20
+    RRF_K: int = 60
+    COLD_SCORE_THRESHOLD: float = 1.0  # search cold memories when no hot memory scores at least this (0 disables)
+    TOKEN_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    SEARCH_INDEX_REFRESH_SECONDS: float = 3600.0  # rebuild a user's in-memory memory index from the store this often, picking up writes made by other workers (0 never)
+    BM25_SHARD_THRESHOLD: int = 20000  # memories above which a user's index is built in shard worker processes (0 disables); must be below MEMORY_MAX_CANDIDATES
+    BM25_SHARDS: int = 4  # shard worker processes
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 10000
+    RETRIEVAL_CACHE_TTL_SECONDS: float = 300.0
+    CONVERSATION_RETRIEVAL: str = "recent"  # "recent" (last turns + BM25) or "fts" (SQLite FTS5 over full history)
+    INDEX_DIR: str = ""  # directory for mmap'd on-disk BM25 segments shared by workers ("" keeps indexes in memory)
+    INDEX_MERGE_THRESHOLD: int = 8  # merge a user's segments on a background thread once more than this many accumulate
     
     # Logging
     LOG_LEVEL: str = "INFO"
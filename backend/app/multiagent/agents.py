@@ -1,8 +1,10 @@
 from .state import MultiAgentState
-from ..utils.memory import get_all_memories, fetch_cited_memories, write_memory
-from ..utils.database import fetch_conversation_history
-from ..utils.search import bm25_hybrid_search
+from ..utils.memory import get_all_memories, afetch_cited_memories, write_memory
+from ..utils.database import afetch_conversation_history, asearch_conversation_history
+from ..utils.search import abm25_hybrid_search, afused_hybrid_search, memory_index_ready
+from ..utils.retrieval_cache import retrieval_cache
 from ..utils.context import format_context
+from ..core.config import settings
 from ..utils.llm import get_llm, cot_reasoning_prompt, answer_prompt, annotate_with_citations, llm_annotate_with_citations
 
 SUPERVISOR_MODEL = "chatgpt-4.1"
@@ -63,19 +65,33 @@ async def supervisor_agent(state: MultiAgentState):
 
 async def memory_agent(state: MultiAgentState):
     write_memory(state.prompt, state.user_id)
-    all_memories = get_all_memories(state.user_id)
-    hybrid_results = bm25_hybrid_search(state.prompt, all_memories, [], top_n=10)
+    cache_key, hybrid_results = retrieval_cache.lookup(state.user_id, state.prompt, 10, scope="memory")
+    if hybrid_results is None:
+        if settings.RETRIEVAL_MODE == "hybrid":
+            hybrid_results = await afused_hybrid_search(state.prompt, state.user_id, [], top_n=10)
+        else:
+            # A built memory index is searched as it is; otherwise the listing builds it
+            all_memories = None if memory_index_ready(state.user_id) else get_all_memories(state.user_id)
+            hybrid_results = await abm25_hybrid_search(state.prompt, all_memories, [], top_n=10, user_id=state.user_id)
+        retrieval_cache.store(cache_key, hybrid_results)
     top_memories = [r['meta'] for r in hybrid_results if r['type'] == 'memory']
     state.memories = top_memories
     state.history.append(f"MemoryAgent({MEMORY_MODEL}): stored new memory and retrieved memories")
     return state
 
 async def conversation_agent(state: MultiAgentState):
-    conversations = fetch_conversation_history(state.user_id, limit=10)
-    hybrid_results = bm25_hybrid_search(state.prompt, [], conversations, top_n=10)
-    top_conversations = [
-        (r['role'], r['content'], r['timestamp'])
-        for r in hybrid_results if r['type'] == 'conversation']
+    if settings.CONVERSATION_RETRIEVAL == "fts":
+        # Full-text search over the whole history, ranked inside SQLite
+        top_conversations = await asearch_conversation_history(state.user_id, state.prompt, limit=10)
+    else:
+        cache_key, hybrid_results = retrieval_cache.lookup(state.user_id, state.prompt, 10, scope="conversation")
+        if hybrid_results is None:
+            conversations = await afetch_conversation_history(state.user_id, limit=10, summaries=settings.CONVERSATION_CONTEXT_SUMMARIES)
+            hybrid_results = await abm25_hybrid_search(state.prompt, [], conversations, top_n=10, user_id=state.user_id)
+            retrieval_cache.store(cache_key, hybrid_results)
+        top_conversations = [
+            (r['role'], r['content'], r['timestamp'])
+            for r in hybrid_results if r['type'] == 'conversation']
     state.conversations = top_conversations
     state.history.append(f"ConversationAgent({CONVERSATION_MODEL}): retrieved conversations")
     return state
@@ -117,7 +133,7 @@ async def citation_agent(state: MultiAgentState):
     # Always cite at least the top memory if any
     if state.memories:
         citations = [(m['id'], m.get('updated_at') or m.get('created_at', 'N/A')) for m in state.memories]
-        cited_memories = fetch_cited_memories(citations)
+        cited_memories = await afetch_cited_memories(citations, memories=state.memories, user_id=state.user_id)
         state.citations = cited_memories if cited_memories else [state.memories[0]]
         llm = get_llm(model='gpt-4.1-mini')
         state.answer_html = llm_annotate_with_citations(state.answer, cited_memories, llm)
@@ -133,6 +149,6 @@ async def memory_retrieval_agent(state: MultiAgentState):
     return state
 
 async def conversation_retrieval_agent(state: MultiAgentState):
-    state.conversations = fetch_conversation_history(state.user_id, limit=20)
+    state.conversations = await afetch_conversation_history(state.user_id, limit=20, summaries=settings.CONVERSATION_CONTEXT_SUMMARIES)
     state.history.append("Conversation retrieval complete.")
     return state 
\ No newline at end of file
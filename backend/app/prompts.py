@@ -70,4 +70,16 @@ You are a step-by-step reasoning agent. Your job is to generate a chain-of-thoug
 ---
 Now, write the rationale section as instructed above, using numbered markdown links for citations when context is available.
 """
-REASONING_PROMPT = PromptTemplate.from_template(REASONING_PROMPT_TEMPLATE) 
\ No newline at end of file
+REASONING_PROMPT = PromptTemplate.from_template(REASONING_PROMPT_TEMPLATE)
+
+SUMMARIZE_CONVERSATION_PROMPT_TEMPLATE = """
+You are maintaining the long-term record of a research assistant's conversations with one user. Summarize the conversation excerpt below so it can replace the original messages.
+
+1. Keep the facts, preferences, decisions and open questions the user stated, and the conclusions the assistant reached.
+2. Drop greetings, filler and repeated content.
+3. Write plain prose in the third person ("The user asked...", "The assistant explained..."), oldest first.
+4. Do not add or invent any information. Use at most {max_chars} characters.
+
+{conversation}
+"""
+SUMMARIZE_CONVERSATION_PROMPT = PromptTemplate.from_template(SUMMARIZE_CONVERSATION_PROMPT_TEMPLATE)
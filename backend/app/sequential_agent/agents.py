@@ -1,8 +1,10 @@
 from .agentic_state import ResearchState
-from app.utils.memory import get_all_memories, fetch_cited_memories, write_memory
-from app.utils.database import fetch_conversation_history
-from app.utils.search import bm25_hybrid_search
+from app.utils.memory import get_all_memories, afetch_cited_memories, write_memory
+from app.utils.database import afetch_conversation_history, asearch_conversation_history
+from app.utils.search import abm25_hybrid_search, afused_hybrid_search, memory_index_ready
+from app.utils.retrieval_cache import retrieval_cache
 from app.utils.context import format_context
+from app.core.config import settings
 from app.utils.llm import get_llm, cot_reasoning_prompt, answer_prompt, annotate_with_citations
 
 # Model selection for each agent
@@ -16,21 +18,35 @@ CITATION_MODEL = "gpt-4.1-mini"  # fast, cheap, for annotation
 async def memory_agent(state: ResearchState):
     # Store the new prompt as a memory for the user in Mem0
     write_memory(state.prompt, state.user_id)
-    all_memories = get_all_memories(state.user_id)
-    # Use hybrid search to rank memories
-    hybrid_results = bm25_hybrid_search(state.prompt, all_memories, [], top_n=10)
+    cache_key, hybrid_results = retrieval_cache.lookup(state.user_id, state.prompt, 10, scope="memory")
+    if hybrid_results is None:
+        if settings.RETRIEVAL_MODE == "hybrid":
+            hybrid_results = await afused_hybrid_search(state.prompt, state.user_id, [], top_n=10)
+        else:
+            # A built memory index is searched as it is; otherwise the listing builds it
+            all_memories = None if memory_index_ready(state.user_id) else get_all_memories(state.user_id)
+            # Use hybrid search to rank memories
+            hybrid_results = await abm25_hybrid_search(state.prompt, all_memories, [], top_n=10, user_id=state.user_id)
+        retrieval_cache.store(cache_key, hybrid_results)
     top_memories = [r['meta'] for r in hybrid_results if r['type'] == 'memory']
     state.memories = top_memories
     state.history.append(f"MemoryAgent({MEMORY_MODEL}): stored new memory and retrieved memories")
     return state
 
 async def conversation_agent(state: ResearchState):
-    conversations = fetch_conversation_history(state.user_id, limit=10)
-    # Use hybrid search to rank conversations
-    hybrid_results = bm25_hybrid_search(state.prompt, [], conversations, top_n=10)
-    top_conversations = [
-        (r['role'], r['content'], r['timestamp'])
-        for r in hybrid_results if r['type'] == 'conversation']
+    if settings.CONVERSATION_RETRIEVAL == "fts":
+        # Full-text search over the whole history, ranked inside SQLite
+        top_conversations = await asearch_conversation_history(state.user_id, state.prompt, limit=10)
+    else:
+        cache_key, hybrid_results = retrieval_cache.lookup(state.user_id, state.prompt, 10, scope="conversation")
+        if hybrid_results is None:
+            conversations = await afetch_conversation_history(state.user_id, limit=10, summaries=settings.CONVERSATION_CONTEXT_SUMMARIES)
+            # Use hybrid search to rank conversations
+            hybrid_results = await abm25_hybrid_search(state.prompt, [], conversations, top_n=10, user_id=state.user_id)
+            retrieval_cache.store(cache_key, hybrid_results)
+        top_conversations = [
+            (r['role'], r['content'], r['timestamp'])
+            for r in hybrid_results if r['type'] == 'conversation']
     state.conversations = top_conversations
     state.history.append(f"ConversationAgent({CONVERSATION_MODEL}): retrieved conversations")
     return state
@@ -65,7 +81,7 @@ async def answer_agent(state: ResearchState):
 
 async def citation_agent(state: ResearchState):
     citations = [(m['id'], m.get('updated_at') or m.get('created_at', 'N/A')) for m in state.memories]
-    cited_memories = fetch_cited_memories(citations)
+    cited_memories = await afetch_cited_memories(citations, memories=state.memories, user_id=state.user_id)
     state.citations = cited_memories
     state.answer = annotate_with_citations(state.answer, cited_memories)
     state.history.append(f"CitationAgent({CITATION_MODEL}): annotated answer with citations")
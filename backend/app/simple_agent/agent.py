@@ -1,11 +1,13 @@
 import logging
 from langchain_openai import ChatOpenAI
 from app.prompts import ANSWER_GENERATOR_PROMPT, REASONING_PROMPT
-from app.utils.memory import get_all_memories, fetch_cited_memories, write_memory
-from app.utils.database import fetch_conversation_history, store_conversation
-from app.utils.search import bm25_hybrid_search
+from app.utils.memory import get_all_memories, afetch_cited_memories, write_memory
+from app.utils.database import afetch_conversation_history, astore_conversation
+from app.utils.search import abm25_hybrid_search, afused_hybrid_search, memory_index_ready
+from app.utils.retrieval_cache import retrieval_cache
 from app.utils.llm import llm_annotate_with_citations, ground_context
 from app.utils.context import format_context
+from app.core.config import settings
 
 # Set up logger
 logger = logging.getLogger("agent")
@@ -24,9 +26,16 @@ async def agent_pipeline(user_id, prompt):
     """
     llm = ChatOpenAI(model="gpt-4.1-mini", streaming=True)
     write_memory(prompt, user_id)
-    conversation_history = fetch_conversation_history(user_id, limit=10)
-    all_memories = get_all_memories(user_id)
-    hybrid_results = bm25_hybrid_search(prompt, all_memories, conversation_history, top_n=5)
+    cache_key, hybrid_results = retrieval_cache.lookup(user_id, prompt, 5, scope="all")
+    if hybrid_results is None:
+        conversation_history = await afetch_conversation_history(user_id, limit=10, summaries=settings.CONVERSATION_CONTEXT_SUMMARIES)
+        if settings.RETRIEVAL_MODE == "hybrid":
+            hybrid_results = await afused_hybrid_search(prompt, user_id, conversation_history, top_n=5)
+        else:
+            # A built memory index is searched as it is; otherwise the listing builds it
+            all_memories = None if memory_index_ready(user_id) else get_all_memories(user_id)
+            hybrid_results = await abm25_hybrid_search(prompt, all_memories, conversation_history, top_n=5, user_id=user_id)
+        retrieval_cache.store(cache_key, hybrid_results)
     
     # Handle empty hybrid results
     if not hybrid_results:
@@ -41,7 +50,7 @@ async def agent_pipeline(user_id, prompt):
     
     try:
         citations = [(m['id'], m.get('updated_at') or m.get('created_at', 'N/A')) for m in hybrid_memories]
-        cited_memories = fetch_cited_memories(citations)
+        cited_memories = await afetch_cited_memories(citations, memories=hybrid_memories, user_id=user_id)
     except Exception as e:
         logger.error(f"Error fetching citations: {e}")
         cited_memories = []
@@ -74,7 +83,7 @@ async def agent_pipeline(user_id, prompt):
     yield {"type": "citations", "citations": cited_memories}
     
     # Store the conversation
-    store_conversation(user_id, prompt, answer)
+    await astore_conversation(user_id, prompt, answer)
     
     # Signal completion
     yield {"type": "done"}
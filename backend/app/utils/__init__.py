@@ -1,5 +1,5 @@
-from .database import fetch_conversation_history, store_conversation
-from .memory import write_memory, fetch_cited_memories, get_all_memories
+from .database import fetch_conversation_history, store_conversation, afetch_conversation_history, astore_conversation
+from .memory import write_memory, fetch_cited_memories, afetch_cited_memories, get_all_memories, iter_memories
 from .search import bm25_hybrid_search
 from .llm import llm_annotate_with_citations, ground_context
 from .context import format_context
@@ -7,9 +7,13 @@ from .context import format_context
 __all__ = [
     'fetch_conversation_history',
     'store_conversation',
+    'afetch_conversation_history',
+    'astore_conversation',
     'write_memory',
     'fetch_cited_memories',
+    'afetch_cited_memories',
     'get_all_memories',
+    'iter_memories',
     'bm25_hybrid_search',
     'llm_annotate_with_citations',
     'ground_context',
@@ -0,0 +1,83 @@
+import re
+import logging
+import threading
+from ..core.config import settings
+
+logger = logging.getLogger("analyzers")
+
+# Word characters with internal apostrophes ("don't", "user's") kept together
+_TOKEN_PATTERN = re.compile(r"\w+(?:['’]\w+)*")
+
+_nltk_lock = threading.Lock()
+_nltk_tokenize = None
+
+def regex_analyzer(text: str) -> list:
+    """
+    Lowercase and split text into word tokens with a precompiled regex.
+
+    Args:
+        text: The text to tokenize
+
+    Returns:
+        List of tokens
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
+
+def _load_nltk():
+    """Import NLTK and make sure the punkt models are present, on first use only."""
+    global _nltk_tokenize
+    with _nltk_lock:
+        if _nltk_tokenize is None:
+            import nltk
+            for resource, package in (('tokenizers/punkt_tab', 'punkt_tab'), ('tokenizers/punkt', 'punkt')):
+                try:
+                    nltk.data.find(resource)
+                except LookupError:
+                    logger.info(f"Downloading NLTK resource {package}")
+                    nltk.download(package, quiet=True)
+            _nltk_tokenize = nltk.word_tokenize
+    return _nltk_tokenize
+
+def nltk_analyzer(text: str) -> list:
+    """
+    Lowercase and tokenize text with NLTK's word_tokenize.
+
+    Args:
+        text: The text to tokenize
+
+    Returns:
+        List of tokens
+    """
+    tokenize = _nltk_tokenize or _load_nltk()
+    return tokenize(text.lower())
+
+ANALYZERS = {
+    'regex': regex_analyzer,
+    'nltk': nltk_analyzer,
+}
+
+def register_analyzer(name: str, analyzer):
+    """
+    Register a custom analyzer.
+
+    Args:
+        name: Name used to select the analyzer
+        analyzer: Callable taking a string and returning a list of tokens
+    """
+    ANALYZERS[name] = analyzer
+
+def get_analyzer(name: str = None):
+    """
+    Look up an analyzer by name.
+
+    Args:
+        name: Analyzer name (defaults to settings.SEARCH_ANALYZER)
+
+    Returns:
+        Callable taking a string and returning a list of tokens
+    """
+    name = name or settings.SEARCH_ANALYZER
+    try:
+        return ANALYZERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown search analyzer: {name}") from None
@@ -0,0 +1,456 @@
+import math
+import time
+import heapq
+import threading
+from collections import OrderedDict, deque
+
+
+# Relative tolerance for MaxScore pruning decisions
+_PRUNE_SLACK = 1e-9
+
+
+def bm25_idf(n_docs: int, doc_freq: int) -> float:
+    """Return the raw BM25Okapi IDF of a term found in doc_freq of n_docs documents."""
+    return math.log(n_docs - doc_freq + 0.5) - math.log(doc_freq + 0.5)
+
+
+def corpus_stats(corpora: list, terms, epsilon: float = 0.25):
+    """
+    Return BM25Okapi scoring statistics over the union of disjoint corpora.
+
+    The first corpus is the large one: it is only asked for its size, total
+    length, the document frequency of each query term and its histogram of
+    document frequencies, which stands in for a pass over its vocabulary
+    when the epsilon floor is needed. The other corpora are small
+    BM25Indexes (a conversation window, archived memories) whose
+    vocabularies are folded into that histogram. Scoring every corpus with
+    these statistics gives the scores of one BM25Okapi model over all of
+    their documents, at a cost that does not grow with the first corpus.
+
+    Args:
+        corpora: Corpora exposing __len__, total_len, doc_freq(term) and
+            df_histogram(); all but the first must be BM25Indexes
+        terms: Query terms to compute IDFs for
+        epsilon: BM25Okapi floor for negative IDFs, as a fraction of the mean IDF
+
+    Returns:
+        Tuple of ({term: idf}, avgdl); terms found nowhere get an IDF of 0.0
+    """
+    n_docs = sum(len(corpus) for corpus in corpora)
+    if not n_docs:
+        return dict.fromkeys(terms, 0.0), 0.0
+    avgdl = sum(corpus.total_len for corpus in corpora) / n_docs
+    idf = {}
+    for term in terms:
+        freq = sum(corpus.doc_freq(term) for corpus in corpora)
+        idf[term] = bm25_idf(n_docs, freq) if freq else 0.0
+    if any(value < 0 for value in idf.values()):
+        eps = epsilon * _mean_idf(corpora, n_docs)
+        idf = {term: eps if value < 0 else value for term, value in idf.items()}
+    return idf, avgdl
+
+
+def _mean_idf(corpora: list, n_docs: int) -> float:
+    """Mean raw IDF over the union vocabulary, from the first corpus's document-frequency histogram."""
+    histogram = dict(corpora[0].df_histogram())
+    extra = {}
+    for corpus in corpora[1:]:
+        for term, freq in corpus.doc_freqs():
+            extra[term] = extra.get(term, 0) + freq
+    for term, freq in extra.items():
+        base = corpora[0].doc_freq(term)
+        if base:
+            histogram[base] -= 1
+        histogram[base + freq] = histogram.get(base + freq, 0) + 1
+    vocabulary = sum(histogram.values())
+    if not vocabulary:
+        return 0.0
+    return sum(count * bm25_idf(n_docs, freq) for freq, count in histogram.items() if count) / vocabulary
+
+
+class BM25Index:
+    """
+    Incremental Okapi BM25 inverted index.
+
+    Scores match rank_bm25's BM25Okapi for the same corpus (including the
+    epsilon floor applied to negative IDF values), but documents can be added
+    and removed one at a time instead of rebuilding the whole model.
+
+    Documents are identified by arbitrary hashable keys. Each document carries
+    a version so callers can cheaply tell whether stored tokens are stale.
+    The index maintains its corpus statistics (document count, total length
+    and a histogram of document frequencies) as documents come and go, so
+    IDFs are computed for query terms only. Searches can instead be given
+    statistics from corpus_stats(), to score the index as part of a larger
+    corpus. A bounded journal of recently changed keys lets snapshots of the
+    index (see search._SparseSnapshot) catch up without being rebuilt.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25, journal_size: int = 4096):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.postings = {}
+        self.doc_len = {}
+        self.doc_terms = {}
+        self.doc_version = {}
+        self.doc_payload = {}
+        self.doc_seq = {}
+        self.df_hist = {}
+        self.term_max_tf = {}
+        self.term_min_len = {}
+        self.postings_scored = 0
+        self.total_len = 0
+        self.revision = 0
+        self.created = time.monotonic()
+        self.journal = deque(maxlen=journal_size)
+        self._seq = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def __contains__(self, key):
+        return key in self.doc_len
+
+    @property
+    def avgdl(self):
+        return self.total_len / len(self.doc_len) if self.doc_len else 0.0
+
+    def version(self, key):
+        """Return the stored version for a document key, or None if not indexed."""
+        return self.doc_version.get(key)
+
+    def order(self, key):
+        """Return the insertion sequence number of a document (higher is newer)."""
+        return self.doc_seq.get(key)
+
+    def newest(self, n: int, exclude=()) -> list:
+        """Return up to n document keys, most recently added first, skipping those in exclude."""
+        with self._lock:
+            found = []
+            for key in reversed(self.doc_len):
+                if len(found) >= n:
+                    break
+                if key not in exclude:
+                    found.append(key)
+            return found
+
+    def doc_freq(self, term: str) -> int:
+        """Return the number of documents containing a term."""
+        posting = self.postings.get(term)
+        return len(posting) if posting else 0
+
+    def doc_freqs(self):
+        """Yield (term, document frequency) for every indexed term."""
+        for term, posting in self.postings.items():
+            yield term, len(posting)
+
+    def df_histogram(self) -> dict:
+        """Return {document frequency: number of terms with it}."""
+        return self.df_hist
+
+    def _shift_df(self, old: int, new: int):
+        if old:
+            count = self.df_hist[old] - 1
+            if count:
+                self.df_hist[old] = count
+            else:
+                del self.df_hist[old]
+        if new:
+            self.df_hist[new] = self.df_hist.get(new, 0) + 1
+
+    def payload(self, key):
+        """Return the payload stored with a document, or None."""
+        return self.doc_payload.get(key)
+
+    def set_payload(self, key, payload):
+        """Replace the payload of an indexed document without re-indexing it."""
+        with self._lock:
+            if key in self.doc_len:
+                self.doc_payload[key] = payload
+
+    def add(self, key, tokens: list, version=None, payload=None):
+        """
+        Add a document, replacing any existing document with the same key.
+
+        Args:
+            key: Hashable document identifier
+            tokens: Token list for the document
+            version: Opaque version marker stored alongside the document
+            payload: Optional object returned with the document at search time
+        """
+        with self._lock:
+            if key in self.doc_len:
+                self._remove(key)
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, freq in frequencies.items():
+                posting = self.postings.setdefault(token, {})
+                self._shift_df(len(posting), len(posting) + 1)
+                posting[key] = freq
+                # Upper-bound inputs for pruning; only ever loosened until the term disappears
+                if freq > self.term_max_tf.get(token, 0):
+                    self.term_max_tf[token] = freq
+                if len(tokens) < self.term_min_len.get(token, math.inf):
+                    self.term_min_len[token] = len(tokens)
+            self.doc_len[key] = len(tokens)
+            self.doc_terms[key] = tuple(frequencies)
+            self.doc_version[key] = version
+            if payload is not None:
+                self.doc_payload[key] = payload
+            self._seq += 1
+            self.doc_seq[key] = self._seq
+            self.total_len += len(tokens)
+            self.revision += 1
+            self.journal.append((self.revision, key))
+
+    def remove(self, key):
+        """Remove a document if present."""
+        with self._lock:
+            if key in self.doc_len:
+                self._remove(key)
+
+    def _remove(self, key):
+        for token in self.doc_terms.pop(key):
+            posting = self.postings[token]
+            self._shift_df(len(posting), len(posting) - 1)
+            del posting[key]
+            if not posting:
+                del self.postings[token]
+                del self.term_max_tf[token]
+                del self.term_min_len[token]
+        self.total_len -= self.doc_len.pop(key)
+        self.doc_version.pop(key, None)
+        self.doc_payload.pop(key, None)
+        self.doc_seq.pop(key, None)
+        self.revision += 1
+        self.journal.append((self.revision, key))
+
+    def changed_since(self, revision: int):
+        """
+        Return the keys added, replaced or removed after a revision.
+
+        Returns:
+            Set of keys, or None when the journal no longer reaches back that far
+        """
+        with self._lock:
+            changed = set()
+            if revision == self.revision:
+                return changed
+            if not self.journal or self.journal[0][0] > revision + 1:
+                return None
+            for change, key in reversed(self.journal):
+                if change <= revision:
+                    break
+                changed.add(key)
+            return changed
+
+    def keys(self) -> set:
+        """Return the indexed document keys."""
+        with self._lock:
+            return set(self.doc_len)
+
+    def idf(self, term: str) -> float:
+        """Return the BM25Okapi IDF of a term (0.0 for unknown terms)."""
+        with self._lock:
+            return corpus_stats([self], [term], self.epsilon)[0][term]
+
+    def stats(self, terms):
+        """Return ({term: idf}, avgdl) over this index alone."""
+        with self._lock:
+            return corpus_stats([self], terms, self.epsilon)
+
+    def get_scores(self, query_tokens: list, stats=None) -> dict:
+        """
+        Score documents against a tokenized query.
+
+        Args:
+            query_tokens: Tokenized query (repeated tokens count repeatedly)
+            stats: Optional ({term: idf}, avgdl) from corpus_stats(); defaults to this index's own
+
+        Returns:
+            Dict mapping document key to BM25 score for every document that
+            contains at least one query token
+        """
+        with self._lock:
+            scores = {}
+            if not self.doc_len:
+                return scores
+            idfs, avgdl = stats if stats is not None else self.stats(set(query_tokens))
+            if not avgdl:
+                return scores
+            k1, b = self.k1, self.b
+            for token in query_tokens:
+                posting = self.postings.get(token)
+                if not posting:
+                    continue
+                idf = idfs[token]
+                self.postings_scored += len(posting)
+                for key, freq in posting.items():
+                    norm = k1 * (1 - b + b * self.doc_len[key] / avgdl)
+                    scores[key] = scores.get(key, 0.0) + idf * (freq * (k1 + 1) / (freq + norm))
+            return scores
+
+    def score_keys(self, query_tokens: list, keys, stats=None) -> dict:
+        """
+        Score selected documents against a tokenized query.
+
+        Args:
+            query_tokens: Tokenized query (repeated tokens count repeatedly)
+            keys: Document keys to score; keys no longer indexed are skipped
+            stats: Optional ({term: idf}, avgdl) from corpus_stats(); defaults to this index's own
+
+        Returns:
+            Dict mapping each selected document that contains a query token to its BM25 score
+        """
+        with self._lock:
+            idfs, avgdl = stats if stats is not None else self.stats(set(query_tokens))
+            scores = {}
+            if not avgdl:
+                return scores
+            for key in keys:
+                doc_len = self.doc_len.get(key)
+                if doc_len is None:
+                    continue
+                score, matched = 0.0, False
+                for token in query_tokens:
+                    posting = self.postings.get(token)
+                    freq = posting.get(key) if posting else None
+                    if freq:
+                        score += self._term_weight(idfs[token], freq, doc_len, avgdl)
+                        matched = True
+                if matched:
+                    scores[key] = score
+            return scores
+
+    def _term_weight(self, idf, freq, doc_len, avgdl):
+        return idf * (freq * (self.k1 + 1) / (freq + self.k1 * (1 - self.b + self.b * doc_len / avgdl)))
+
+    def top_k(self, query_tokens: list, k: int, stats=None) -> dict:
+        """
+        Exact top-k BM25 retrieval with MaxScore dynamic pruning.
+
+        Query terms are processed term-at-a-time in decreasing order of their
+        score upper bound. Once the k-th best accumulated score exceeds the
+        combined upper bound of the unprocessed terms, no unseen document can
+        reach the top k, so the remaining (usually long, low-IDF) posting
+        lists are only probed for documents already in contention, and
+        accumulators that can no longer make the top k are dropped.
+
+        Args:
+            query_tokens: Tokenized query (repeated tokens count repeatedly)
+            k: Number of results needed
+            stats: Optional ({term: idf}, avgdl) from corpus_stats(); defaults to this index's own
+
+        Returns:
+            Dict mapping document key to its exact BM25 score. It contains
+            every document that can rank in the top k; when fewer than k
+            documents match, it contains every matching document.
+        """
+        with self._lock:
+            if not self.doc_len or k <= 0:
+                return {}
+            counts = {}
+            for token in query_tokens:
+                if token in self.postings:
+                    counts[token] = counts.get(token, 0) + 1
+            idf, avgdl = stats if stats is not None else self.stats(counts)
+            if not avgdl:
+                return {}
+            if any(idf[token] < 0 for token in counts):
+                # Negative contributions break the upper-bound argument
+                return self.get_scores(query_tokens, (idf, avgdl))
+
+            bounds = {
+                token: counts[token] * self._term_weight(idf[token], self.term_max_tf[token], self.term_min_len[token], avgdl)
+                for token in counts
+            }
+            terms = sorted(counts, key=bounds.__getitem__, reverse=True)
+            remaining = sum(bounds.values())
+            accumulators = {}
+            threshold = None
+
+            for token in terms:
+                remaining -= bounds[token]
+                posting = self.postings[token]
+                weight = counts[token] * idf[token]
+                if threshold is None:
+                    # Any document may still reach the top k: score the full posting list
+                    self.postings_scored += len(posting)
+                    for key, freq in posting.items():
+                        accumulators[key] = accumulators.get(key, 0.0) + self._term_weight(weight, freq, self.doc_len[key], avgdl)
+                else:
+                    # Only documents already in contention can still make the top k
+                    self.postings_scored += min(len(accumulators), len(posting))
+                    if len(accumulators) <= len(posting):
+                        for key in accumulators:
+                            freq = posting.get(key)
+                            if freq:
+                                accumulators[key] += self._term_weight(weight, freq, self.doc_len[key], avgdl)
+                    else:
+                        for key, freq in posting.items():
+                            if key in accumulators:
+                                accumulators[key] += self._term_weight(weight, freq, self.doc_len[key], avgdl)
+
+                if len(accumulators) >= k:
+                    # Slack absorbs float error between accumulation orders so exact ties survive
+                    kth = heapq.nlargest(k, accumulators.values())[-1] - _PRUNE_SLACK * (1 + remaining)
+                    if kth > remaining:
+                        threshold = kth
+                        accumulators = {key: score for key, score in accumulators.items() if score + remaining >= threshold}
+
+            # Rescore survivors in query order so scores (and ties) are bit-identical to get_scores
+            scores = dict.fromkeys(accumulators, 0.0)
+            for token in query_tokens:
+                posting = self.postings.get(token)
+                if not posting:
+                    continue
+                self.postings_scored += len(scores)
+                for key in scores:
+                    freq = posting.get(key)
+                    if freq:
+                        scores[key] += self._term_weight(idf[token], freq, self.doc_len[key], avgdl)
+            return scores
+
+
+class UserIndexRegistry:
+    """LRU-bounded registry of per-user BM25 indexes."""
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max_users
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, user_id: str, index):
+        """Install an index for a user, replacing any existing one."""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            self._indexes[user_id] = index
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+
+    def get(self, user_id: str) -> BM25Index:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = BM25Index()
+                self._indexes[user_id] = index
+                while len(self._indexes) > self.max_users:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(user_id)
+            return index
+
+    def peek(self, user_id: str):
+        with self._lock:
+            return self._indexes.get(user_id)
+
+    def drop(self, user_id: str):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
@@ -0,0 +1,187 @@
+import zlib
+import logging
+import argparse
+import numpy as np
+from .analyzers import regex_analyzer
+from .database import record_memory_aliases
+from .maintenance import run_user_batch
+from .search import remove_memories
+from .retrieval_cache import retrieval_cache
+from ..core.config import settings
+
+logger = logging.getLogger("compaction")
+
+_CURSOR = "memory_compaction_cursor"
+_PRIME = (1 << 61) - 1
+
+
+def _shingles(text: str) -> set:
+    """Word bigrams (or the single word) of a memory, normalized."""
+    tokens = regex_analyzer(text)
+    if len(tokens) < 2:
+        return set(tokens)
+    return {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _MinHashLSH:
+    """MinHash signatures bucketed by band to find likely near-duplicate pairs."""
+
+    def __init__(self, bands: int = 16, rows: int = 4, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        n = bands * rows
+        self.bands = bands
+        self.rows = rows
+        # a < 2**31 and 32-bit shingle hashes keep a * x + b inside uint64
+        self._a = rng.integers(1, 1 << 31, size=n, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=n, dtype=np.uint64)
+
+    def signature(self, shingles: set) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # (a * x + b) mod p per hash function, minimized over the shingles
+        values = (np.outer(self._a, hashes) + self._b[:, None]) % _PRIME
+        return values.min(axis=1)
+
+    def candidate_pairs(self, signatures: list) -> set:
+        pairs = set()
+        for band in range(self.bands):
+            buckets = {}
+            start = band * self.rows
+            for i, signature in enumerate(signatures):
+                if signature is None:
+                    continue
+                buckets.setdefault(signature[start:start + self.rows].tobytes(), []).append(i)
+            for members in buckets.values():
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        pairs.add((members[x], members[y]))
+        return pairs
+
+
+def cluster_near_duplicates(memories: list, threshold: float = 0.8) -> list:
+    """
+    Group memories whose word-bigram Jaccard similarity reaches threshold.
+
+    Candidate pairs come from MinHash LSH, so the work is close to linear in
+    the number of memories; every candidate is verified with exact Jaccard.
+
+    Args:
+        memories: Memory dictionaries with 'id' and 'memory'
+        threshold: Minimum Jaccard similarity for two memories to be merged
+
+    Returns:
+        List of clusters (lists of memory dicts) with more than one member
+    """
+    shingles = [_shingles(m['memory']) for m in memories]
+    lsh = _MinHashLSH()
+    signatures = [lsh.signature(s) if s else None for s in shingles]
+
+    parent = list(range(len(memories)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in lsh.candidate_pairs(signatures):
+        if _jaccard(shingles[i], shingles[j]) >= threshold:
+            parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(memories)):
+        groups.setdefault(find(i), []).append(memories[i])
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _canonical(cluster: list) -> dict:
+    """Keep the most recently updated memory; break ties by the longer text."""
+    return max(cluster, key=lambda m: (m.get('updated_at') or m.get('created_at') or '', len(m['memory'])))
+
+
+def compact_user(user_id: str, threshold: float = None, dry_run: bool = False) -> dict:
+    """
+    Merge near-duplicate memories of one user into canonical memories.
+
+    Every merged id is recorded as an alias of its canonical memory, so
+    citations that still carry the old id keep resolving.
+
+    Args:
+        user_id: The user identifier
+        threshold: Jaccard similarity threshold (defaults to settings.COMPACTION_SIMILARITY)
+        dry_run: Report what would be merged without deleting anything
+
+    Returns:
+        Report dict with memories scanned, clusters, records and bytes reclaimed
+    """
+    from .memory import get_memory_client, iter_memories, memory_cache
+
+    threshold = settings.COMPACTION_SIMILARITY if threshold is None else threshold
+    memories = [m for page in iter_memories(user_id) for m in page]
+    clusters = cluster_near_duplicates(memories, threshold)
+
+    report = {'user_id': user_id, 'memories_scanned': len(memories), 'clusters': len(clusters), 'records_reclaimed': 0, 'bytes_reclaimed': 0}
+    aliases = {}
+    client = get_memory_client()
+    for cluster in clusters:
+        canonical = _canonical(cluster)
+        for memory in cluster:
+            if memory['id'] == canonical['id']:
+                continue
+            if not dry_run:
+                try:
+                    client.delete(memory['id'])
+                except Exception as e:
+                    logger.error(f"Could not delete memory {memory['id']} for user {user_id}: {e}")
+                    continue
+            aliases[memory['id']] = canonical['id']
+            report['records_reclaimed'] += 1
+            report['bytes_reclaimed'] += len(memory['memory'].encode('utf-8'))
+
+    if aliases and not dry_run:
+        record_memory_aliases(user_id, aliases)
+        remove_memories(user_id, list(aliases))
+        memory_cache.invalidate(user_id)
+        retrieval_cache.bump(user_id, 'memory')
+    logger.info(f"Compaction for user {user_id}: {report}")
+    return report
+
+
+def run_compaction(max_users: int = None, threshold: float = None, dry_run: bool = False) -> dict:
+    """
+    Compact the next batch of users, resuming where the previous run stopped.
+
+    Users are visited in id order from a cursor persisted in the database
+    (see run_user_batch), so each run does a bounded amount of work.
+
+    Args:
+        max_users: Users to process this run (defaults to settings.COMPACTION_BATCH_USERS)
+        threshold: Jaccard similarity threshold
+        dry_run: Report without deleting anything or moving the cursor
+
+    Returns:
+        Summary report with per-user reports under 'users'
+    """
+    return run_user_batch(
+        _CURSOR,
+        lambda user_id: compact_user(user_id, threshold=threshold, dry_run=dry_run),
+        ('memories_scanned', 'clusters', 'records_reclaimed', 'bytes_reclaimed'),
+        max_users or settings.COMPACTION_BATCH_USERS,
+        dry_run=dry_run,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge near-duplicate memories")
+    parser.add_argument("--max-users", type=int, default=None, help="users to process this run")
+    parser.add_argument("--threshold", type=float, default=None, help="Jaccard similarity threshold")
+    parser.add_argument("--dry-run", action="store_true", help="report without deleting")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    summary = run_compaction(args.max_users, args.threshold, args.dry_run)
+    summary.pop('users')
+    print(summary)
@@ -0,0 +1,162 @@
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("connections")
+
+
+def sqlite_path(url: str) -> str:
+    """
+    Return the database file named by a sqlite:/// URL.
+
+    Args:
+        url: Database URL, e.g. "sqlite:///./conversations.db" (relative),
+            "sqlite:////var/data/conversations.db" (absolute) or "sqlite:///:memory:"
+
+    Returns:
+        File path, or ":memory:" for an in-memory database
+    """
+    if not url.startswith("sqlite://"):
+        raise ValueError(f"Unsupported DATABASE_URL {url!r}: only sqlite:/// URLs are supported")
+    path = url[len("sqlite://"):].split("?", 1)[0]
+    if path.startswith("/"):
+        path = path[1:]
+    return path or ":memory:"
+
+
+# Values bound per statement by parameter_chunks, well under SQLite's bound-parameter limit
+MAX_BOUND_PARAMETERS = 500
+
+
+def parameter_chunks(values, size: int = MAX_BOUND_PARAMETERS):
+    """
+    Split values into lists small enough to bind in one statement, e.g. for an IN (...) clause.
+
+    Args:
+        values: Iterable of values to bind
+        size: Maximum values per chunk
+
+    Yields:
+        Lists of at most size values, in order
+    """
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class ConnectionManager:
+    """
+    Reusable per-thread SQLite connections.
+
+    Every thread keeps one open connection per database file (the least
+    recently used ones are closed past max_databases), so calls no longer
+    pay for opening a connection. Databases run in WAL mode, where readers
+    never block behind the single writer. The schema callback runs once per
+    database file per process, on the first connection to it.
+    """
+
+    def __init__(self, schema=None, busy_timeout: float = 5.0, synchronous: str = "NORMAL",
+                 cache_size_kb: int = 16384, mmap_size: int = 0, max_databases: int = 4):
+        """
+        Args:
+            schema: Optional callable (connection) that creates tables and indexes
+            busy_timeout: Seconds to wait for a lock held by another connection
+            synchronous: SQLite synchronous level ("OFF", "NORMAL" or "FULL")
+            cache_size_kb: Page cache per connection in KiB
+            mmap_size: Bytes of the database file to memory-map (0 disables)
+            max_databases: Open connections kept per thread
+        """
+        self.schema = schema
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.max_databases = max_databases
+        self.opened = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._initialized = set()
+        self._memory_names = {}
+        self._all = []
+
+    def _target(self, path: str):
+        if path != ":memory:":
+            return path, False
+        # One shared in-memory database per manager, visible to every thread
+        with self._lock:
+            name = self._memory_names.setdefault(path, f"file:memdb-{uuid.uuid4().hex}?mode=memory&cache=shared")
+        return name, True
+
+    def _open(self, path: str) -> sqlite3.Connection:
+        target, uri = self._target(path)
+        conn = sqlite3.connect(target, timeout=self.busy_timeout, check_same_thread=False, uri=uri)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if self.mmap_size:
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        with self._lock:
+            self._all.append(conn)
+            self.opened += 1
+        return conn
+
+    def _initialize(self, path: str, conn: sqlite3.Connection):
+        with self._lock:
+            if path in self._initialized:
+                return
+            # WAL is persistent in the database file, so setting it once suffices
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode.lower() != "wal" and path != ":memory:":
+                logger.warning(f"Database {path} runs in {mode} journal mode instead of WAL")
+            if self.schema is not None:
+                self.schema(conn)
+            self._initialized.add(path)
+
+    def connection(self, path: str) -> sqlite3.Connection:
+        """
+        Return this thread's connection to a database, opening it on first use.
+
+        Args:
+            path: Database file path or ":memory:"
+
+        Returns:
+            Open sqlite3 connection owned by the calling thread
+        """
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = OrderedDict()
+        conn = connections.get(path)
+        if conn is None:
+            conn = self._open(path)
+            connections[path] = conn
+            while len(connections) > self.max_databases:
+                self._close(connections.popitem(last=False)[1])
+        else:
+            connections.move_to_end(path)
+        if path not in self._initialized:
+            self._initialize(path, conn)
+        return conn
+
+    def _close(self, conn: sqlite3.Connection):
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not close database connection: {e}")
+
+    def close_all(self):
+        """Close every connection opened by any thread (called at shutdown)."""
+        with self._lock:
+            connections, self._all = self._all, []
+            self._initialized.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not close database connection: {e}")
+        self._local = threading.local()
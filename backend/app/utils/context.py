@@ -4,7 +4,8 @@ def format_context(memories: list, conversation_history: list):
     
     Args:
         memories: List of memory dictionaries
-        conversation_history: List of conversation tuples (role, content, timestamp)
+        conversation_history: List of conversation tuples (role, content, timestamp);
+            "summary" tuples stand for older turns rolled into a summary
         
     Returns:
         Formatted context string
@@ -18,7 +19,8 @@ def format_context(memories: list, conversation_history: list):
     
     past_conversations_str = "\n".join(
         [
-            f"Message Index: {i}\nTimestamp: {timestamp}\n{content}"
+            f"Summary of earlier messages (until {timestamp}):\n{content}" if role == "summary"
+            else f"Message Index: {i}\nTimestamp: {timestamp}\n{content}"
             for i, (role, content, timestamp) in enumerate(conversation_history)
         ]
     )
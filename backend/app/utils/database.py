@@ -1,50 +1,708 @@
+import json
 import time
+import heapq
+import asyncio
 import sqlite3
 import logging
+import atexit
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .connections import ConnectionManager, sqlite_path, parameter_chunks
+from .write_buffer import GroupCommitBuffer
+from .migrations import migrate
+from .shards import ConsistentHashRing, shard_paths
+from .search import reciprocal_rank_fusion
+from .retrieval_cache import retrieval_cache
+from .analyzers import regex_analyzer
+from ..core.config import settings
 
 logger = logging.getLogger("database")
 
-def fetch_conversation_history(user_id: str, limit: int = 10):
+DB_PATH = sqlite_path(settings.DATABASE_URL)
+
+def _create_schema(conn):
+    """Migrate the conversation database to the current schema and set up full-text search."""
+    migrate(conn)
+    try:
+        _ensure_fts(conn)
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Full-text conversation index unavailable: {e}")
+
+# Per-thread connections; the schema is created once per database file
+_connections = ConnectionManager(
+    schema=_create_schema,
+    busy_timeout=settings.DATABASE_BUSY_TIMEOUT,
+    synchronous=settings.DATABASE_SYNCHRONOUS,
+    cache_size_kb=settings.DATABASE_CACHE_SIZE_KB,
+    mmap_size=settings.DATABASE_MMAP_SIZE,
+    max_databases=settings.DATABASE_SHARDS + 3,
+)
+
+def _connect(user_id: str = None) -> sqlite3.Connection:
+    """This thread's connection to a user's conversation shard, or to the main database without a user."""
+    return _connections.connection(DB_PATH if user_id is None else conversation_db_path(user_id))
+
+@functools.lru_cache(maxsize=8)
+def _ring(shards: int) -> ConsistentHashRing:
+    return ConsistentHashRing(shards)
+
+def conversation_shards(shards: int = None) -> list:
+    """Return the database file of every conversation shard; the first is DB_PATH, which also holds the memory tables."""
+    return shard_paths(DB_PATH, shards or settings.DATABASE_SHARDS)
+
+def conversation_db_path(user_id: str, shards: int = None) -> str:
+    """
+    Return the database file holding a user's conversations.
+
+    Users are spread over settings.DATABASE_SHARDS files by consistent
+    hashing, so writers of different users rarely share a database lock.
+
+    Args:
+        user_id: The user identifier
+        shards: Shard count to route with (defaults to settings.DATABASE_SHARDS)
+
+    Returns:
+        Database path
+    """
+    shards = shards or settings.DATABASE_SHARDS
+    return conversation_shards(shards)[_ring(shards).shard_for(user_id)]
+
+def init_database():
+    """Open every conversation database and create its schema (called at app startup)."""
+    paths = conversation_shards()
+    for path in paths:
+        _connections.connection(path)
+    logger.info(f"Conversation database ready at {DB_PATH}" + (f" with {len(paths)} shards" if len(paths) > 1 else ""))
+
+# Bounded pool running database calls for async code, off the event loop
+_executor = None
+_executor_lock = threading.Lock()
+
+def _db_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.DATABASE_EXECUTOR_WORKERS, thread_name_prefix="conversation-db")
+        return _executor
+
+async def _run_db(fn, *args, **kwargs):
+    """Run a blocking database call on the database executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor(), functools.partial(fn, *args, **kwargs))
+
+def close_connections():
+    """Commit buffered writes, stop the database executor and close every pooled connection (called at app shutdown)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    flush_conversation_writes()
+    flush_memory_access()
+    _connections.close_all()
+
+def fetch_conversation_history(user_id: str, limit: int = 10, session_id: str = None, summaries: int = 0):
     """
     Fetch conversation history for a user from the database.
-    
+
+    Reads are a range scan over the (user_id, timestamp) index, so their
+    cost does not grow with the size of the table.
+
     Args:
         user_id: The user identifier
         limit: Maximum number of conversations to fetch
-        
+        session_id: Optional session to restrict the history to
+        summaries: Also return up to this many of the newest summaries of
+            older turns, as ("summary", text, last_timestamp) tuples before the
+            turns (not with session_id, since summaries span sessions)
+
     Returns:
         List of conversation tuples (role, content, timestamp)
     """
-    conn = sqlite3.connect("research_agent_conversations.db")
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS conversation_history (
-            user_id TEXT, role TEXT, content TEXT, timestamp TEXT
+    _await_buffered_writes(user_id)
+    c = _connect(user_id).cursor()
+    if session_id is None:
+        c.execute(
+            "SELECT role, content, timestamp FROM conversation_history WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (user_id, limit),
+        )
+    else:
+        c.execute(
+            "SELECT role, content, timestamp FROM conversation_history WHERE user_id = ? AND session_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (user_id, session_id, limit),
         )
-    """)
-    c.execute("SELECT role, content, timestamp FROM conversation_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit))
     rows = c.fetchall()
-    conn.close()
+    if summaries and session_id is None:
+        c.execute(
+            "SELECT 'summary', summary, last_timestamp FROM conversation_summaries WHERE user_id = ? ORDER BY last_timestamp DESC, id DESC LIMIT ?",
+            (user_id, summaries),
+        )
+        rows += c.fetchall()
     return list(reversed(rows))
 
-def store_conversation(user_id: str, prompt: str, answer: str):
+def _write_exchanges(path: str, exchanges: list):
+    """
+    Insert conversation exchanges in one transaction.
+
+    The prompt and answer rows of an exchange share a turn id (the id of the prompt row).
+    Safe to retry: nothing happens outside the transaction; follow-up work
+    lives in _exchanges_committed.
+
+    Args:
+        path: Database path
+        exchanges: List of (user_id, session_id, prompt, answer, timestamp) tuples
+    """
+    conn = _connections.connection(path)
+    with conn:
+        c = conn.cursor()
+        for user_id, session_id, prompt, answer, now in exchanges:
+            c.execute(
+                "INSERT INTO conversation_history (user_id, session_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (user_id, session_id, "user", prompt, now),
+            )
+            turn_id = c.lastrowid
+            c.execute("UPDATE conversation_history SET turn_id = ? WHERE id = ?", (turn_id, turn_id))
+            if answer:
+                c.execute(
+                    "INSERT INTO conversation_history (user_id, session_id, turn_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                    (user_id, session_id, turn_id, "agent", answer, now),
+                )
+    logger.info(f"Stored {len(exchanges)} conversation exchanges for {len({e[0] for e in exchanges})} users.")
+
+def _exchanges_committed(path: str, exchanges: list):
+    """Invalidate cached results that predate committed exchanges."""
+    for user_id, _, prompt, _, _ in exchanges:
+        # The exchange answers its own prompt, so cached results for that prompt stay valid
+        retrieval_cache.bump(user_id, 'conversation', keep_prompts=[prompt])
+
+_write_buffer = None
+_write_buffer_lock = threading.Lock()
+
+def conversation_write_buffer() -> GroupCommitBuffer:
+    """Return the process-wide group-commit buffer for conversation writes, creating it on first use."""
+    global _write_buffer
+    with _write_buffer_lock:
+        if _write_buffer is None:
+            _write_buffer = GroupCommitBuffer(
+                _write_exchanges,
+                max_rows=settings.CONVERSATION_FLUSH_ROWS,
+                max_delay=settings.CONVERSATION_FLUSH_INTERVAL_MS / 1000,
+                on_committed=_exchanges_committed,
+            )
+        return _write_buffer
+
+def flush_conversation_writes(timeout: float = 30.0):
+    """Commit buffered conversation writes and stop the buffer, if it was started."""
+    global _write_buffer
+    with _write_buffer_lock:
+        write_buffer, _write_buffer = _write_buffer, None
+    if write_buffer is not None:
+        write_buffer.shutdown(timeout)
+
+atexit.register(flush_conversation_writes)
+
+def _await_buffered_writes(user_id: str = None):
+    """Read-your-writes: wait until the user's (or, without a user, every) buffered exchange is committed."""
+    write_buffer = _write_buffer
+    if write_buffer is None:
+        return
+    if user_id is None:
+        write_buffer.flush()
+    else:
+        write_buffer.wait_for(conversation_db_path(user_id), user_id)
+
+def store_conversation(user_id: str, prompt: str, answer: str, session_id: str = None, durable: bool = None):
     """
     Store a conversation exchange in the database.
-    
+
+    With settings.CONVERSATION_WRITE_MODE set to "buffered" the exchange is
+    group-committed with concurrent writes a few milliseconds later; reads
+    of the user's history wait for it, and durable callers wait for the commit.
+
     Args:
         user_id: The user identifier
         prompt: The user's prompt/message
         answer: The agent's response
+        session_id: Optional session the exchange belongs to
+        durable: Return only once the exchange is committed (defaults to settings.CONVERSATION_DURABLE_WRITES)
     """
+    durable = settings.CONVERSATION_DURABLE_WRITES if durable is None else durable
+    exchange = (user_id, session_id, prompt, answer, time.time())
     try:
-        conn = sqlite3.connect("research_agent_conversations.db")
-        c = conn.cursor()
-        now = time.time()
-        c.execute("INSERT INTO conversation_history (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)", (user_id, "user", prompt, now))
-        if answer:
-            c.execute("INSERT INTO conversation_history (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)", (user_id, "agent", answer, now))
-        conn.commit()
-        conn.close()
-        logger.info(f"Stored conversation for user {user_id}.")
+        path = conversation_db_path(user_id)
+        if settings.CONVERSATION_WRITE_MODE == "buffered":
+            future = conversation_write_buffer().submit(path, exchange, user_id=user_id)
+            if durable:
+                future.result()
+        else:
+            _write_exchanges(path, [exchange])
+            _exchanges_committed(path, [exchange])
     except Exception as e:
-        logger.error(f"Could not store conversation: {e}") 
\ No newline at end of file
+        logger.error(f"Could not store conversation: {e}")
+
+async def afetch_conversation_history(user_id: str, limit: int = 10, session_id: str = None, summaries: int = 0):
+    """
+    Fetch conversation history without blocking the event loop.
+
+    Takes the same arguments and returns the same results as fetch_conversation_history.
+    """
+    return await _run_db(fetch_conversation_history, user_id, limit=limit, session_id=session_id, summaries=summaries)
+
+async def astore_conversation(user_id: str, prompt: str, answer: str, session_id: str = None):
+    """
+    Store a conversation exchange without blocking the event loop.
+
+    Takes the same arguments as store_conversation.
+    """
+    return await _run_db(store_conversation, user_id, prompt, answer, session_id=session_id)
+
+# (table, indexed column) pairs with an FTS5 index named {table}_fts
+_FTS_TABLES = (("conversation_history", "content"), ("conversation_summaries", "summary"))
+
+def _ensure_fts(conn):
+    """
+    Create the FTS5 indexes over conversation_history and conversation_summaries and their sync triggers.
+
+    Each index is an external-content table, so it stores only the inverted
+    index and reads row content from its table. Rows written before the
+    index existed are picked up by a one-time rebuild.
+    """
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        for table, column in _FTS_TABLES:
+            fts = f"{table}_fts"
+            c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+            if c.fetchone() is not None:
+                continue
+            c.execute(f"""
+                CREATE VIRTUAL TABLE {fts} USING fts5(
+                    {column}, user_id, content='{table}', content_rowid='id'
+                )
+            """)
+            c.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts}(rowid, {column}, user_id) VALUES (new.id, new.{column}, new.user_id);
+                END
+            """)
+            c.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {column}, user_id) VALUES ('delete', old.id, old.{column}, old.user_id);
+                END
+            """)
+            c.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column}, user_id ON {table} BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {column}, user_id) VALUES ('delete', old.id, old.{column}, old.user_id);
+                    INSERT INTO {fts}(rowid, {column}, user_id) VALUES (new.id, new.{column}, new.user_id);
+                END
+            """)
+            c.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def _fts_query(text: str):
+    """Build an FTS5 MATCH expression OR-ing the quoted terms of a prompt."""
+    terms = dict.fromkeys(regex_analyzer(text))
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def search_conversation_history(user_id: str, query: str, limit: int = 10):
+    """
+    Full-text search over a user's entire conversation history.
+
+    Ranking uses SQLite FTS5's bm25(), so only the best matching turns are
+    read from the database. Summaries of turns rolled up by summarization
+    are searched too and returned as ("summary", text, last_timestamp)
+    tuples, so old topics stay findable after their turns are deleted.
+    The two tables have separate bm25() statistics, so their rankings are
+    merged by reciprocal rank fusion rather than by raw score; a turn
+    wins ties with the summary of the same rank.
+    Falls back to the most recent turns when the query has no searchable
+    terms or FTS5 is unavailable.
+
+    Args:
+        user_id: The user identifier
+        query: The search query
+        limit: Maximum number of turns to return
+
+    Returns:
+        List of conversation tuples (role, content, timestamp), best match first
+    """
+    match = _fts_query(query)
+    if not match:
+        return fetch_conversation_history(user_id, limit=limit)
+    user_filter = ""
+    if regex_analyzer(user_id):
+        # Narrow the match to the user's rows inside the index; the join re-checks exactly
+        user_filter = ' AND user_id : "' + user_id.replace('"', '""') + '"'
+    _await_buffered_writes(user_id)
+    try:
+        c = _connect(user_id).cursor()
+        c.execute("""
+            SELECT h.role, h.content, h.timestamp
+            FROM conversation_history_fts f
+            JOIN conversation_history h ON h.id = f.rowid
+            WHERE conversation_history_fts MATCH ? AND h.user_id = ?
+            ORDER BY bm25(conversation_history_fts, 1.0, 0.0)
+            LIMIT ?
+        """, (f"content : ({match})" + user_filter, user_id, limit))
+        turns = c.fetchall()
+        c.execute("""
+            SELECT 'summary', s.summary, s.last_timestamp
+            FROM conversation_summaries_fts f
+            JOIN conversation_summaries s ON s.id = f.rowid
+            WHERE conversation_summaries_fts MATCH ? AND s.user_id = ?
+            ORDER BY bm25(conversation_summaries_fts, 1.0, 0.0)
+            LIMIT ?
+        """, (f"summary : ({match})" + user_filter, user_id, limit))
+        summaries = c.fetchall()
+        rankings = [[('turn', i) for i in range(len(turns))], [('summary', i) for i in range(len(summaries))]]
+        fused = reciprocal_rank_fusion(rankings, k=settings.RRF_K)[:limit]
+        return [(turns if kind == 'turn' else summaries)[i] for (kind, i), _ in fused]
+    except sqlite3.OperationalError as e:
+        logger.error(f"Full-text conversation search failed, using recent history: {e}")
+        return fetch_conversation_history(user_id, limit=limit)
+
+async def asearch_conversation_history(user_id: str, query: str, limit: int = 10):
+    """
+    Full-text conversation search without blocking the event loop.
+
+    Takes the same arguments and returns the same results as search_conversation_history.
+    """
+    return await _run_db(search_conversation_history, user_id, query, limit=limit)
+
+def record_memory_aliases(user_id: str, aliases: dict):
+    """
+    Record that merged memory ids now resolve to a canonical memory.
+
+    Existing aliases that pointed at a merged id are repointed, so every
+    alias resolves in one lookup.
+
+    Args:
+        user_id: The user identifier
+        aliases: Dict mapping merged memory id to canonical memory id
+    """
+    if not aliases:
+        return
+    conn = _connect()
+    now = time.time()
+    with conn:
+        c = conn.cursor()
+        for alias_id, canonical_id in aliases.items():
+            c.execute("UPDATE memory_aliases SET canonical_id = ? WHERE canonical_id = ?", (canonical_id, alias_id))
+            c.execute(
+                "INSERT OR REPLACE INTO memory_aliases (alias_id, canonical_id, user_id, created_at) VALUES (?, ?, ?, ?)",
+                (alias_id, canonical_id, user_id, now),
+            )
+
+def resolve_memory_aliases(memory_ids: list) -> dict:
+    """
+    Look up canonical ids for merged memories.
+
+    Args:
+        memory_ids: Memory identifiers to resolve
+
+    Returns:
+        Dict mapping each aliased id to its canonical id (ids without an alias are omitted)
+    """
+    aliases = {}
+    c = _connect().cursor()
+    for chunk in parameter_chunks(memory_ids):
+        c.execute(
+            f"SELECT alias_id, canonical_id FROM memory_aliases WHERE alias_id IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        aliases.update(c.fetchall())
+    return aliases
+
+def load_maintenance_state(name: str):
+    """Return a stored maintenance value (e.g. a job cursor), or None."""
+    c = _connect().cursor()
+    c.execute("SELECT value FROM maintenance_state WHERE name = ?", (name,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def save_maintenance_state(name: str, value: str):
+    """Store a maintenance value (e.g. a job cursor)."""
+    conn = _connect()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO maintenance_state (name, value) VALUES (?, ?)", (name, value))
+
+def list_conversation_users(after: str = None, limit: int = 100, shards: int = None):
+    """
+    List user ids with stored conversations, in id order, across every shard.
+
+    Args:
+        after: Only return ids greater than this one (for resumable scans)
+        limit: Maximum number of ids to return
+        shards: Shard count to read (defaults to settings.DATABASE_SHARDS)
+
+    Returns:
+        List of user ids
+    """
+    _await_buffered_writes()
+    per_shard = []
+    for path in conversation_shards(shards):
+        c = _connections.connection(path).cursor()
+        c.execute(
+            "SELECT DISTINCT user_id FROM conversation_history WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (after or "", limit),
+        )
+        per_shard.append([row[0] for row in c.fetchall()])
+    # A user can sit on two shards mid-reshard, so drop repeats of the merge
+    user_ids = []
+    for user_id in heapq.merge(*per_shard):
+        if not user_ids or user_ids[-1] != user_id:
+            user_ids.append(user_id)
+    return user_ids[:limit]
+
+def load_conversation_turns(user_id: str) -> list:
+    """
+    Read all of a user's conversation rows, oldest first, for summarization.
+
+    Returns:
+        List of (id, turn_id, role, content, timestamp) tuples
+    """
+    _await_buffered_writes(user_id)
+    c = _connect(user_id).cursor()
+    c.execute(
+        "SELECT id, COALESCE(turn_id, id), role, content, timestamp FROM conversation_history WHERE user_id = ? ORDER BY timestamp, id",
+        (user_id,),
+    )
+    return c.fetchall()
+
+def load_conversation_summaries(user_id: str) -> list:
+    """
+    Read a user's conversation summaries, oldest first.
+
+    Returns:
+        List of dicts with 'id', 'summary', 'first_timestamp', 'last_timestamp' and 'turns'
+    """
+    c = _connect(user_id).cursor()
+    c.execute(
+        "SELECT id, summary, first_timestamp, last_timestamp, turns FROM conversation_summaries WHERE user_id = ? ORDER BY last_timestamp, id",
+        (user_id,),
+    )
+    return [
+        {'id': row[0], 'summary': row[1], 'first_timestamp': row[2], 'last_timestamp': row[3], 'turns': row[4]}
+        for row in c.fetchall()
+    ]
+
+def save_conversation_summaries(user_id: str, summaries: list, row_ids: list = (), summary_ids: list = ()):
+    """
+    Store summaries and delete what they replace, in one transaction.
+
+    Args:
+        user_id: The user identifier
+        summaries: Dicts with 'summary', 'first_timestamp', 'last_timestamp' and 'turns'
+        row_ids: conversation_history rows rolled into the summaries
+        summary_ids: Older summaries merged into the new ones
+    """
+    conn = _connect(user_id)
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT INTO conversation_summaries (user_id, summary, first_timestamp, last_timestamp, turns, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(user_id, s['summary'], s['first_timestamp'], s['last_timestamp'], s['turns'], now) for s in summaries],
+        )
+        for table, ids in (("conversation_history", row_ids), ("conversation_summaries", summary_ids)):
+            for chunk in parameter_chunks(ids):
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ? AND id IN ({','.join('?' * len(chunk))})", [user_id] + chunk)
+    retrieval_cache.bump(user_id, 'conversation')
+
+def conversation_shard_stats(shards: int = None) -> list:
+    """
+    Report the size of every conversation shard.
+
+    Args:
+        shards: Shard count to read (defaults to settings.DATABASE_SHARDS)
+
+    Returns:
+        List of dicts with 'shard', 'path', 'users', 'rows' and 'summaries', in shard order
+    """
+    _await_buffered_writes()
+    stats = []
+    for shard, path in enumerate(conversation_shards(shards)):
+        c = _connections.connection(path).cursor()
+        c.execute("SELECT COUNT(DISTINCT user_id), COUNT(*) FROM conversation_history")
+        users, rows = c.fetchone()
+        c.execute("SELECT COUNT(*) FROM conversation_summaries")
+        summaries, = c.fetchone()
+        stats.append({'shard': shard, 'path': path, 'users': users, 'rows': rows, 'summaries': summaries})
+    return stats
+
+def _write_memory_access(path: str, accesses: list):
+    """
+    Upsert memory access counters in one transaction.
+
+    Args:
+        path: Database path
+        accesses: List of (user_id, memory_id, cited, timestamp) tuples
+    """
+    conn = _connections.connection(path)
+    with conn:
+        for counter, cited in (("retrievals", False), ("citations", True)):
+            conn.executemany(
+                f"""
+                INSERT INTO memory_access (memory_id, user_id, last_access, {counter}) VALUES (?, ?, ?, 1)
+                ON CONFLICT(memory_id) DO UPDATE SET
+                    last_access = MAX(last_access, excluded.last_access), user_id = excluded.user_id, {counter} = {counter} + 1
+                """,
+                [(memory_id, user_id, now) for user_id, memory_id, is_cited, now in accesses if is_cited == cited],
+            )
+
+_access_buffer = None
+_access_buffer_lock = threading.Lock()
+
+def memory_access_buffer() -> GroupCommitBuffer:
+    """Return the process-wide group-commit buffer for memory access statistics, creating it on first use."""
+    global _access_buffer
+    with _access_buffer_lock:
+        if _access_buffer is None:
+            _access_buffer = GroupCommitBuffer(
+                _write_memory_access,
+                max_rows=settings.CONVERSATION_FLUSH_ROWS,
+                max_delay=settings.CONVERSATION_FLUSH_INTERVAL_MS / 1000,
+            )
+        return _access_buffer
+
+def flush_memory_access(timeout: float = 30.0):
+    """Commit buffered memory access statistics and stop the buffer, if it was started."""
+    global _access_buffer
+    with _access_buffer_lock:
+        access_buffer, _access_buffer = _access_buffer, None
+    if access_buffer is not None:
+        access_buffer.shutdown(timeout)
+
+atexit.register(flush_memory_access)
+
+def record_memory_access(memory_ids: list, cited: bool = False, user_id: str = None):
+    """
+    Record that memories were retrieved by a search or cited in an answer.
+
+    Access statistics are best-effort, so the update is queued on a
+    group-commit buffer and written to the user's shard in the background;
+    the caller (often the event loop) never waits for SQLite.
+
+    Args:
+        memory_ids: Memory identifiers that were accessed
+        cited: True for citations, False for search retrievals
+        user_id: Owner of the memories (without one, the main database is used)
+    """
+    memory_ids = list(dict.fromkeys(memory_ids))
+    if not memory_ids:
+        return
+    path = DB_PATH if user_id is None else conversation_db_path(user_id)
+    now = time.time()
+    access_buffer = memory_access_buffer()
+    for memory_id in memory_ids:
+        access_buffer.submit(path, (user_id, memory_id, cited, now), user_id=user_id)
+
+def load_memory_access(memory_ids: list, user_id: str = None) -> dict:
+    """
+    Look up access statistics for memories.
+
+    Args:
+        memory_ids: Memory identifiers to look up
+        user_id: Owner of the memories, whose shard holds their statistics
+
+    Returns:
+        Dict mapping each id with recorded accesses to a dict with
+        'last_access' (epoch seconds), 'retrievals' and 'citations'
+    """
+    access_buffer = _access_buffer
+    if access_buffer is not None:
+        access_buffer.wait_for(DB_PATH if user_id is None else conversation_db_path(user_id), user_id)
+    stats = {}
+    c = _connect(user_id).cursor()
+    for chunk in parameter_chunks(memory_ids):
+        c.execute(
+            f"SELECT memory_id, last_access, retrievals, citations FROM memory_access WHERE memory_id IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for memory_id, last_access, retrievals, citations in c.fetchall():
+            stats[memory_id] = {'last_access': last_access, 'retrievals': retrievals, 'citations': citations}
+    return stats
+
+def archive_memories(user_id: str, memories: list):
+    """
+    Copy memories into the cold store.
+
+    Args:
+        user_id: The user identifier
+        memories: Memory dictionaries with 'id' and 'memory'
+    """
+    if not memories:
+        return
+    conn = _connect()
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO cold_memories (memory_id, user_id, memory, payload, archived_at) VALUES (?, ?, ?, ?, ?)",
+            [(m['id'], user_id, m['memory'], json.dumps(m, default=str), now) for m in memories],
+        )
+
+def load_cold_memories(user_id: str = None, memory_ids: list = None) -> list:
+    """
+    Read memories from the cold store.
+
+    Args:
+        user_id: Return every cold memory of this user
+        memory_ids: Return the cold memories with these ids instead
+
+    Returns:
+        List of memory dictionaries, marked with 'tier': 'cold'
+    """
+    c = _connect().cursor()
+    if memory_ids is None:
+        c.execute("SELECT payload FROM cold_memories WHERE user_id = ? ORDER BY archived_at DESC", (user_id,))
+        rows = c.fetchall()
+    else:
+        rows = []
+        for chunk in parameter_chunks(memory_ids):
+            c.execute(f"SELECT payload FROM cold_memories WHERE memory_id IN ({','.join('?' * len(chunk))})", chunk)
+            rows.extend(c.fetchall())
+    return [dict(json.loads(payload), tier='cold') for payload, in rows]
+
+def find_memory_write(user_id: str, content_hash: str, since: float):
+    """
+    Look up a prompt hash written for a user after a point in time.
+
+    Args:
+        user_id: The user identifier
+        content_hash: Hash of the normalized prompt
+        since: Earliest write time to accept, in epoch seconds
+
+    Returns:
+        List of memory ids the write produced, or None if there is no such write
+    """
+    c = _connect(user_id).cursor()
+    c.execute(
+        "SELECT memory_ids FROM memory_write_hashes WHERE user_id = ? AND content_hash = ? AND written_at >= ?",
+        (user_id, content_hash, since),
+    )
+    row = c.fetchone()
+    return json.loads(row[0]) if row else None
+
+def record_memory_writes(user_id: str, content_hashes: list, memory_ids: list, expire_before: float = None):
+    """
+    Record written prompt hashes and the memory ids they produced.
+
+    Args:
+        user_id: The user identifier
+        content_hashes: Hashes of the normalized prompts written together
+        memory_ids: Memory ids produced by the write
+        expire_before: Also drop the user's hashes written before this time
+    """
+    conn = _connect(user_id)
+    now = time.time()
+    ids = json.dumps(list(memory_ids))
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO memory_write_hashes (user_id, content_hash, memory_ids, written_at) VALUES (?, ?, ?, ?)",
+            [(user_id, content_hash, ids, now) for content_hash in content_hashes],
+        )
+        if expire_before is not None:
+            conn.execute("DELETE FROM memory_write_hashes WHERE user_id = ? AND written_at < ?", (user_id, expire_before))
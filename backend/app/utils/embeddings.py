@@ -0,0 +1,177 @@
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from .connections import parameter_chunks
+
+logger = logging.getLogger("embeddings")
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by a hash of model id and text.
+
+    Vectors are stored as float32 blobs in SQLite, so identical texts are
+    embedded once per model no matter how often they are added or searched.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(model_id: str, text: str) -> str:
+        return hashlib.sha256(f"{model_id}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        """Return {key: vector} for the keys present in the cache."""
+        found = {}
+        conn = self._connect()
+        for chunk in parameter_chunks(keys):
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items: dict):
+        """Store {key: vector} pairs."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+            )
+
+
+class OnnxEmbedder(Embeddings):
+    """
+    Local sentence embedder running an ONNX transformer on CPU.
+
+    Implements LangChain's Embeddings interface (embed_documents /
+    embed_query), so mem0 takes it through its "langchain" embedder
+    provider, next to embed / embed_batch. Texts are tokenized with a
+    Hugging Face tokenizers file, run through onnxruntime in batches,
+    mean-pooled over the attention mask and L2-normalized. Models exported
+    with a pooled 2-D output are used as is. The model is loaded on first use.
+    """
+
+    def __init__(self, model_path: str, tokenizer_path: str, cache: EmbeddingCache = None,
+                 batch_size: int = 32, max_length: int = 256, normalize: bool = True):
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.normalize = normalize
+        self.model_id = os.path.basename(model_path)
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._session is None:
+                import onnxruntime
+                from tokenizers import Tokenizer
+
+                logger.info(f"Loading ONNX embedding model {self.model_path}")
+                tokenizer = Tokenizer.from_file(self.tokenizer_path)
+                tokenizer.enable_truncation(max_length=self.max_length)
+                tokenizer.enable_padding()
+                self._tokenizer = tokenizer
+                self._session = onnxruntime.InferenceSession(self.model_path, providers=['CPUExecutionProvider'])
+
+    @property
+    def dimensions(self) -> int:
+        """Size of the vectors this model produces (loads the model)."""
+        if self._session is None:
+            self._load()
+        size = self._session.get_outputs()[0].shape[-1]
+        if not isinstance(size, int):
+            size = len(self._run(["dimension probe"])[0])
+        return size
+
+    def _run(self, texts: list) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {}
+        for model_input in self._session.get_inputs():
+            if model_input.name == 'input_ids':
+                feeds['input_ids'] = input_ids
+            elif model_input.name == 'attention_mask':
+                feeds['attention_mask'] = attention_mask
+            elif model_input.name == 'token_type_ids':
+                feeds['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        output = np.asarray(self._session.run(None, feeds)[0], dtype=np.float32)
+        if output.ndim == 3:
+            mask = attention_mask[..., None].astype(np.float32)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            output = output / np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-12, None)
+        return output
+
+    def embed_batch(self, texts: list, memory_action: str = "add") -> list:
+        """
+        Embed texts, reusing cached vectors and batching the rest.
+
+        Args:
+            texts: Texts to embed
+            memory_action: Ignored; the same embedding serves add, search and update
+
+        Returns:
+            List of embedding vectors (lists of floats), one per text
+        """
+        texts = [text.replace("\n", " ") for text in texts]
+        keys = [EmbeddingCache.key(self.model_id, text) for text in texts]
+        vectors = self.cache.get_many(keys) if self.cache is not None else {}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            if self._session is None:
+                self._load()
+            computed = {}
+            items = list(missing.items())
+            for start in range(0, len(items), self.batch_size):
+                batch = items[start:start + self.batch_size]
+                for (key, _), vector in zip(batch, self._run([text for _, text in batch])):
+                    computed[key] = vector
+            if self.cache is not None:
+                self.cache.put_many(computed)
+            vectors.update(computed)
+        return [vectors[key].tolist() for key in keys]
+
+    def embed(self, text: str, memory_action: str = None) -> list:
+        """Embed one text (mem0 embedder interface)."""
+        return self.embed_batch([text], memory_action)[0]
+
+    def embed_documents(self, texts: list) -> list:
+        """Embed texts (LangChain Embeddings interface)."""
+        return self.embed_batch(list(texts))
+
+    def embed_query(self, text: str) -> list:
+        """Embed one text (LangChain Embeddings interface)."""
+        return self.embed(text)
@@ -0,0 +1,175 @@
+import time
+import uuid
+import queue
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger("ingest")
+
+
+class MemoryIngestQueue:
+    """
+    Write-behind queue for memory extraction.
+
+    Prompts are queued and written by a background thread, so callers do not
+    wait for mem0's LLM extraction, embedding and upsert. The worker drains
+    up to batch_size queued prompts at a time and sends each user's prompts
+    to write_fn in one call. Failed writes are retried with exponential
+    backoff, then dropped with an error log.
+
+    Until a prompt has been written it is exposed through pending(), so
+    lexical retrieval can match it right away (read-your-writes).
+    """
+
+    def __init__(self, write_fn, max_size: int = 1000, batch_size: int = 16, max_retries: int = 3, retry_backoff: float = 0.5, on_settled=None):
+        """
+        Args:
+            write_fn: Callable (prompts, user_id) that writes prompts for one user and raises on failure
+            on_settled: Optional callable (user_id, pending_ids, prompts) run once a batch is written or dropped
+            max_size: Maximum number of queued prompts
+            batch_size: Maximum number of prompts drained per batch
+            max_retries: Retries per user batch after the first failed attempt
+            retry_backoff: Delay before the first retry in seconds, doubled after each retry
+        """
+        self.write_fn = write_fn
+        self.on_settled = on_settled
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_size)
+        self._pending = {}
+        self._outstanding = 0
+        self._idle = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="memory-ingest", daemon=True)
+                self._thread.start()
+
+    def submit(self, prompt: str, user_id: str) -> bool:
+        """
+        Queue a prompt for memory extraction.
+
+        Args:
+            prompt: The content to store as memory
+            user_id: The user identifier
+
+        Returns:
+            True if queued, False if the queue is full
+        """
+        pending_id = f"pending:{uuid.uuid4().hex}"
+        with self._idle:
+            try:
+                self._queue.put_nowait((user_id, prompt, pending_id))
+            except queue.Full:
+                return False
+            self._outstanding += 1
+            self._pending.setdefault(user_id, {})[pending_id] = {
+                'id': pending_id,
+                'memory': prompt,
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'user_id': user_id,
+                'pending': True,
+            }
+        self._ensure_worker()
+        return True
+
+    def pending(self, user_id: str) -> list:
+        """Return placeholder memories for a user's prompts that are not written yet."""
+        with self._idle:
+            return list(self._pending.get(user_id, {}).values())
+
+    def depth(self) -> int:
+        """Return the number of prompts queued or being written."""
+        with self._idle:
+            return self._outstanding
+
+    def _next_batch(self) -> list:
+        item = self._queue.get(timeout=0.5)
+        batch = [item]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._next_batch()
+            except queue.Empty:
+                if self._stopping:
+                    return
+                continue
+
+            by_user = {}
+            for user_id, prompt, pending_id in batch:
+                by_user.setdefault(user_id, []).append((prompt, pending_id))
+            for user_id, items in by_user.items():
+                self._write_with_retry(user_id, items)
+
+            with self._idle:
+                self._outstanding -= len(batch)
+                self._idle.notify_all()
+
+    def _write_with_retry(self, user_id: str, items: list):
+        prompts = [prompt for prompt, _ in items]
+        delay = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.write_fn(prompts, user_id)
+                self.written += len(prompts)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(prompts)
+                    logger.error(f"Dropping {len(prompts)} memory writes for user {user_id} after {attempt + 1} attempts: {e}")
+                    break
+                logger.warning(f"Memory write for user {user_id} failed (attempt {attempt + 1}), retrying: {e}")
+                time.sleep(delay)
+                delay *= 2
+        with self._idle:
+            user_pending = self._pending.get(user_id, {})
+            for _, pending_id in items:
+                user_pending.pop(pending_id, None)
+            if not user_pending:
+                self._pending.pop(user_id, None)
+        if self.on_settled is not None:
+            try:
+                self.on_settled(user_id, [pending_id for _, pending_id in items], prompts)
+            except Exception as e:
+                logger.error(f"Settle callback failed for user {user_id}: {e}")
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every queued prompt has been processed.
+
+        Returns:
+            True if the queue drained within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._outstanding:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining if remaining is not None else 0.5)
+        return True
+
+    def shutdown(self, timeout: float = 30.0):
+        """Drain the queue (up to timeout) and stop the worker thread."""
+        if not self.flush(timeout):
+            logger.warning(f"Memory ingest queue shut down with {self.depth()} writes outstanding")
+        self._stopping = True
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=1.0)
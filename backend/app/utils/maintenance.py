@@ -0,0 +1,44 @@
+import logging
+from .database import load_maintenance_state, save_maintenance_state, list_conversation_users
+
+logger = logging.getLogger("maintenance")
+
+
+def run_user_batch(cursor: str, process_user, fields: tuple, max_users: int, dry_run: bool = False) -> dict:
+    """
+    Run a per-user maintenance job over the next batch of users, resuming where the previous run stopped.
+
+    Users are visited in id order from a cursor persisted in the database,
+    so each run does a bounded amount of work; after the last user the
+    cursor wraps around to the start. A user whose job fails is logged and
+    skipped, so one bad user cannot stall the scan.
+
+    Args:
+        cursor: Name of the maintenance_state row holding the cursor
+        process_user: Callable (user_id) returning a report dict with every field in fields
+        fields: Report fields summed into the summary
+        max_users: Users to process this run
+        dry_run: Leave the cursor where it is
+
+    Returns:
+        Summary with 'users_scanned', the summed fields and per-user reports under 'users'
+    """
+    user_ids = list_conversation_users(after=load_maintenance_state(cursor), limit=max_users)
+
+    summary = dict.fromkeys(('users_scanned',) + tuple(fields), 0)
+    summary['users'] = []
+    for user_id in user_ids:
+        try:
+            report = process_user(user_id)
+        except Exception as e:
+            logger.error(f"{cursor}: could not process user {user_id}: {e}")
+            continue
+        summary['users'].append(report)
+        summary['users_scanned'] += 1
+        for field in fields:
+            summary[field] += report[field]
+
+    if not dry_run:
+        # A short batch means the scan reached the end: start over next run
+        save_maintenance_state(cursor, user_ids[-1] if len(user_ids) == max_users else "")
+    return summary
@@ -1,106 +1,598 @@
+import heapq
+import asyncio
+import atexit
 import logging
-from mem0 import Memory
+import threading
+from collections import deque
 from dotenv import load_dotenv
+from .ingest import MemoryIngestQueue
+from .memory_cache import MemorySnapshotCache
+from .write_dedupe import WriteDedupeIndex
+from .search import index_memories, remove_memories
+from .database import resolve_memory_aliases, load_cold_memories, record_memory_access
+from .retrieval_cache import retrieval_cache
+from ..core.config import settings
 
 load_dotenv()
 
 logger = logging.getLogger("memory")
 
-config = {
-    "vector_store": {
-        "provider": "chroma",
-        "config": {
-            "collection_name": "mem0",
-            "path": "db",
-        }
-    },
-    "llm": {
-        "provider": "openai",
-        "config": {
-            "model": "gpt-4o",
-            "temperature": 0.2,
-            "max_tokens": 2000,
+# Process-wide mem0 client, created on first use (tests may assign a stub)
+mem0_client = None
+_client_lock = threading.Lock()
+
+class EmbeddingDimensionError(RuntimeError):
+    """The configured embedder does not match the vectors already in the memory collection."""
+
+
+def memory_config() -> dict:
+    """
+    Build the mem0 configuration from settings.
+
+    With settings.EMBEDDING_PROVIDER set to "onnx" the local embedder is
+    passed through mem0's "langchain" embedder provider, with its vector
+    size; otherwise mem0's default OpenAI embedder is used.
+
+    Returns:
+        Config dictionary for mem0's Memory.from_config
+    """
+    config = {
+        "vector_store": {
+            "provider": "chroma",
+            "config": {
+                "collection_name": settings.MEMORY_COLLECTION,
+                "path": settings.MEMORY_DB_PATH,
+            }
+        },
+        "llm": {
+            "provider": "openai",
+            "config": {
+                "model": settings.MEMORY_LLM_MODEL,
+                "temperature": settings.MEMORY_LLM_TEMPERATURE,
+                "max_tokens": settings.MEMORY_LLM_MAX_TOKENS,
+            }
         }
     }
-}
+    if settings.EMBEDDING_PROVIDER == "onnx":
+        embedder = local_embedder()
+        config["embedder"] = {
+            "provider": "langchain",
+            "config": {"model": embedder, "embedding_dims": embedder.dimensions},
+        }
+    return config
+
+def check_embedding_dimensions(client):
+    """
+    Refuse a client whose embedder does not match the stored vectors.
+
+    Switching EMBEDDING_PROVIDER (or model) on an existing collection would
+    mix vectors of different sizes, which Chroma rejects on insert and
+    makes nearest-neighbour search meaningless. Point MEMORY_COLLECTION at a
+    new collection (or re-embed the old one) when changing embedders.
+
+    Raises:
+        EmbeddingDimensionError: If the collection holds vectors of another size
+    """
+    expected = getattr(client.embedding_model.config, 'embedding_dims', None)
+    collection = getattr(client.vector_store, 'collection', None)
+    if not isinstance(expected, int) or collection is None:
+        return
+    stored = collection.get(limit=1, include=['embeddings']).get('embeddings')
+    if stored is None or len(stored) == 0:
+        return
+    if len(stored[0]) != expected:
+        raise EmbeddingDimensionError(
+            f"Memory collection '{settings.MEMORY_COLLECTION}' holds {len(stored[0])}-dimensional vectors "
+            f"but the {settings.EMBEDDING_PROVIDER} embedder produces {expected}; "
+            "use a new MEMORY_COLLECTION or re-embed the existing memories"
+        )
+
+def get_memory_client():
+    """
+    Return the process-wide mem0 client, creating it on first use.
+
+    mem0 is imported here rather than at module import, so importing the
+    app does not open the vector store or build API clients.
+    """
+    global mem0_client
+    if mem0_client is None:
+        with _client_lock:
+            if mem0_client is None:
+                from mem0 import Memory
+
+                logger.info(f"Initializing mem0 client at {settings.MEMORY_DB_PATH}")
+                client = Memory.from_config(memory_config())
+                check_embedding_dimensions(client)
+                mem0_client = client
+    return mem0_client
+
+def local_embedder():
+    """
+    Build the local ONNX embedder configured in settings.
+
+    Returns:
+        OnnxEmbedder backed by the on-disk embedding cache (unless disabled)
+    """
+    from .embeddings import EmbeddingCache, OnnxEmbedder
 
-mem0_client = Memory.from_config(config)
+    cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH) if settings.EMBEDDING_CACHE_PATH else None
+    return OnnxEmbedder(
+        settings.ONNX_EMBEDDING_MODEL_PATH,
+        settings.ONNX_TOKENIZER_PATH,
+        cache=cache,
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+    )
+
+def warmup_memory_client():
+    """Create the mem0 client ahead of the first request (called at app startup)."""
+    try:
+        get_memory_client()
+    except EmbeddingDimensionError:
+        # A mismatched embedder would corrupt the collection, so refuse to start
+        raise
+    except Exception as e:
+        # Requests retry creation lazily; a failed warmup should not stop startup
+        logger.error(f"Could not warm up mem0 client: {e}")
+
+def shutdown_memory_client():
+    """Drain pending memory writes and release the mem0 client (called at app shutdown)."""
+    global mem0_client
+    shutdown_memory_ingest()
+    with _client_lock:
+        mem0_client = None
+
+_ingest_queue = None
+_ingest_lock = threading.Lock()
+
+# Per-user memory listings, kept fresh by write_memory
+memory_cache = MemorySnapshotCache(
+    max_bytes=settings.MEMORY_CACHE_MAX_BYTES,
+    ttl_seconds=settings.MEMORY_CACHE_TTL_SECONDS,
+)
+
+# Recently written prompts per user, so resent prompts skip extraction
+write_dedupe = WriteDedupeIndex(window_seconds=settings.MEMORY_DEDUPE_WINDOW_SECONDS)
+
+def _add_memories(prompts: list, user_id: str):
+    """
+    Run mem0 extraction over prompts and apply the result to the search index.
+
+    Raises whatever mem0 raises, so the ingest queue can retry.
+    """
+    logger.info(f"Writing memory for user {user_id}: {prompts}")
+    result = get_memory_client().add([{"role": "user", "content": prompt} for prompt in prompts], user_id=user_id)
+    logger.info(f"Memory write result: {result}")
+    write_dedupe.record(user_id, prompts, _result_ids(result))
+    changed = _memories_changed(result)
+    if changed:
+        memory_cache.apply(user_id, result)
+    # After the listing cache, so an index built from a fresh listing cannot miss this write
+    _update_search_index(user_id, result)
+    if changed:
+        retrieval_cache.bump(user_id, 'memory', keep_prompts=prompts)
+    return result
+
+def _ingest_memories(prompts: list, user_id: str):
+    """
+    Ingest queue writer: skip prompts already written within the dedupe
+    window, then write the rest. The database lookup runs here, on the
+    worker thread, instead of in write_memory.
+    """
+    prompts = [prompt for prompt in prompts if write_dedupe.lookup(user_id, prompt) is None]
+    if prompts:
+        return _add_memories(prompts, user_id)
+
+def _settle_pending(user_id: str, pending_ids: list, prompts: list):
+    """
+    Drop read-your-writes placeholders once their prompts are written.
+
+    Cached results are not carried over for the settled prompts: they list
+    the placeholder ids that were just removed.
+    """
+    remove_memories(user_id, pending_ids)
+    if settings.MEMORY_READ_YOUR_WRITES:
+        retrieval_cache.bump(user_id, 'memory')
+
+def memory_ingest_queue() -> MemoryIngestQueue:
+    """Return the process-wide memory ingest queue, creating it on first use."""
+    global _ingest_queue
+    with _ingest_lock:
+        if _ingest_queue is None:
+            _ingest_queue = MemoryIngestQueue(
+                _ingest_memories,
+                max_size=settings.MEMORY_QUEUE_MAX_SIZE,
+                batch_size=settings.MEMORY_QUEUE_BATCH_SIZE,
+                max_retries=settings.MEMORY_WRITE_RETRIES,
+                on_settled=_settle_pending,
+            )
+        return _ingest_queue
+
+def shutdown_memory_ingest(timeout: float = 30.0):
+    """Drain and stop the memory ingest queue, if it was started."""
+    global _ingest_queue
+    with _ingest_lock:
+        ingest_queue, _ingest_queue = _ingest_queue, None
+    if ingest_queue is not None:
+        ingest_queue.shutdown(timeout)
+
+atexit.register(shutdown_memory_ingest)
 
 def write_memory(prompt: str, user_id: str):
     """
     Write a memory to the vector store.
+
+    With settings.MEMORY_WRITE_MODE set to "async" the prompt is handed to
+    the background ingest queue and this returns immediately; when the
+    queue is full the write happens inline instead. A prompt already
+    written (or queued) for the user within settings.MEMORY_DEDUPE_WINDOW_SECONDS,
+    after normalization, is skipped and the existing memory ids returned;
+    for queued writes the check against earlier writes happens in the
+    ingest worker, so the prompt is reported as queued.
     
     Args:
         prompt: The content to store as memory
         user_id: The user identifier
         
     Returns:
-        Memory write result or None if failed
+        Memory write result, {'results': [], 'queued': True} when queued,
+        {'results': [...], 'deduplicated': True} when skipped, or None if failed
     """
+    queued = settings.MEMORY_WRITE_MODE == "async"
+    pending = memory_ingest_queue().pending(user_id) if queued else []
+    # Queued prompts are checked against the database by the ingest worker, off the caller's thread
+    memory_ids = write_dedupe.lookup(user_id, prompt, pending=pending, stored=not queued)
+    if memory_ids is None and queued:
+        if memory_ingest_queue().submit(prompt, user_id):
+            if settings.MEMORY_READ_YOUR_WRITES:
+                retrieval_cache.bump(user_id, 'memory', keep_prompts=[prompt])
+            return {'results': [], 'queued': True}
+        logger.warning(f"Memory ingest queue full, writing memory for user {user_id} inline")
+        memory_ids = write_dedupe.lookup(user_id, prompt)
+    if memory_ids is not None:
+        logger.info(f"Skipping repeated memory write for user {user_id}")
+        return {'results': [{'id': memory_id, 'event': 'NONE'} for memory_id in memory_ids], 'deduplicated': True}
+
     try:
-        logger.info(f"Writing memory for user {user_id}: {prompt}")
-        result = mem0_client.add([{"role": "user", "content": prompt}], user_id=user_id)
-        logger.info(f"Memory write result: {result}")
-        return result
+        return _add_memories([prompt], user_id)
     except Exception as e:
         logger.error(f"Could not write memory: {e}")
         return None
 
-def fetch_cited_memories(citations):
+def _update_search_index(user_id: str, result):
+    """
+    Apply the events of a mem0 add result to the user's BM25 index.
+
+    Args:
+        user_id: The user identifier
+        result: Result dictionary returned by mem0's add
+    """
+    if not isinstance(result, dict):
+        return
+    for item in result.get('results') or []:
+        if not isinstance(item, dict) or 'id' not in item:
+            continue
+        event = item.get('event')
+        if event == 'DELETE':
+            remove_memories(user_id, [item['id']])
+        elif event in ('ADD', 'UPDATE') and item.get('memory'):
+            index_memories(user_id, [item])
+
+def _result_ids(result) -> list:
+    """Return the ids of the memories a mem0 add result added, updated or kept."""
+    if not isinstance(result, dict):
+        return []
+    return [item['id'] for item in result.get('results') or []
+            if isinstance(item, dict) and 'id' in item and item.get('event') != 'DELETE']
+
+def _memories_changed(result) -> bool:
+    """
+    Tell whether a mem0 add result may have changed the user's memories.
+
+    Results without per-memory events are treated as changes.
+    """
+    if not isinstance(result, dict) or not isinstance(result.get('results'), list):
+        return True
+    return any(not isinstance(item, dict) or item.get('event', 'ADD') != 'NONE' for item in result['results'])
+
+_PAYLOAD_FIELDS = ('hash', 'created_at', 'updated_at', 'user_id', 'agent_id', 'run_id', 'actor_id', 'role')
+
+def _vector_collection():
+    """Return the Chroma collection behind mem0, or None for other vector stores."""
+    return getattr(getattr(get_memory_client(), 'vector_store', None), 'collection', None)
+
+def _payload_to_memory(mem_id: str, payload: dict):
+    """Convert a Chroma payload written by mem0 into mem0's memory dict shape."""
+    payload = payload or {}
+    if 'data' not in payload:
+        return None
+    memory = {'id': mem_id, 'memory': payload['data']}
+    for field in _PAYLOAD_FIELDS:
+        if field in payload:
+            memory[field] = payload[field]
+    extra = {key: value for key, value in payload.items() if key != 'data' and key not in _PAYLOAD_FIELDS}
+    if extra:
+        memory['metadata'] = extra
+    return memory
+
+def _fetch_memories_by_id(memory_ids: list) -> dict:
+    """
+    Look up memories by id with one batched vector store query.
+
+    Uses the Chroma collection behind mem0 when available and falls back to
+    one mem0 get per id otherwise.
+
+    Args:
+        memory_ids: Memory identifiers to look up
+
+    Returns:
+        Dict mapping each found id to its memory dict, or to the exception
+        raised while fetching it
+    """
+    collection = _vector_collection()
+    if collection is not None:
+        try:
+            response = collection.get(ids=list(memory_ids))
+            found = {}
+            for mem_id, payload in zip(response.get('ids') or [], response.get('metadatas') or []):
+                memory = _payload_to_memory(mem_id, payload)
+                if memory is not None:
+                    found[mem_id] = memory
+            return found
+        except Exception as e:
+            logger.warning(f"Batched memory lookup failed, fetching one by one: {e}")
+
+    found = {}
+    for mem_id in memory_ids:
+        try:
+            mem_data = get_memory_client().get(mem_id)
+            if mem_data and 'memory' in mem_data:
+                found[mem_id] = mem_data
+        except Exception as e:
+            found[mem_id] = e
+    return found
+
+def fetch_cited_memories(citations, memories: list = None, user_id: str = None):
     """
     Fetch memory details for cited memory IDs.
+
+    Records the caller already holds are reused; only the remaining ids are
+    looked up, in a single batch. Ids merged away by compaction resolve to
+    their canonical memory, and archived memories are read from the cold
+    store. Citations are recorded in the access statistics used for tiering;
+    read-your-writes placeholders are cited but not recorded.
     
     Args:
         citations: List of tuples (memory_id, timestamp)
+        memories: Optional memory dictionaries already fetched (e.g. search results)
+        user_id: Owner of the memories, whose shard records the citations
         
     Returns:
         List of memory dictionaries with citation details
     """
-    cited_memories = []
-    seen_ids = set()
-    for mem_id, timestamp in set(citations):
-        if mem_id not in seen_ids:
+    known = {m['id']: m for m in memories or [] if isinstance(m, dict) and 'id' in m and 'memory' in m}
+    timestamps = {}
+    for mem_id, timestamp in citations:
+        timestamps.setdefault(mem_id, timestamp)
+    missing = [mem_id for mem_id in timestamps if mem_id not in known]
+    canonical = {}
+    if missing:
+        try:
+            canonical = resolve_memory_aliases(missing)
+        except Exception as e:
+            logger.error(f"Could not resolve memory aliases: {e}")
+        to_fetch = list(dict.fromkeys(canonical.get(mem_id, mem_id) for mem_id in missing))
+        to_fetch = [mem_id for mem_id in to_fetch if mem_id not in known]
+        if to_fetch:
+            known.update(_fetch_memories_by_id(to_fetch))
+        unresolved = [mem_id for mem_id in to_fetch if mem_id not in known]
+        if unresolved:
             try:
-                mem_data = mem0_client.get(mem_id)
-                if mem_data and 'memory' in mem_data:
-                    mem_ts = mem_data.get('updated_at') or mem_data.get('created_at', 'N/A')
-                    content = mem_data['memory']
-                    title = content[:50]
-                    cited_memories.append({
-                        "id": mem_id,
-                        "title": title,
-                        "memory_id": mem_id,
-                        "timestamp": mem_ts,
-                        "content": content
-                    })
-                else:
-                    cited_memories.append({
-                        "id": mem_id,
-                        "title": "[Memory not found]",
-                        "memory_id": mem_id,
-                        "timestamp": timestamp,
-                        "content": "[Memory not found]"
-                    })
+                known.update((m['id'], m) for m in load_cold_memories(memory_ids=unresolved))
             except Exception as e:
-                cited_memories.append({
-                    "id": mem_id,
-                    "title": "[Error fetching memory]",
-                    "memory_id": mem_id,
-                    "timestamp": timestamp,
-                    "content": f"[Error fetching memory: {e}]"
-                })
-            seen_ids.add(mem_id)
+                logger.error(f"Could not read cold memories: {e}")
+
+    cited_memories = []
+    accessed = []
+    for mem_id, timestamp in timestamps.items():
+        resolved_id = canonical.get(mem_id, mem_id)
+        mem_data = known.get(resolved_id)
+        if isinstance(mem_data, Exception):
+            cited_memories.append({
+                "id": mem_id,
+                "title": "[Error fetching memory]",
+                "memory_id": mem_id,
+                "timestamp": timestamp,
+                "content": f"[Error fetching memory: {mem_data}]"
+            })
+        elif mem_data:
+            mem_ts = mem_data.get('updated_at') or mem_data.get('created_at', 'N/A')
+            content = mem_data['memory']
+            if not str(resolved_id).startswith('pending:'):
+                accessed.append(resolved_id)
+            cited_memories.append({
+                "id": mem_id,
+                "title": content[:50],
+                "memory_id": resolved_id,
+                "timestamp": mem_ts,
+                "content": content
+            })
+        else:
+            cited_memories.append({
+                "id": mem_id,
+                "title": "[Memory not found]",
+                "memory_id": mem_id,
+                "timestamp": timestamp,
+                "content": "[Memory not found]"
+            })
+    try:
+        record_memory_access(accessed, cited=True, user_id=user_id)
+    except Exception as e:
+        logger.error(f"Could not record memory access: {e}")
     logger.info(f"Cited memories returned: {cited_memories}")
     return cited_memories
 
-def get_all_memories(user_id: str):
+# Bound at import, so the async variant always runs this implementation
+_fetch_cited_memories = fetch_cited_memories
+
+async def afetch_cited_memories(*args, **kwargs):
     """
-    Get all memories for a user.
+    Run fetch_cited_memories in a worker thread so its vector store and SQLite reads never block the event loop.
+
+    Takes the same arguments and returns the same results as fetch_cited_memories.
+    """
+    return await asyncio.to_thread(_fetch_cited_memories, *args, **kwargs)
+
+def _matches(memory: dict, filters: dict) -> bool:
+    metadata = memory.get('metadata') or {}
+    return all(memory.get(key, metadata.get(key)) == value for key, value in filters.items())
+
+def iter_memories(user_id: str, filters: dict = None, page_size: int = None, max_candidates: int = None, newest: bool = False):
+    """
+    Stream a user's memories page by page.
+
+    Pages are read straight from the Chroma collection with limit/offset, so
+    at most one page is held at a time. Vector stores without a collection
+    fall back to a single mem0 get_all call, paged in memory.
+
+    With newest set and max_candidates given, only the user's newest
+    max_candidates memories are read: the collection is first scanned for
+    ids alone (no payloads), and only the payloads of the last ids in
+    insertion order are fetched. A memory edited after insertion keeps its
+    original position. Dropping older memories is logged.
+
+    Args:
+        user_id: The user identifier
+        filters: Optional metadata equality filters, e.g. {"agent_id": "research"}
+        page_size: Memories per page (defaults to settings.MEMORY_PAGE_SIZE)
+        max_candidates: Stop after this many memories (None for no limit)
+        newest: Keep the newest max_candidates memories instead of the first ones
+
+    Yields:
+        Lists of memory dictionaries
+    """
+    page_size = page_size or settings.MEMORY_PAGE_SIZE
+    remaining = max_candidates if max_candidates is not None else float('inf')
+    if remaining <= 0:
+        return
+
+    collection = _vector_collection()
+    if collection is not None:
+        conditions = [{'user_id': user_id}] + [{key: value} for key, value in (filters or {}).items()]
+        where = conditions[0] if len(conditions) == 1 else {'$and': conditions}
+        if newest and max_candidates is not None:
+            try:
+                ids = _newest_memory_ids(collection, where, user_id, int(max_candidates), page_size)
+            except Exception as e:
+                logger.warning(f"Id scan of memories failed, falling back to get_all: {e}")
+            else:
+                for start in range(0, len(ids), page_size):
+                    response = collection.get(ids=ids[start:start + page_size], include=['metadatas'])
+                    page = [m for m in (_payload_to_memory(i, p) for i, p in zip(response.get('ids') or [], response.get('metadatas') or [])) if m is not None]
+                    if page:
+                        yield page
+                return
+        offset = 0
+        try:
+            while remaining > 0:
+                limit = int(min(page_size, remaining))
+                response = collection.get(where=where, limit=limit, offset=offset, include=['metadatas'])
+                ids = response.get('ids') or []
+                page = [m for m in (_payload_to_memory(i, p) for i, p in zip(ids, response.get('metadatas') or [])) if m is not None]
+                if page:
+                    yield page
+                    remaining -= len(page)
+                if len(ids) < limit:
+                    return
+                offset += len(ids)
+            return
+        except Exception as e:
+            if offset:
+                raise
+            logger.warning(f"Paged memory listing failed, falling back to get_all: {e}")
+
+    memories = get_memory_client().get_all(user_id=user_id).get('results', [])
+    if filters:
+        memories = [m for m in memories if _matches(m, filters)]
+    if newest and len(memories) > remaining:
+        logger.info(f"Listing the newest {remaining} of {len(memories)} memories for user {user_id}")
+        memories = heapq.nlargest(int(remaining), memories, key=lambda m: m.get('updated_at') or m.get('created_at') or '')
+    for start in range(0, len(memories), page_size):
+        if remaining <= 0:
+            return
+        page = memories[start:start + int(min(page_size, remaining))]
+        yield page
+        remaining -= len(page)
+
+def _newest_memory_ids(collection, where: dict, user_id: str, limit: int, page_size: int) -> list:
+    """Scan a user's memory ids (without payloads) and return the last limit in insertion order."""
+    newest = deque(maxlen=limit)
+    offset = total = 0
+    while True:
+        ids = collection.get(where=where, limit=page_size, offset=offset, include=[]).get('ids') or []
+        newest.extend(ids)
+        total += len(ids)
+        if len(ids) < page_size:
+            break
+        offset += len(ids)
+    if total > limit:
+        logger.info(f"Listing the newest {limit} of {total} memories for user {user_id}")
+    return list(newest)
+
+def get_all_memories(user_id: str, filters: dict = None, max_candidates: int = None):
+    """
+    Get a user's memories, bounded to the most recent max_candidates.
+
+    Only the newest max_candidates memories are read from the store (see
+    iter_memories) and they are returned newest first, so memory use stays
+    bounded however large the user's corpus grows; older memories are left
+    out, which is logged. Listings are served from memory_cache while fresh.
     
     Args:
         user_id: The user identifier
+        filters: Optional metadata equality filters
+        max_candidates: Maximum memories to return (defaults to settings.MEMORY_MAX_CANDIDATES; 0 for no limit)
         
     Returns:
-        List of all memories for the user
+        List of memories for the user, followed by queued prompts not yet
+        written when settings.MEMORY_READ_YOUR_WRITES is on
     """
-    return mem0_client.get_all(user_id=user_id).get('results', []) 
\ No newline at end of file
+    if max_candidates is None:
+        max_candidates = settings.MEMORY_MAX_CANDIDATES
+    cache_key = memory_cache.key(user_id, filters, max_candidates)
+    memories = memory_cache.get(cache_key)
+    if memories is None:
+        if max_candidates:
+            pages = iter_memories(user_id, filters=filters, max_candidates=max_candidates, newest=True)
+            memories = heapq.nlargest(
+                max_candidates,
+                (m for page in pages for m in page),
+                key=lambda m: m.get('updated_at') or m.get('created_at') or '',
+            )
+        else:
+            memories = [m for page in iter_memories(user_id, filters=filters) for m in page]
+        memory_cache.put(cache_key, memories)
+    return memories + pending_memories(user_id)
+
+def pending_memories(user_id: str) -> list:
+    """Return placeholders for the user's queued prompts when settings.MEMORY_READ_YOUR_WRITES is on."""
+    if settings.MEMORY_READ_YOUR_WRITES and _ingest_queue is not None:
+        return _ingest_queue.pending(user_id)
+    return []
+
+def search_memories(query: str, user_id: str, limit: int = 20):
+    """
+    Get the memories nearest to a query from the vector store.
+
+    Args:
+        query: The search query
+        user_id: The user identifier
+        limit: Maximum number of memories to return
+
+    Returns:
+        List of memories ordered by semantic similarity
+    """
+    try:
+        return get_memory_client().search(query=query, user_id=user_id, limit=limit).get('results', [])
+    except Exception as e:
+        logger.error(f"Could not search memories: {e}")
+        return []
@@ -0,0 +1,151 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+
+def _sizeof(memories: list) -> int:
+    """Approximate the memory footprint of a list of memory dicts."""
+    size = sys.getsizeof(memories)
+    for memory in memories:
+        size += sys.getsizeof(memory)
+        for key, value in memory.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+class MemorySnapshotCache:
+    """
+    Read-through cache of per-user memory lists.
+
+    Entries are keyed by user, filters and candidate limit, expire after
+    ttl_seconds, and are evicted least recently used once their combined
+    size exceeds max_bytes. Writes patch unfiltered snapshots in place from
+    mem0's ADD/UPDATE/DELETE events, and invalidate everything else the
+    user has cached.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.patches = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(user_id: str, filters: dict = None, max_candidates: int = None) -> tuple:
+        """Build the cache key for a memory listing."""
+        return (user_id, tuple(sorted((filters or {}).items())), max_candidates)
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def get(self, key):
+        """Return a copy of the cached memory list, or None on a miss or expiry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, key, memories: list):
+        """Cache a memory list, evicting least recently used entries as needed."""
+        memories = list(memories)
+        size = _sizeof(memories)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic(), memories, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                evicted = next(iter(self._entries))
+                self._drop(evicted)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        """Drop every cached listing for a user."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                self._drop(key)
+                self.invalidations += 1
+
+    def apply(self, user_id: str, result):
+        """
+        Bring a user's cached listings up to date after a mem0 add.
+
+        Args:
+            user_id: The user identifier
+            result: Result dictionary returned by mem0's add
+        """
+        items = result.get('results') if isinstance(result, dict) else None
+        if not isinstance(items, list) or not all(isinstance(item, dict) and 'id' in item for item in items):
+            self.invalidate(user_id)
+            return
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                if key[1]:
+                    # Cannot tell whether changed memories match the filters
+                    self._drop(key)
+                    self.invalidations += 1
+                    continue
+                timestamp, memories, _ = self._entries[key]
+                memories = self._patch(memories, items, key[2])
+                self._drop(key)
+                size = _sizeof(memories)
+                self._entries[key] = (timestamp, memories, size)
+                self.current_bytes += size
+                self.patches += 1
+            while self.current_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    @staticmethod
+    def _patch(memories: list, items: list, max_candidates: int) -> list:
+        by_id = {m['id']: m for m in memories}
+        fresh = []
+        for item in items:
+            event = item.get('event', 'ADD')
+            if event == 'DELETE':
+                by_id.pop(item['id'], None)
+            elif event in ('ADD', 'UPDATE') and item.get('memory'):
+                previous = by_id.pop(item['id'], {})
+                fresh.append({**previous, 'id': item['id'], 'memory': item['memory']})
+        # Listings are newest first, so new and updated memories lead
+        patched = list(reversed(fresh)) + [m for m in memories if m['id'] in by_id]
+        return patched[:max_candidates] if max_candidates else patched
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = self.invalidations = self.patches = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'patches': self.patches,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
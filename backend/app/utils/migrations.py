@@ -0,0 +1,145 @@
+import logging
+
+logger = logging.getLogger("migrations")
+
+
+def _baseline(conn):
+    """Tables as they existed before the schema was versioned."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_history (
+            user_id TEXT, role TEXT, content TEXT, timestamp TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_aliases (
+            alias_id TEXT PRIMARY KEY, canonical_id TEXT, user_id TEXT, created_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS memory_aliases_canonical ON memory_aliases (canonical_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            name TEXT PRIMARY KEY, value TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_access (
+            memory_id TEXT PRIMARY KEY, last_access REAL, retrievals INTEGER DEFAULT 0, citations INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cold_memories (
+            memory_id TEXT PRIMARY KEY, user_id TEXT, memory TEXT, payload TEXT, archived_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS cold_memories_user ON cold_memories (user_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_write_hashes (
+            user_id TEXT, content_hash TEXT, memory_ids TEXT, written_at REAL,
+            PRIMARY KEY (user_id, content_hash)
+        )
+    """)
+
+
+def _keyed_conversation_history(conn):
+    """
+    Rebuild conversation_history with a primary key, REAL timestamps,
+    turn and session ids, and indexes for per-user range scans.
+
+    Row ids are kept, and the two rows of each legacy exchange (same user,
+    same timestamp) share the id of the first as their turn id. The FTS
+    index and its triggers are dropped and rebuilt on the new table.
+    """
+    for trigger in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS conversation_history_fts_{trigger}")
+    conn.execute("DROP TABLE IF EXISTS conversation_history_fts")
+    conn.execute("""
+        CREATE TABLE conversation_history_v2 (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            session_id TEXT,
+            turn_id INTEGER,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        INSERT INTO conversation_history_v2 (id, user_id, session_id, turn_id, role, content, timestamp)
+        SELECT rowid, COALESCE(user_id, ''), NULL,
+               MIN(rowid) OVER (PARTITION BY user_id, CAST(timestamp AS REAL)),
+               COALESCE(role, ''), COALESCE(content, ''), COALESCE(CAST(timestamp AS REAL), 0.0)
+        FROM conversation_history
+    """)
+    conn.execute("DROP TABLE conversation_history")
+    conn.execute("ALTER TABLE conversation_history_v2 RENAME TO conversation_history")
+    conn.execute("CREATE INDEX conversation_history_user_time ON conversation_history (user_id, timestamp)")
+    conn.execute("CREATE INDEX conversation_history_user_session ON conversation_history (user_id, session_id, timestamp)")
+
+
+def _conversation_summaries(conn):
+    """Add the table of rolled-up summaries that replace a user's old conversation turns."""
+    conn.execute("""
+        CREATE TABLE conversation_summaries (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            first_timestamp REAL NOT NULL,
+            last_timestamp REAL NOT NULL,
+            turns INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX conversation_summaries_user_time ON conversation_summaries (user_id, last_timestamp)")
+
+
+def _memory_access_owner(conn):
+    """Record which user each memory_access row belongs to, so the rows can live (and move) with the user's shard."""
+    conn.execute("ALTER TABLE memory_access ADD COLUMN user_id TEXT")
+    conn.execute("CREATE INDEX memory_access_user ON memory_access (user_id)")
+
+
+# (version, description, migration) in order; never edit a released entry, append a new one
+MIGRATIONS = [
+    (1, "baseline tables", _baseline),
+    (2, "keyed conversation_history with typed timestamps and turn/session ids", _keyed_conversation_history),
+    (3, "conversation_summaries", _conversation_summaries),
+    (4, "memory_access owner column", _memory_access_owner),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn) -> int:
+    """Return the schema version recorded in the database (0 for an unversioned database)."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn) -> int:
+    """
+    Bring a database up to SCHEMA_VERSION in place.
+
+    Each pending migration runs in its own write transaction together with
+    the version bump, so a failed migration leaves the previous version
+    intact, and processes racing to migrate apply every step exactly once.
+
+    Args:
+        conn: Open sqlite3 connection
+
+    Returns:
+        The schema version after migrating
+    """
+    for version, description, apply in MIGRATIONS:
+        if schema_version(conn) >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if schema_version(conn) < version:
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                logger.info(f"Migrated conversation database to version {version}: {description}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return schema_version(conn)
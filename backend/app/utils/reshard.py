@@ -0,0 +1,137 @@
+import logging
+import argparse
+from .database import _connections, _await_buffered_writes, conversation_shards, conversation_db_path, conversation_shard_stats
+from ..core.config import settings
+
+logger = logging.getLogger("reshard")
+
+
+def _move_user(user_id: str, source: str, target: str) -> int:
+    """
+    Copy a user's conversation rows, summaries, memory access statistics and
+    written prompt hashes from one shard to another, then delete them from the source.
+
+    Row ids are reassigned by the target, and turn ids are remapped to
+    match. Rows already present in the target (same timestamp, role and
+    content) are reused rather than copied, so a move interrupted between
+    the copy and the delete is completed by running it again.
+
+    Returns:
+        Number of rows copied
+    """
+    src = _connections.connection(source)
+    dst = _connections.connection(target)
+    rows = src.execute(
+        "SELECT id, session_id, turn_id, role, content, timestamp FROM conversation_history WHERE user_id = ? ORDER BY id",
+        (user_id,),
+    ).fetchall()
+    new_ids = {}
+    copied = 0
+    with dst:
+        c = dst.cursor()
+        for row_id, session_id, turn_id, role, content, timestamp in rows:
+            c.execute(
+                "SELECT id FROM conversation_history WHERE user_id = ? AND timestamp = ? AND role = ? AND content = ?",
+                (user_id, timestamp, role, content),
+            )
+            existing = c.fetchone()
+            if existing:
+                new_ids[row_id] = existing[0]
+                continue
+            c.execute(
+                "INSERT INTO conversation_history (user_id, session_id, turn_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, session_id, new_ids.get(turn_id), role, content, timestamp),
+            )
+            new_ids[row_id] = c.lastrowid
+            if turn_id == row_id:
+                c.execute("UPDATE conversation_history SET turn_id = ? WHERE id = ?", (c.lastrowid, c.lastrowid))
+            copied += 1
+        summaries = src.execute(
+            "SELECT summary, first_timestamp, last_timestamp, turns, created_at FROM conversation_summaries WHERE user_id = ?",
+            (user_id,),
+        ).fetchall()
+        for summary, first_timestamp, last_timestamp, turns, created_at in summaries:
+            c.execute(
+                """
+                INSERT INTO conversation_summaries (user_id, summary, first_timestamp, last_timestamp, turns, created_at)
+                SELECT ?, ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM conversation_summaries WHERE user_id = ? AND last_timestamp = ? AND summary = ?)
+                """,
+                (user_id, summary, first_timestamp, last_timestamp, turns, created_at, user_id, last_timestamp, summary),
+            )
+        c.executemany(
+            "INSERT OR REPLACE INTO memory_access (memory_id, user_id, last_access, retrievals, citations) VALUES (?, ?, ?, ?, ?)",
+            src.execute(
+                "SELECT memory_id, user_id, last_access, retrievals, citations FROM memory_access WHERE user_id = ?", (user_id,)
+            ).fetchall(),
+        )
+        c.executemany(
+            "INSERT OR REPLACE INTO memory_write_hashes (user_id, content_hash, memory_ids, written_at) VALUES (?, ?, ?, ?)",
+            src.execute(
+                "SELECT user_id, content_hash, memory_ids, written_at FROM memory_write_hashes WHERE user_id = ?", (user_id,)
+            ).fetchall(),
+        )
+    with src:
+        src.execute("DELETE FROM conversation_history WHERE user_id = ?", (user_id,))
+        src.execute("DELETE FROM conversation_summaries WHERE user_id = ?", (user_id,))
+        src.execute("DELETE FROM memory_access WHERE user_id = ?", (user_id,))
+        src.execute("DELETE FROM memory_write_hashes WHERE user_id = ?", (user_id,))
+    return copied
+
+
+def reshard(from_shards: int, to_shards: int, dry_run: bool = False) -> dict:
+    """
+    Move conversations from a from_shards layout to a to_shards layout.
+
+    Every user whose shard changes under the new ring is moved, one user
+    per transaction; with consistent hashing that is about 1 / to_shards of
+    the users when adding a shard. Run it while the app is stopped, then
+    set DATABASE_SHARDS to to_shards. Shard files left empty by shrinking
+    can be deleted afterwards.
+
+    Args:
+        from_shards: Shard count the data is currently laid out for
+        to_shards: Shard count to lay the data out for
+        dry_run: Report the users that would move without moving them
+
+    Returns:
+        Summary report with 'users_scanned', 'users_moved', 'rows_moved'
+        and the per-shard user counts after the move under 'shard_users'
+    """
+    if from_shards < 1 or to_shards < 1:
+        raise ValueError("Shard counts must be at least 1")
+    _await_buffered_writes()
+    summary = {'users_scanned': 0, 'users_moved': 0, 'rows_moved': 0, 'shard_users': [0] * to_shards}
+    targets = conversation_shards(to_shards)
+    for source in conversation_shards(from_shards):
+        user_ids = [row[0] for row in _connections.connection(source).execute(
+            "SELECT user_id FROM conversation_history UNION SELECT user_id FROM conversation_summaries ORDER BY user_id"
+        ).fetchall()]
+        for user_id in user_ids:
+            summary['users_scanned'] += 1
+            target = conversation_db_path(user_id, to_shards)
+            summary['shard_users'][targets.index(target)] += 1
+            if target == source:
+                continue
+            summary['users_moved'] += 1
+            if not dry_run:
+                summary['rows_moved'] += _move_user(user_id, source, target)
+    logger.info(
+        f"{'Would move' if dry_run else 'Moved'} {summary['users_moved']} of {summary['users_scanned']} users "
+        f"from {from_shards} to {to_shards} shards ({summary['rows_moved']} rows)"
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move conversation history to a new number of database shards")
+    parser.add_argument("--from", dest="from_shards", type=int, default=settings.DATABASE_SHARDS, help="current shard count")
+    parser.add_argument("--to", dest="to_shards", type=int, required=True, help="new shard count")
+    parser.add_argument("--dry-run", action="store_true", help="report without moving rows")
+    parser.add_argument("--stats", action="store_true", help="print per-shard user and row counts afterwards")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(reshard(args.from_shards, args.to_shards, args.dry_run))
+    if args.stats:
+        for shard in conversation_shard_stats(args.to_shards):
+            print(shard)
@@ -0,0 +1,154 @@
+import time
+import threading
+from collections import OrderedDict
+from .analyzers import get_analyzer
+from ..core.config import settings
+
+CORPORA = ('memory', 'conversation')
+
+
+def _has_pending(results: list) -> bool:
+    """Return True if results include a read-your-writes placeholder memory."""
+    return any(
+        isinstance(r, dict) and r.get('type') == 'memory' and str(r.get('id', '')).startswith('pending:')
+        for r in results
+    )
+
+
+class RetrievalCache:
+    """
+    Per-user cache of retrieval results.
+
+    Entries are keyed by the normalized prompt, top_n, retrieval scope and the
+    version counters of the corpora the scope reads from. Writes bump the
+    user's corpus version, which makes every older entry unreachable; those
+    entries then age out of the LRU. A write made on behalf of a prompt (the
+    pipeline storing its own exchange or memory) keeps that prompt's entries,
+    so a repeated prompt still hits, unless its results still show a
+    read-your-writes placeholder. A TTL bounds staleness for writes made by
+    other processes.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._versions = {}
+        self._entries = OrderedDict()
+        self._prompt_keys = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Normalize a prompt so casing, spacing and punctuation changes share an entry."""
+        return ' '.join(get_analyzer()(prompt))
+
+    def version(self, user_id: str, corpus: str) -> int:
+        """Return the current version counter of a user's corpus."""
+        with self._lock:
+            return self._versions.get((user_id, corpus), 0)
+
+    def bump(self, user_id: str, corpus: str, keep_prompts=()):
+        """
+        Invalidate cached results that depend on a user's corpus.
+
+        Args:
+            user_id: The user identifier
+            corpus: "memory" or "conversation"
+            keep_prompts: Prompts whose own write this is; their current
+                entries are carried over to the new version instead of dropped,
+                except entries that list a pending placeholder memory
+        """
+        with self._lock:
+            version_key = (user_id, corpus)
+            old = self._versions.get(version_key, 0)
+            self._versions[version_key] = old + 1
+            self.invalidations += 1
+            for prompt in {self.normalize_prompt(p) for p in keep_prompts}:
+                for key in list(self._prompt_keys.get((user_id, prompt), ())):
+                    scope, versions = key[3], key[5]
+                    corpora = CORPORA if scope == 'all' else (scope,)
+                    if corpus not in corpora or versions[corpora.index(corpus)] != old:
+                        continue
+                    if _has_pending(self._entries[key][1]):
+                        continue
+                    versions = versions[:corpora.index(corpus)] + (old + 1,) + versions[corpora.index(corpus) + 1:]
+                    self._file(key[:5] + (versions,), self._pop(key))
+
+    def _file(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._prompt_keys.setdefault(key[:2], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+        entry = self._entries.pop(key)
+        keys = self._prompt_keys.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._prompt_keys[key[:2]]
+        return entry
+
+    def lookup(self, user_id: str, prompt: str, top_n: int, scope: str):
+        """
+        Look up cached results.
+
+        Args:
+            user_id: The user identifier
+            prompt: The search query
+            top_n: Number of results requested
+            scope: "memory", "conversation" or "all"; decides which corpus versions apply
+
+        Returns:
+            Tuple of (cache key, cached results or None). Pass the key to store()
+            so results are filed under the versions they were computed against.
+        """
+        corpora = CORPORA if scope == 'all' else (scope,)
+        with self._lock:
+            versions = tuple(self._versions.get((user_id, corpus), 0) for corpus in corpora)
+            key = (user_id, self.normalize_prompt(prompt), top_n, scope, settings.RETRIEVAL_MODE, versions)
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, list(entry[1])
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return key, None
+
+    def store(self, key, results: list):
+        """Store results under a key returned by lookup()."""
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._file(key, (time.monotonic(), list(results)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._prompt_keys.clear()
+            self._versions.clear()
+            self.hits = self.misses = self.invalidations = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+retrieval_cache = RetrievalCache(
+    max_entries=settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS,
+)
@@ -1,55 +1,587 @@
-import nltk
-from rank_bm25 import BM25Okapi
+import os
+import heapq
+import asyncio
+import hashlib
+import time
+import logging
+import threading
+from collections import OrderedDict
+from .analyzers import get_analyzer
+from .bm25 import BM25Index, UserIndexRegistry, corpus_stats
+from .segments import SegmentStore, content_version
+from .sharding import ShardedIndex, get_shard_pool
+from .token_cache import TokenCache
+from ..core.config import settings
 
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+logger = logging.getLogger("search")
 
-def bm25_hybrid_search(prompt: str, memories: list, conversation_history: list, top_n: int = 10):
+# Per-user memory indexes, built once from a listing and kept current by memory writes
+user_indexes = UserIndexRegistry()
+
+# Writes recorded while a user's index is being built: user_id -> list of delta logs
+_seeding = {}
+_seed_lock = threading.Lock()
+
+# CSR snapshots of user indexes for the sparse backend: user_id -> _SparseSnapshot
+_sparse_snapshots = {}
+_sparse_lock = threading.Lock()
+
+# Changed documents a snapshot absorbs before it is rebuilt: the larger of a count and a fraction of the index
+_SPARSE_DELTA_MIN = 1000
+_SPARSE_DELTA_FRACTION = 0.1
+
+# On-disk segment stores per user when settings.INDEX_DIR is set
+_segment_stores = OrderedDict()
+_segment_lock = threading.Lock()
+
+# Tokenized documents keyed by identity + version, shared by every search path
+token_cache = TokenCache(max_bytes=settings.TOKEN_CACHE_MAX_BYTES)
+
+def _tokenize(text: str):
+    return get_analyzer()(text)
+
+def _memory_tokens(m: dict):
+    version = m.get('hash') or m.get('updated_at') or m.get('created_at')
+    key = ('memory', settings.SEARCH_ANALYZER, m['id'], version, hash(m['memory']))
+    return token_cache.get_or_tokenize(key, m['memory'], _tokenize)
+
+def _turn_tokens(role: str, content: str):
+    key = ('conversation', settings.SEARCH_ANALYZER, role, hash(content))
+    return token_cache.get_or_tokenize(key, content, _tokenize)
+
+def _memory_key(memory_id):
+    return ('memory', memory_id)
+
+def _is_pending(m: dict) -> bool:
+    return bool(m.get('pending')) or str(m['id']).startswith('pending:')
+
+def _upsert(corpus, memories: list, seeded: bool = False):
+    """Add memories the corpus lacks or holds with other text; listings are newest first, so they are added in reverse."""
+    if isinstance(corpus, (SegmentStore, ShardedIndex)):
+        docs = []
+        for m in reversed(memories):
+            key = _memory_key(m['id'])
+            version = content_version(m['memory'])
+            if corpus.version(key) != version:
+                docs.append((key, _memory_tokens(m), version, m))
+        if isinstance(corpus, SegmentStore):
+            corpus.append(docs, seeded=seeded)
+        elif docs:
+            corpus.append(docs)
+        return
+    for m in reversed(memories):
+        text = m['memory']
+        key = _memory_key(m['id'])
+        if corpus.version(key) != hash(text):
+            corpus.add(key, _memory_tokens(m), version=hash(text), payload=m)
+        else:
+            corpus.set_payload(key, m)
+
+def _apply(corpus, op: str, items: list):
+    if op == 'add':
+        _upsert(corpus, items)
+    elif isinstance(corpus, (SegmentStore, ShardedIndex)):
+        corpus.delete([_memory_key(memory_id) for memory_id in items])
+    else:
+        for memory_id in items:
+            corpus.remove(_memory_key(memory_id))
+
+def _delta(user_id: str, op: str, items: list):
+    """Apply a write to the user's memory index, and record it for seeds in progress."""
+    if not items:
+        return
+    with _seed_lock:
+        for log in _seeding.get(user_id, ()):
+            log.append((op, items))
+    corpus = segment_store(user_id) if settings.INDEX_DIR else user_indexes.peek(user_id)
+    if corpus is not None:
+        _apply(corpus, op, items)
+
+def index_memories(user_id: str, memories: list):
+    """
+    Add or refresh memories in the user's memory index.
+
+    Users whose index is not built yet are skipped: building it lists their
+    memories, written ones included. Queued placeholders are never indexed.
+
+    Args:
+        user_id: The user identifier
+        memories: List of memory dictionaries with 'id' and 'memory' keys
+    """
+    _delta(user_id, 'add', [m for m in memories if not _is_pending(m)])
+
+def remove_memories(user_id: str, memory_ids: list):
+    """
+    Remove memories from the user's memory index.
+
+    Args:
+        user_id: The user identifier
+        memory_ids: List of memory identifiers to drop
+    """
+    _delta(user_id, 'remove', list(memory_ids))
+
+def _loaded_corpus(user_id: str):
+    """Return the user's built memory index, or None when it must be built (or rebuilt) from a listing."""
+    if settings.INDEX_DIR:
+        store = segment_store(user_id)
+        return store if store.seeded else None
+    index = user_indexes.peek(user_id)
+    refresh = settings.SEARCH_INDEX_REFRESH_SECONDS
+    if index is not None and refresh and time.monotonic() - index.created > refresh:
+        return None
+    if isinstance(index, ShardedIndex) and index.lost:
+        return None
+    return index
+
+def memory_index_ready(user_id: str) -> bool:
+    """Tell whether a user's memories can be searched without listing them first."""
+    return _loaded_corpus(user_id) is not None
+
+def _seed(user_id: str, memories: list = None):
+    """
+    Build the user's memory index from a listing and install it.
+
+    The listing defaults to get_all_memories. Writes that land while it is
+    read and indexed are recorded and replayed onto the new index before it
+    is installed, so none are lost to the swap.
+    """
+    from .memory import get_all_memories
+
+    log = []
+    with _seed_lock:
+        _seeding.setdefault(user_id, []).append(log)
+    try:
+        if memories is None:
+            memories = get_all_memories(user_id)
+        memories = [m for m in memories if not _is_pending(m)]
+        corpus = segment_store(user_id) if settings.INDEX_DIR else _new_index(len(memories))
+        _upsert(corpus, memories, seeded=True)
+        with _seed_lock:
+            for op, items in log:
+                _apply(corpus, op, items)
+            if not settings.INDEX_DIR:
+                user_indexes.set(user_id, corpus)
+    finally:
+        with _seed_lock:
+            logs = [other for other in _seeding[user_id] if other is not log]
+            if logs:
+                _seeding[user_id] = logs
+            else:
+                del _seeding[user_id]
+    logger.info(f"Indexed {len(memories)} memories for user {user_id}")
+    return corpus
+
+def _new_index(size: int):
+    """An empty memory index, held in shard worker processes for users with more than settings.BM25_SHARD_THRESHOLD memories."""
+    if settings.BM25_SHARD_THRESHOLD and size > settings.BM25_SHARD_THRESHOLD:
+        return ShardedIndex(get_shard_pool(settings.BM25_SHARDS))
+    return BM25Index()
+
+def _memory_corpus(user_id: str, memories: list = None):
+    """
+    Return the user's memory index, building it on first use and when due for a refresh.
+
+    Args:
+        user_id: The user identifier
+        memories: Optional listing to build from, or to add to an index that is already built
+    """
+    corpus = _loaded_corpus(user_id)
+    if corpus is None:
+        return _seed(user_id, memories)
+    if memories:
+        _upsert(corpus, [m for m in memories if not _is_pending(m)])
+    return corpus
+
+def _turn_result(i: int, role: str, content: str, timestamp):
+    return {
+        'type': 'conversation',
+        'index': i,
+        'role': role,
+        'timestamp': timestamp,
+        'content': content
+    }
+
+def segment_store(user_id: str) -> SegmentStore:
+    """Return the on-disk segment store for a user under settings.INDEX_DIR."""
+    with _segment_lock:
+        store = _segment_stores.get(user_id)
+        if store is None:
+            directory = os.path.join(settings.INDEX_DIR, hashlib.sha1(user_id.encode('utf-8')).hexdigest())
+            store = SegmentStore(directory, merge_threshold=settings.INDEX_MERGE_THRESHOLD)
+            _segment_stores[user_id] = store
+            while len(_segment_stores) > user_indexes.max_users:
+                _segment_stores.popitem(last=False)[1].close()
+        else:
+            _segment_stores.move_to_end(user_id)
+        return store
+
+class _SparseSnapshot:
+    """
+    CSR snapshot of a user's memory index that follows later writes.
+
+    Documents changed since the snapshot was taken (from the index's change
+    journal) are masked out of the matrix and scored from the index itself,
+    so the snapshot stays exact while it is reused across writes.
+    """
+
+    def __init__(self, index: BM25Index):
+        from .sparse_bm25 import SparseBM25
+
+        with index._lock:
+            self.revision = index.revision
+            self.scorer, self.keys = SparseBM25.from_index(index)
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.index = index
+
+    def changed(self):
+        """Return the keys changed since the snapshot, or None when it is due for a rebuild."""
+        changed = self.index.changed_since(self.revision)
+        if changed is None or len(changed) > max(_SPARSE_DELTA_MIN, _SPARSE_DELTA_FRACTION * len(self.keys)):
+            return None
+        return changed
+
+    def top_scores(self, query_token_lists: list, top_n: int, stats, changed: set) -> list:
+        """Score every query; returns one {key: score} per query covering its possible top_n."""
+        scores = self.scorer.get_batch_scores(query_token_lists, stats)
+        stale = [self.rows[key] for key in changed if key in self.rows]
+        if stale:
+            scores[:, stale] = 0.0
+        results = []
+        for tokens, row in zip(query_token_lists, scores):
+            top = _top_scores(row, self.keys, top_n)
+            top.update(self.index.score_keys(tokens, changed, stats))
+            results.append(top)
+        return results
+
+def _sparse_scorer(user_id: str, index: BM25Index):
+    """
+    Return the CSR snapshot of the user's index and the keys changed since it was taken.
+
+    The matrix is built from the index's postings without re-tokenizing,
+    and rebuilt only when the index was replaced or too much of it changed.
+    """
+    with _sparse_lock:
+        snapshot = _sparse_snapshots.get(user_id)
+        changed = snapshot.changed() if snapshot is not None and snapshot.index is index else None
+        if changed is None:
+            snapshot, changed = _SparseSnapshot(index), set()
+            _sparse_snapshots.pop(user_id, None)
+            _sparse_snapshots[user_id] = snapshot
+            while len(_sparse_snapshots) > user_indexes.max_users:
+                _sparse_snapshots.pop(next(iter(_sparse_snapshots)))
+        return snapshot, changed
+
+class _Part:
+    """
+    One corpus of a search: the user's memories, archived memories or the
+    conversation window. The parts of a search are scored with statistics
+    over the union of their documents, so results equal those of a single
+    BM25Okapi model, while each part keeps its own index.
+    """
+
+    def __init__(self, kind: str, corpus, describe, sparse=None):
+        self.kind = kind
+        self.corpus = corpus
+        self.describe = describe
+        self.sparse = sparse
+
+
+def _list_part(kind: str, docs: list, tokens_for, describe) -> _Part:
+    """Index a list of documents in a throwaway part; earlier documents win ties, as in a list ranking."""
+    index = BM25Index()
+    for i in range(len(docs) - 1, -1, -1):
+        index.add(i, tokens_for(docs[i]), payload=describe(i, docs[i]))
+    return _Part(kind, index, index.payload)
+
+def _memory_list_part(memories: list) -> _Part:
+    return _list_part('memory', memories, _memory_tokens, lambda i, m: {'type': 'memory', 'id': m['id'], 'meta': m})
+
+def _conversation_part(conversation_history: list) -> _Part:
+    return _list_part('conversation', conversation_history, lambda turn: _turn_tokens(turn[0], turn[1]), lambda i, turn: _turn_result(i, *turn))
+
+def _user_memory_part(user_id: str, memories: list) -> _Part:
+    """The user's memory index (on-disk segments when settings.INDEX_DIR is set, sharded when it is large)."""
+    corpus = _memory_corpus(user_id, memories)
+    describe = lambda key: {'type': 'memory', 'id': key[1], 'meta': corpus.payload(key)}
+    if isinstance(corpus, BM25Index):
+        return _Part('memory', corpus, describe, sparse=lambda: _sparse_scorer(user_id, corpus))
+    return _Part('memory', corpus, describe)
+
+def _pending_memories(user_id: str, memories: list) -> list:
+    if memories is not None:
+        return [m for m in memories if _is_pending(m)]
+    from .memory import pending_memories
+
+    return pending_memories(user_id)
+
+def _parts(memories: list, conversation_history: list, user_id: str) -> list:
+    parts = []
+    if user_id is not None and (memories is None or memories):
+        parts.append(_user_memory_part(user_id, memories))
+        # Queued writes are searched from their placeholders until the ingest queue settles them
+        pending = _pending_memories(user_id, memories)
+        if pending:
+            parts.append(_memory_list_part(pending))
+    elif memories:
+        parts.append(_memory_list_part(memories))
+    if conversation_history:
+        parts.append(_conversation_part(conversation_history))
+    return parts
+
+def _top_scores(scores, keys: list, k: int) -> dict:
+    """Map keys to scores for the matched documents that can rank in the top k, ties included."""
+    import numpy as np
+
+    matched = np.flatnonzero(scores)
+    if len(matched) > k:
+        threshold = np.partition(scores[matched], -k)[-k]
+        matched = matched[scores[matched] >= threshold]
+    return {keys[i]: float(scores[i]) for i in matched.tolist()}
+
+def _part_scores(part: _Part, query_token_lists: list, top_n: int, stats, backend: str) -> list:
+    """Score one part for every query; returns one {key: score} per query covering its possible top_n."""
+    corpus = part.corpus
+    if isinstance(corpus, SegmentStore):
+        return [corpus.get_scores(tokens, stats) for tokens in query_token_lists]
+    if isinstance(corpus, ShardedIndex):
+        return corpus.batch_top_k(query_token_lists, top_n, stats)
+    if backend == "sparse":
+        from .sparse_bm25 import SparseBM25
+
+        if part.sparse:
+            snapshot, changed = part.sparse()
+            return snapshot.top_scores(query_token_lists, top_n, stats, changed)
+        scorer, keys = SparseBM25.from_index(corpus)
+        return [_top_scores(row, keys, top_n) for row in scorer.get_batch_scores(query_token_lists, stats)]
+    return [corpus.top_k(tokens, top_n, stats) for tokens in query_token_lists]
+
+def _merge_parts(parts: list, part_scores: list, top_n: int, pad: bool):
+    """
+    Rank scored documents across parts: higher score first, then earlier
+    part, then newer document. Unless pad is False, unmatched documents
+    fill the ranking at score 0.0 when fewer than top_n documents match.
+    """
+    candidates = []
+    for part_no, (part, scores) in enumerate(zip(parts, part_scores)):
+        corpus = part.corpus
+        for key, score in scores.items():
+            candidates.append((-score, part_no, -corpus.order(key), key))
+        if pad:
+            for key in corpus.newest(top_n, exclude=scores):
+                candidates.append((0.0, part_no, -corpus.order(key), key))
+    best = heapq.nsmallest(top_n, candidates, key=lambda candidate: candidate[:3])
+    return [(part_no, key, -score) for score, part_no, _, key in best]
+
+def _search_parts(query_token_lists: list, top_n: int, parts: list, backend: str, pad: bool = True) -> list:
+    """Return, per query, the top_n (part number, key, score) triples across the parts, best first."""
+    terms = {token for tokens in query_token_lists for token in tokens}
+    stats = corpus_stats([part.corpus for part in parts], terms, parts[0].corpus.epsilon)
+    per_part = [_part_scores(part, query_token_lists, top_n, stats, backend) for part in parts]
+    return [
+        _merge_parts(parts, [scores[query] for scores in per_part], top_n, pad)
+        for query in range(len(query_token_lists))
+    ]
+
+def _cold_memories(user_id: str, hot=None) -> list:
+    """Load a user's archived memories, skipping those also in the hot memory corpus."""
+    from .database import load_cold_memories
+
+    try:
+        return [m for m in load_cold_memories(user_id) if hot is None or _memory_key(m['id']) not in hot]
+    except Exception as e:
+        logger.error(f"Could not load cold memories for user {user_id}: {e}")
+        return []
+
+def _record_retrievals(results: list, user_id: str):
+    """Feed retrieved memory ids into the access statistics used for tiering (queued, never blocking)."""
+    from .database import record_memory_access
+
+    memory_ids = [r['id'] for r in results if r['type'] == 'memory' and not str(r['id']).startswith('pending:')]
+    try:
+        record_memory_access(memory_ids, user_id=user_id)
+    except Exception as e:
+        logger.error(f"Could not record memory access: {e}")
+
+def bm25_hybrid_search(prompt: str, memories: list, conversation_history: list, top_n: int = 10, user_id: str = None, backend: str = None):
     """
     Perform BM25 hybrid search across memories and conversation history.
-    
+
+    When a user_id is given, memories are scored against that user's
+    memory index. It is built once from a listing and then kept current
+    by memory writes, so a search does no work per memory; pass memories
+    as None to search it without listing (see memory_index_ready). A given
+    listing builds the index when it is missing and is added to it
+    otherwise. With settings.INDEX_DIR set, the index lives in mmap'd
+    on-disk segments shared by every worker, and indexes of more than
+    settings.BM25_SHARD_THRESHOLD memories are held by shard worker
+    processes that receive the writes as deltas. Without a user_id a
+    throwaway index is built from the given memories. The conversation
+    window is always indexed on its own (from cached tokens) and scored
+    with statistics over memories and window together, so the memory
+    index is pruned with MaxScore as usual.
+
+    For a user's memory search, archived (cold) memories are searched too
+    when no hot memory scores settings.COLD_SCORE_THRESHOLD, and retrieved
+    memories are recorded in the access statistics that drive tiering.
+
     Args:
         prompt: The search query
-        memories: List of memory dictionaries
+        memories: List of memory dictionaries, or None to search the user's memory index as it is
         conversation_history: List of conversation tuples (role, content, timestamp)
         top_n: Number of top results to return
-        
+        user_id: Optional user identifier whose memory index should be used
+        backend: Scoring backend, "index" or "sparse" (defaults to settings.SEARCH_BACKEND)
+
     Returns:
         List of search results with metadata
     """
-    docs = []
-    doc_meta = []
-    
-    # Add memories to search corpus
-    for m in memories:
-        docs.append(m['memory'])
-        doc_meta.append({'type': 'memory', 'id': m['id'], 'meta': m})
-    
-    # Add conversation history to search corpus
-    for i, (role, content, timestamp) in enumerate(conversation_history):
-        docs.append(content)
-        doc_meta.append({
-            'type': 'conversation', 
-            'index': i, 
-            'role': role, 
-            'timestamp': timestamp, 
-            'content': content
-        })
-    
+    searches_memories = user_id is not None and (memories is None or memories or not conversation_history)
+
     # Handle empty corpus case
-    if not docs:
+    if not memories and not conversation_history and not searches_memories:
         return []
-    
+
     # Perform BM25 search
-    tokenized_docs = [nltk.word_tokenize(doc.lower()) for doc in docs]
-    bm25 = BM25Okapi(tokenized_docs)
-    tokenized_query = nltk.word_tokenize(prompt.lower())
-    scores = bm25.get_scores(tokenized_query)
-    
+    backend = backend or settings.SEARCH_BACKEND
+    query_tokens = _tokenize(prompt)
+    parts = _parts(memories, conversation_history, user_id)
+    ranked = _search_parts([query_tokens], top_n, parts, backend)[0] if parts else []
+
+    if searches_memories and settings.COLD_SCORE_THRESHOLD:
+        best = max((score for part_no, _, score in ranked if parts[part_no].kind == 'memory'), default=0.0)
+        if best < settings.COLD_SCORE_THRESHOLD:
+            hot = parts[0].corpus if parts and parts[0].kind == 'memory' else None
+            cold = _cold_memories(user_id, hot)
+            if cold:
+                # Archived memories are searched as a throwaway part, so they never enter the hot indexes
+                parts.insert(sum(part.kind == 'memory' for part in parts), _memory_list_part(cold))
+                ranked = _search_parts([query_tokens], top_n, parts, backend)[0]
+
     # Get top results
-    top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_n]
-    results = [doc_meta[i] for i in top_indices]
-    
-    return results 
\ No newline at end of file
+    results = [parts[part_no].describe(key) for part_no, key, _ in ranked]
+    if user_id is not None:
+        _record_retrievals(results, user_id)
+
+    return results
+
+def bm25_batch_search(prompts: list, memories: list, conversation_history: list, top_n: int = 10, user_id: str = None):
+    """
+    Run several BM25 searches over the same corpus in one sparse matrix product.
+
+    Args:
+        prompts: List of search queries
+        memories: List of memory dictionaries, or None to search the user's memory index as it is
+        conversation_history: List of conversation tuples (role, content, timestamp)
+        top_n: Number of top results to return per prompt
+        user_id: Optional user identifier whose memory index should be used
+
+    Returns:
+        List of result lists, one per prompt, in the same format as bm25_hybrid_search
+    """
+    parts = _parts(memories, conversation_history, user_id)
+    if not parts:
+        return [[] for _ in prompts]
+    if not prompts:
+        return []
+
+    ranked = _search_parts([_tokenize(prompt) for prompt in prompts], top_n, parts, "sparse")
+    return [[parts[part_no].describe(key) for part_no, key, _ in query_ranked] for query_ranked in ranked]
+
+async def abm25_hybrid_search(*args, **kwargs):
+    """
+    Run bm25_hybrid_search in a worker thread so scoring never blocks the event loop.
+
+    Takes the same arguments and returns the same results as bm25_hybrid_search.
+    """
+    return await asyncio.to_thread(bm25_hybrid_search, *args, **kwargs)
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60):
+    """
+    Fuse several rankings with reciprocal rank fusion.
+
+    Args:
+        rankings: List of rankings, each a list of document keys best-first
+        k: RRF damping constant
+
+    Returns:
+        List of (key, fused_score) tuples, best first
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def fused_hybrid_search(prompt: str, user_id: str, conversation_history: list, top_n: int = 10, vector_k: int = None, rrf_k: int = None):
+    """
+    Hybrid retrieval fusing vector search and BM25 with reciprocal rank fusion.
+
+    Memory candidates come from the vector store's nearest neighbours and a
+    BM25 ranking of the user's memory index (built once from the listing,
+    bounded by settings.MEMORY_MAX_CANDIDATES, and kept current by write
+    deltas) plus queued placeholders and the given conversation window.
+    When no memory scores settings.COLD_SCORE_THRESHOLD, a BM25 ranking of
+    the user's archived (cold) memories joins the fusion.
+
+    Args:
+        prompt: The search query
+        user_id: The user identifier
+        conversation_history: List of conversation tuples (role, content, timestamp)
+        top_n: Number of fused results to return
+        vector_k: Number of nearest memories to request from the vector store
+        rrf_k: RRF damping constant
+
+    Returns:
+        List of search results in the same format as bm25_hybrid_search
+    """
+    from .memory import search_memories
+
+    vector_k = vector_k or settings.VECTOR_SEARCH_K
+    rrf_k = rrf_k or settings.RRF_K
+
+    vector_memories = search_memories(prompt, user_id, limit=vector_k)
+    memory_meta = {_memory_key(m['id']): m for m in vector_memories}
+    parts = _parts(None, conversation_history, user_id)
+
+    # Lexical ranking over the user's memory index, queued placeholders and the given conversation window
+    ranked = _search_parts([_tokenize(prompt)], max(top_n, vector_k), parts, "index", pad=False)[0]
+    lexical, conversation_meta, best = [], {}, 0.0
+    for part_no, key, score in ranked:
+        result = parts[part_no].describe(key)
+        if parts[part_no].kind == 'memory':
+            key = _memory_key(result['id'])
+            memory_meta.setdefault(key, result['meta'])
+            best = max(best, score)
+        else:
+            key = ('conversation', key)
+            conversation_meta[key] = result
+        lexical.append(key)
+    semantic = [_memory_key(m['id']) for m in vector_memories]
+    rankings = [semantic, lexical]
+
+    if settings.COLD_SCORE_THRESHOLD and best < settings.COLD_SCORE_THRESHOLD:
+        cold = _cold_memories(user_id, parts[0].corpus)
+        if cold:
+            # Cold memories stay out of the persistent index; RRF only needs their order
+            for m in cold:
+                memory_meta[_memory_key(m['id'])] = m
+            rankings.append([_memory_key(r['id']) for r in bm25_hybrid_search(prompt, cold, [], top_n=max(top_n, vector_k))])
+
+    results = []
+    for key, _ in reciprocal_rank_fusion(rankings, k=rrf_k):
+        if key[0] == 'memory':
+            results.append({'type': 'memory', 'id': key[1], 'meta': memory_meta[key]})
+        else:
+            results.append(conversation_meta[key])
+        if len(results) >= top_n:
+            break
+    _record_retrievals(results, user_id)
+    return results
+
+async def afused_hybrid_search(*args, **kwargs):
+    """
+    Run fused_hybrid_search in a worker thread so scoring never blocks the event loop.
+
+    Takes the same arguments and returns the same results as fused_hybrid_search.
+    """
+    return await asyncio.to_thread(fused_hybrid_search, *args, **kwargs)
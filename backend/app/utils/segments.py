@@ -0,0 +1,738 @@
+import os
+import json
+import mmap
+import time
+import uuid
+import fcntl
+import struct
+import hashlib
+import logging
+import threading
+import numpy as np
+from .bm25 import corpus_stats
+
+logger = logging.getLogger("segments")
+
+# magic, format version, n_docs, n_terms, n_postings, then section offsets:
+# doc_len, term_ptr, terms, post_ptr, doc_ids, tfs, fwd_ptr, fwd_terms, meta, end of file
+_HEADER = struct.Struct('<8sIIIQ10Q')
+_MAGIC = b'BM25SEG\x00'
+_FORMAT_VERSION = 2
+_MANIFEST = 'manifest.json'
+_LOCK = 'LOCK'
+_REFRESH_ATTEMPTS = 3
+
+
+def content_version(text: str) -> str:
+    """Return a process-independent version marker for a document's text."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def write_segment(path: str, docs: list, sync: bool = False):
+    """
+    Write an immutable segment file.
+
+    The file holds a sorted term dictionary, CSR postings (doc ids and term
+    frequencies per term), a doc-length array and a forward index (term rows
+    per doc), laid out so every section can be read in place from a
+    read-only mmap.
+
+    Args:
+        path: Destination file; written to a temporary name and renamed into place
+        docs: List of (key, version, term_freqs, length, payload) tuples, where
+            key is a tuple of strings, term_freqs maps term to frequency and
+            payload is a JSON-serializable object (or None)
+        sync: fsync the file before it is renamed into place
+    """
+    postings = {}
+    doc_len = np.zeros(len(docs), dtype=np.uint32)
+    meta = []
+    for doc, (key, version, term_freqs, length, payload) in enumerate(docs):
+        for term, freq in term_freqs.items():
+            postings.setdefault(term.encode('utf-8'), []).append((doc, freq))
+        doc_len[doc] = length
+        meta.append([list(key), version, payload])
+
+    terms = sorted(postings)
+    post_ptr = np.zeros(len(terms) + 1, dtype=np.uint64)
+    doc_ids, tfs = [], []
+    for row, term in enumerate(terms):
+        for doc, freq in postings[term]:
+            doc_ids.append(doc)
+            tfs.append(freq)
+        post_ptr[row + 1] = len(doc_ids)
+    _write_arrays(path, doc_len, terms, post_ptr, np.asarray(doc_ids, dtype=np.uint32), np.asarray(tfs, dtype=np.uint32), meta, sync)
+
+
+def merge_segments(path: str, segments: list, live: list, sync: bool = False) -> int:
+    """
+    Write the live documents of segments, oldest first, as one segment.
+
+    Postings are remapped and re-sorted as whole arrays; only the term
+    dictionaries and document metadata are handled per entry.
+
+    Args:
+        path: Destination file
+        segments: Segments to merge, oldest first
+        live: Boolean live-document mask per segment
+        sync: fsync the file before it is renamed into place
+
+    Returns:
+        Number of documents written
+    """
+    terms, rows, docs, tfs, doc_len, meta = [], [], [], [], [], []
+    doc_base = 0
+    for segment, mask in zip(segments, live):
+        new_ids = np.cumsum(mask, dtype=np.int64) - 1 + doc_base
+        keep = mask[segment._doc_ids]
+        term_rows = np.repeat(np.arange(segment.n_terms, dtype=np.int64), np.diff(segment._post_ptr.astype(np.int64)))
+        rows.append(term_rows[keep] + len(terms))
+        docs.append(new_ids[segment._doc_ids[keep]])
+        tfs.append(segment._tfs[keep])
+        terms.extend(segment._term(row) for row in range(segment.n_terms))
+        doc_len.append(segment.doc_len[mask])
+        segment_meta = segment.meta
+        meta.extend([list(segment_meta[doc][0]), segment_meta[doc][1], segment_meta[doc][2]] for doc in np.flatnonzero(mask).tolist())
+        doc_base += int(mask.sum())
+
+    vocabulary = np.empty(len(terms), dtype=object)
+    vocabulary[:] = terms
+    vocabulary, inverse = np.unique(vocabulary, return_inverse=True)
+    rows = inverse.reshape(-1)[np.concatenate(rows)]
+    docs = np.concatenate(docs)
+    tfs = np.concatenate(tfs)
+    order = np.lexsort((docs, rows))
+    rows, docs, tfs = rows[order], docs[order], tfs[order]
+    # Terms whose every posting was dead are dropped from the dictionary
+    counts = np.bincount(rows, minlength=len(vocabulary))
+    used = counts > 0
+    post_ptr = np.zeros(int(used.sum()) + 1, dtype=np.uint64)
+    post_ptr[1:] = np.cumsum(counts[used])
+    _write_arrays(
+        path,
+        np.concatenate(doc_len).astype(np.uint32),
+        list(vocabulary[used]),
+        post_ptr,
+        docs.astype(np.uint32),
+        tfs.astype(np.uint32),
+        meta,
+        sync,
+    )
+    return doc_base
+
+
+def _write_arrays(path: str, doc_len, terms: list, post_ptr, doc_ids, tfs, meta: list, sync: bool):
+    term_ptr = np.zeros(len(terms) + 1, dtype=np.uint64)
+    term_ptr[1:] = np.cumsum([len(term) for term in terms])
+    # Forward index: the term rows of each document, in document order
+    term_rows = np.repeat(np.arange(len(terms), dtype=np.uint32), np.diff(post_ptr.astype(np.int64)))
+    order = np.argsort(doc_ids, kind='stable')
+    fwd_ptr = np.zeros(len(doc_len) + 1, dtype=np.uint64)
+    fwd_ptr[1:] = np.cumsum(np.bincount(doc_ids, minlength=len(doc_len)))
+
+    sections = [
+        doc_len.tobytes(),
+        term_ptr.tobytes(),
+        b''.join(terms),
+        post_ptr.tobytes(),
+        doc_ids.tobytes(),
+        tfs.tobytes(),
+        fwd_ptr.tobytes(),
+        term_rows[order].tobytes(),
+        json.dumps(meta, default=str).encode('utf-8'),
+    ]
+    offsets = []
+    position = _HEADER.size
+    for section in sections:
+        position += -position % 8  # keep numeric sections 8-byte aligned
+        offsets.append(position)
+        position += len(section)
+    offsets.append(position)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, len(doc_len), len(terms), len(doc_ids), *offsets))
+        for offset, section in zip(offsets, sections):
+            f.write(b'\x00' * (offset - f.tell()))
+            f.write(section)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """Read-only view of a segment file through a shared mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._mmap, 0)
+        if header[0] != _MAGIC or header[1] != _FORMAT_VERSION:
+            raise ValueError(f"Not a segment file: {path}")
+        self.n_docs, self.n_terms, n_postings = header[2:5]
+        offsets = header[5:]
+        self.doc_len = np.frombuffer(self._mmap, dtype=np.uint32, count=self.n_docs, offset=offsets[0])
+        self._term_ptr = np.frombuffer(self._mmap, dtype=np.uint64, count=self.n_terms + 1, offset=offsets[1])
+        self._terms_offset = offsets[2]
+        self._post_ptr = np.frombuffer(self._mmap, dtype=np.uint64, count=self.n_terms + 1, offset=offsets[3])
+        self._doc_ids = np.frombuffer(self._mmap, dtype=np.uint32, count=n_postings, offset=offsets[4])
+        self._tfs = np.frombuffer(self._mmap, dtype=np.uint32, count=n_postings, offset=offsets[5])
+        self._fwd_ptr = np.frombuffer(self._mmap, dtype=np.uint64, count=self.n_docs + 1, offset=offsets[6])
+        self._fwd_terms = np.frombuffer(self._mmap, dtype=np.uint32, count=n_postings, offset=offsets[7])
+        self._meta_bounds = (offsets[8], offsets[9])
+        self._meta = None
+
+    def _term(self, row: int) -> bytes:
+        start = self._terms_offset + int(self._term_ptr[row])
+        return self._mmap[start:self._terms_offset + int(self._term_ptr[row + 1])]
+
+    def find(self, term: str):
+        """Binary-search the term dictionary; returns the term's row or None."""
+        target = term.encode('utf-8')
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and self._term(lo) == target:
+            return lo
+        return None
+
+    def terms(self):
+        """Yield every term in dictionary order."""
+        for row in range(self.n_terms):
+            yield self._term(row).decode('utf-8')
+
+    def doc_terms(self, doc: int) -> list:
+        """Return the distinct terms of a document."""
+        rows = self._fwd_terms[int(self._fwd_ptr[doc]):int(self._fwd_ptr[doc + 1])]
+        return [self._term(row).decode('utf-8') for row in rows.tolist()]
+
+    def postings(self, row: int):
+        """Return (doc_ids, term_freqs) arrays for a term row."""
+        start, end = int(self._post_ptr[row]), int(self._post_ptr[row + 1])
+        return self._doc_ids[start:end], self._tfs[start:end]
+
+    def doc_freqs(self, live: np.ndarray) -> np.ndarray:
+        """Return per-term counts of live documents, in dictionary order."""
+        if not self.n_terms:
+            return np.zeros(0, dtype=np.int64)
+        return np.add.reduceat(live[self._doc_ids].astype(np.int64), self._post_ptr[:-1].astype(np.int64))
+
+    @property
+    def meta(self) -> list:
+        """(key, version, payload) per document, decoded on first use."""
+        if self._meta is None:
+            start, end = self._meta_bounds
+            self._meta = [(tuple(entry[0]), entry[1], entry[2] if len(entry) > 2 else None) for entry in json.loads(self._mmap[start:end])]
+        return self._meta
+
+    def close(self):
+        self._doc_ids = self._tfs = self.doc_len = self._term_ptr = self._post_ptr = None
+        self._fwd_ptr = self._fwd_terms = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A caller still holds a view; the mapping is released with it
+            pass
+
+
+def _live_masks(segments: list, deletes: list):
+    """Return ({key: (position, doc)}, live mask per segment): the newest copy of a key wins and tombstones kill older copies."""
+    deleted = {tuple(key): generation for key, generation in deletes}
+    locations = {}
+    live = []
+    for position in range(len(segments) - 1, -1, -1):
+        segment = segments[position]
+        mask = np.zeros(segment.n_docs, dtype=bool)
+        for doc, (key, _, _) in enumerate(segment.meta):
+            if key in locations or deleted.get(key, -1) > segment.generation:
+                continue
+            locations[key] = (position, doc)
+            mask[doc] = True
+        live.append(mask)
+    live.reverse()
+    return locations, live
+
+
+class SegmentStore:
+    """
+    On-disk BM25 index for one corpus, made of immutable mmap'd segments.
+
+    Each document carries a version and an optional JSON payload returned
+    with it at search time. New documents are appended as a new segment;
+    re-adding a key supersedes its copy in older segments, and deletions
+    are recorded in the manifest as tombstones. Once the number of segments
+    exceeds merge_threshold, a background thread merges all live documents
+    into a single segment. Every process opening the same directory maps
+    the same files, so workers share postings through the OS page cache
+    instead of each building its own index. Writers serialize on a lock
+    file; readers pick up new manifests on their next call.
+
+    The manifest also carries the corpus statistics (document count, total
+    length and a histogram of document frequencies), updated by every write
+    from the forward index of the documents it touches, so searches compute
+    document frequencies for query terms only. Request-path writes are not
+    fsynced, and segments replaced by a merge are deleted only after
+    retire_after seconds, so readers holding an older manifest can still
+    open them.
+
+    Scores match BM25Index (and rank_bm25's BM25Okapi) over the live documents.
+    """
+
+    def __init__(self, directory: str, merge_threshold: int = 8, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25, retire_after: float = 60.0):
+        self.directory = directory
+        self.merge_threshold = merge_threshold
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.retire_after = retire_after
+        self._manifest_stamp = None
+        self._segments = []
+        self._live = []
+        self._locations = {}
+        self._seeded = False
+        self._stats = None
+        self._doc_freq = {}
+        self._merge_thread = None
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    # Manifest handling
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, _MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'generation': 0, 'segments': [], 'deletes': []}
+
+    def _write_manifest(self, manifest: dict, sync: bool = False):
+        path = os.path.join(self.directory, _MANIFEST)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(manifest, f)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def _exclusive(self):
+        lock_file = open(os.path.join(self.directory, _LOCK), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _sweep(self, manifest: dict) -> list:
+        """Drop retired segments past their grace period from the manifest; returns the files to delete."""
+        now = time.time()
+        retired = manifest.get('retired', [])
+        manifest['retired'] = [entry for entry in retired if now - entry['at'] <= self.retire_after]
+        return [entry['name'] for entry in retired if now - entry['at'] > self.retire_after]
+
+    def _commit(self, manifest: dict, sync: bool = False, retire: list = ()):
+        """Write the manifest, retiring the named segments, then delete the retired segments it no longer lists."""
+        expired = self._sweep(manifest)
+        now = time.time()
+        manifest['retired'] += [{'name': name, 'at': now} for name in retire]
+        self._write_manifest(manifest, sync)
+        for name in expired:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def refresh(self):
+        """Reload the manifest and segments if another writer changed them."""
+        with self._lock:
+            for attempt in range(_REFRESH_ATTEMPTS):
+                try:
+                    stat = os.stat(os.path.join(self.directory, _MANIFEST))
+                    stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+                except FileNotFoundError:
+                    stamp = None
+                if stamp == self._manifest_stamp and stamp is not None:
+                    return
+                try:
+                    self._load(self._read_manifest())
+                except FileNotFoundError:
+                    # The manifest read was replaced and its retired segments deleted; read the new one
+                    if attempt == _REFRESH_ATTEMPTS - 1:
+                        raise
+                    continue
+                self._manifest_stamp = stamp
+                return
+
+    def _load(self, manifest: dict):
+        opened = {segment.path: segment for segment in self._segments}
+        segments = []
+        try:
+            for entry in manifest['segments']:
+                path = os.path.join(self.directory, entry['name'])
+                segment = opened.pop(path, None) or Segment(path)
+                segment.generation = entry['generation']
+                segments.append(segment)
+        except FileNotFoundError:
+            for segment in segments:
+                if segment not in self._segments:
+                    segment.close()
+            raise
+        for segment in opened.values():
+            segment.close()
+
+        self._locations, self._live = _live_masks(segments, manifest['deletes'])
+        self._segments = segments
+        self._seeded = manifest.get('seeded', False)
+        self._doc_freq = {}
+        stats = manifest.get('stats')
+        if stats is None:
+            self._stats = self._full_stats()
+        else:
+            self._stats = (stats['n_docs'], stats['total_len'], {int(freq): count for freq, count in stats['df_hist']})
+
+    def _full_stats(self):
+        """Return (n_docs, total_len, df_histogram) by a pass over every vocabulary, for manifests written without them."""
+        doc_freq = {}
+        total_len = 0
+        for segment, live in zip(self._segments, self._live):
+            total_len += int(segment.doc_len[live].sum())
+            for term, freq in zip(segment.terms(), segment.doc_freqs(live).tolist()):
+                if freq:
+                    doc_freq[term] = doc_freq.get(term, 0) + freq
+        histogram = {}
+        for freq in doc_freq.values():
+            histogram[freq] = histogram.get(freq, 0) + 1
+        return len(self._locations), total_len, histogram
+
+    def _update_stats(self, manifest: dict, removed: list, added: list):
+        """
+        Record in the manifest the statistics after a write, from the loaded (pre-write) state.
+
+        Args:
+            manifest: Manifest being written
+            removed: Keys of live documents the write supersedes or deletes
+            added: (distinct terms, length) of every document the write adds
+        """
+        n_docs, total_len, histogram = self._stats
+        histogram = dict(histogram)
+        delta = {}
+        for key in removed:
+            position, doc = self._locations[key]
+            segment = self._segments[position]
+            for term in segment.doc_terms(doc):
+                delta[term] = delta.get(term, 0) - 1
+            n_docs -= 1
+            total_len -= int(segment.doc_len[doc])
+        for terms, length in added:
+            for term in terms:
+                delta[term] = delta.get(term, 0) + 1
+            n_docs += 1
+            total_len += length
+        for term, change in delta.items():
+            if not change:
+                continue
+            old = self._live_doc_freq(term)
+            if old:
+                histogram[old] -= 1
+                if not histogram[old]:
+                    del histogram[old]
+            if old + change:
+                histogram[old + change] = histogram.get(old + change, 0) + 1
+        manifest['stats'] = {'n_docs': n_docs, 'total_len': total_len, 'df_hist': sorted(histogram.items())}
+
+    # Writes
+
+    def append(self, docs: list, seeded: bool = False):
+        """
+        Write documents as a new segment, scheduling a merge if too many segments accumulate.
+
+        Args:
+            docs: List of (key, tokens, version) or (key, tokens, version, payload)
+                tuples; key must be a tuple of strings and payload JSON-serializable
+            seeded: Also mark the store as holding its whole corpus (see seeded)
+        """
+        if not docs and not seeded:
+            return
+        latest = {}
+        for key, tokens, version, *payload in docs:
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            # A key given twice keeps its last copy, as a later segment would
+            latest.pop(key, None)
+            latest[key] = (key, version, frequencies, len(tokens), payload[0] if payload else None)
+        segment_docs = list(latest.values())
+
+        with self._lock:
+            lock_file = self._exclusive()
+            try:
+                manifest = self._read_manifest()
+                if seeded:
+                    manifest['seeded'] = True
+                if segment_docs:
+                    self._load(manifest)
+                    self._update_stats(
+                        manifest,
+                        [key for key in latest if key in self._locations],
+                        [(frequencies, length) for _, _, frequencies, length, _ in segment_docs],
+                    )
+                    generation = manifest['generation'] + 1
+                    name = f"{generation:08d}-{uuid.uuid4().hex[:8]}.seg"
+                    write_segment(os.path.join(self.directory, name), segment_docs)
+                    manifest['generation'] = generation
+                    manifest['segments'].append({'name': name, 'generation': generation})
+                self._commit(manifest)
+            finally:
+                lock_file.close()
+            self._manifest_stamp = None
+            self.refresh()
+            if len(self._segments) > self.merge_threshold:
+                self._schedule_merge()
+
+    def delete(self, keys: list):
+        """Record tombstones for documents; they stop counting immediately."""
+        if not keys:
+            return
+        with self._lock:
+            lock_file = self._exclusive()
+            try:
+                manifest = self._read_manifest()
+                self._load(manifest)
+                self._update_stats(manifest, list({tuple(key) for key in keys if tuple(key) in self._locations}), [])
+                generation = manifest['generation'] + 1
+                manifest['generation'] = generation
+                deletes = {tuple(key): gen for key, gen in manifest['deletes']}
+                deletes.update((tuple(key), generation) for key in keys)
+                manifest['deletes'] = [[list(key), gen] for key, gen in deletes.items()]
+                self._commit(manifest)
+            finally:
+                lock_file.close()
+            self._manifest_stamp = None
+            self.refresh()
+
+    def _schedule_merge(self):
+        with self._lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            self._merge_thread = threading.Thread(target=self._merge_in_background, name="segment-merge", daemon=True)
+            self._merge_thread.start()
+
+    def _merge_in_background(self):
+        try:
+            self.merge()
+        except Exception as e:
+            logger.error(f"Could not merge segments in {self.directory}: {e}")
+
+    def wait_for_merge(self, timeout: float = None):
+        """Wait for a background merge, if one is running."""
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def merge(self):
+        """
+        Merge every live document into a single segment and drop the tombstones it applied.
+
+        The merged segment is written from a snapshot without holding the
+        write lock, so appends and deletes carry on meanwhile; it then
+        replaces the snapshot's segments in the current manifest, ahead of
+        any segment appended since. The replaced segments are retired, not
+        deleted, until retire_after has passed.
+        """
+        manifest = self._read_manifest()
+        if not manifest['segments'] or (len(manifest['segments']) < 2 and not manifest['deletes']):
+            return
+        segments = []
+        try:
+            for entry in manifest['segments']:
+                segment = Segment(os.path.join(self.directory, entry['name']))
+                segment.generation = entry['generation']
+                segments.append(segment)
+        except FileNotFoundError:
+            # Another writer merged these segments first
+            for segment in segments:
+                segment.close()
+            return
+        generation = manifest['generation']
+        name = f"{generation:08d}-{uuid.uuid4().hex[:8]}.seg"
+        path = os.path.join(self.directory, name)
+        try:
+            _, live = _live_masks(segments, manifest['deletes'])
+            merged = merge_segments(path, segments, live, sync=True)
+        finally:
+            for segment in segments:
+                segment.close()
+
+        merged_names = [entry['name'] for entry in manifest['segments']]
+        with self._lock:
+            lock_file = self._exclusive()
+            try:
+                current = self._read_manifest()
+                names = [entry['name'] for entry in current['segments']]
+                if names[:len(merged_names)] != merged_names:
+                    os.unlink(path)
+                    return
+                current['segments'] = [{'name': name, 'generation': generation}] + current['segments'][len(merged_names):]
+                # Tombstones up to the snapshot are applied; later ones still kill copies in the merged segment
+                current['deletes'] = [entry for entry in current['deletes'] if entry[1] > generation]
+                self._commit(current, sync=True, retire=merged_names)
+            finally:
+                lock_file.close()
+            self._manifest_stamp = None
+            self.refresh()
+        logger.info(f"Merged {len(merged_names)} segments ({merged} documents) in {self.directory}")
+
+    # Reads
+
+    def __len__(self):
+        self.refresh()
+        return len(self._locations)
+
+    def __contains__(self, key):
+        self.refresh()
+        return key in self._locations
+
+    @property
+    def segment_count(self) -> int:
+        self.refresh()
+        return len(self._segments)
+
+    @property
+    def seeded(self) -> bool:
+        """Whether the store was filled with its whole corpus, so searches need not list it first."""
+        with self._lock:
+            self.refresh()
+            return self._seeded
+
+    def version(self, key):
+        """Return the stored version of a live document, or None."""
+        with self._lock:
+            self.refresh()
+            location = self._locations.get(key)
+            return None if location is None else self._segments[location[0]].meta[location[1]][1]
+
+    def payload(self, key):
+        """Return the payload stored with a live document, or None."""
+        with self._lock:
+            self.refresh()
+            location = self._locations.get(key)
+            return None if location is None else self._segments[location[0]].meta[location[1]][2]
+
+    def versions(self) -> dict:
+        """Return {key: version} for every live document."""
+        with self._lock:
+            self.refresh()
+            return {key: self._segments[position].meta[doc][1] for key, (position, doc) in self._locations.items()}
+
+    def order(self, key):
+        """Return the position of a live document in append order (higher is newer), or None."""
+        with self._lock:
+            self.refresh()
+            location = self._locations.get(key)
+            return None if location is None else (location[0] << 32) | location[1]
+
+    def newest(self, n: int, exclude=()) -> list:
+        """Return up to n live document keys, most recently appended first, skipping those in exclude."""
+        with self._lock:
+            self.refresh()
+            found = []
+            for position in range(len(self._segments) - 1, -1, -1):
+                meta = self._segments[position].meta
+                for doc in range(len(meta) - 1, -1, -1):
+                    if len(found) >= n:
+                        return found
+                    key = meta[doc][0]
+                    if self._locations.get(key) == (position, doc) and key not in exclude:
+                        found.append(key)
+            return found
+
+    def _live_doc_freq(self, term: str) -> int:
+        freq = self._doc_freq.get(term)
+        if freq is None:
+            freq = 0
+            for segment, live in zip(self._segments, self._live):
+                row = segment.find(term)
+                if row is not None:
+                    freq += int(np.count_nonzero(live[segment.postings(row)[0]]))
+            self._doc_freq[term] = freq
+        return freq
+
+    @property
+    def total_len(self) -> int:
+        with self._lock:
+            self.refresh()
+            return self._stats[1]
+
+    def doc_freq(self, term: str) -> int:
+        """Return the number of live documents containing a term."""
+        with self._lock:
+            self.refresh()
+            return self._live_doc_freq(term)
+
+    def df_histogram(self) -> dict:
+        """Return {document frequency: number of terms with it} over the live documents."""
+        with self._lock:
+            self.refresh()
+            return self._stats[2]
+
+    def stats(self, terms):
+        """Return ({term: idf}, avgdl) over this store alone."""
+        return corpus_stats([self], terms, self.epsilon)
+
+    def idf(self, term: str) -> float:
+        return self.stats([term])[0][term]
+
+    def get_scores(self, query_tokens: list, stats=None) -> dict:
+        """
+        Score live documents against a tokenized query.
+
+        Args:
+            query_tokens: Tokenized query (repeated tokens count repeatedly)
+            stats: Optional ({term: idf}, avgdl) from corpus_stats(); defaults to this store's own
+
+        Returns:
+            Dict mapping document key to BM25 score for every live document
+            that contains at least one query token
+        """
+        with self._lock:
+            self.refresh()
+            if not self._locations:
+                return {}
+            idfs, avgdl = stats if stats is not None else self.stats(set(query_tokens))
+            if not avgdl:
+                return {}
+            k1, b = self.k1, self.b
+            scores = [np.zeros(segment.n_docs, dtype=np.float64) for segment in self._segments]
+            matched = [np.zeros(segment.n_docs, dtype=bool) for segment in self._segments]
+
+            for token in query_tokens:
+                idf = idfs.get(token, 0.0)
+                for position, segment in enumerate(self._segments):
+                    row = segment.find(token)
+                    if row is None:
+                        continue
+                    doc_ids, tfs = segment.postings(row)
+                    keep = self._live[position][doc_ids]
+                    doc_ids = doc_ids[keep]
+                    freqs = tfs[keep].astype(np.float64)
+                    norm = k1 * (1 - b + b * segment.doc_len[doc_ids] / avgdl)
+                    scores[position][doc_ids] += idf * (freqs * (k1 + 1) / (freqs + norm))
+                    matched[position][doc_ids] = True
+
+            result = {}
+            for position, segment in enumerate(self._segments):
+                meta = segment.meta
+                for doc in np.flatnonzero(matched[position]).tolist():
+                    result[meta[doc][0]] = float(scores[position][doc])
+            return result
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+            self._live = []
+            self._locations = {}
+            self._manifest_stamp = None
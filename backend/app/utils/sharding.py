@@ -0,0 +1,327 @@
+import time
+import atexit
+import logging
+import itertools
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from .bm25 import BM25Index, corpus_stats
+from .shards import stable_hash
+
+logger = logging.getLogger("sharding")
+
+# Shards held by this worker process: shard_id -> BM25Index
+_worker_shards = {}
+
+
+def _apply_shard(shard_id, adds: list, removes: list, create: bool = False):
+    """
+    Worker entry point: apply a delta to a resident shard.
+
+    Returns the distinct terms of every document the delta replaced or
+    removed, so the owner can keep its corpus statistics, or None when the
+    shard is not resident (the worker was restarted).
+    """
+    shard = _worker_shards.get(shard_id)
+    if shard is None:
+        if not create:
+            return None
+        shard = _worker_shards[shard_id] = BM25Index(journal_size=0)
+    retired = []
+    for key in removes:
+        if key in shard:
+            retired.append(shard.doc_terms[key])
+            shard.remove(key)
+    for key, tokens in adds:
+        if key in shard:
+            retired.append(shard.doc_terms[key])
+        shard.add(key, tokens)
+    return retired
+
+
+def _score_shard(shard_id, query_token_lists: list, k: int, stats):
+    """Worker entry point: return one {key: score} per query from a resident shard, or None if it is not resident."""
+    shard = _worker_shards.get(shard_id)
+    if shard is None:
+        return None
+    return [shard.top_k(tokens, k, stats) for tokens in query_token_lists]
+
+
+def _drop_shard(shard_id):
+    """Worker entry point: release a shard."""
+    _worker_shards.pop(shard_id, None)
+
+
+class ShardPool:
+    """
+    Worker processes holding index shards.
+
+    Each slot is a single-process executor, so shard n of every index always
+    lives on the same worker and the calls for it run in submission order.
+    """
+
+    def __init__(self, n_shards: int):
+        self.n_shards = n_shards
+        self._executors = [None] * n_shards
+        self._lock = threading.Lock()
+
+    def submit(self, slot: int, fn, *args):
+        with self._lock:
+            if self._executors[slot] is None:
+                self._executors[slot] = ProcessPoolExecutor(max_workers=1)
+            return self._executors[slot].submit(fn, *args)
+
+    def release(self, shard_ids: list):
+        """Drop shards from their workers, ignoring workers that are gone."""
+        with self._lock:
+            executors = list(self._executors)
+        for executor, shard_id in zip(executors, shard_ids):
+            if executor is None:
+                continue
+            try:
+                executor.submit(_drop_shard, shard_id)
+            except Exception:
+                pass
+
+    def shutdown(self):
+        """Stop all shard worker processes."""
+        with self._lock:
+            executors, self._executors = self._executors, [None] * self.n_shards
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+
+_index_ids = itertools.count()
+
+
+class ShardedIndex:
+    """
+    BM25 index whose documents live in shard worker processes.
+
+    Documents are assigned to shards by a stable hash of their key, and each
+    shard is a BM25Index owned by one worker of a ShardPool. Writes are sent
+    to the shards as deltas; only their keys and tokens cross the process
+    boundary, once. This process keeps what search needs around the shards:
+    corpus statistics (document count, total length, document frequencies
+    and their histogram), per-document versions, payloads and insertion
+    order. Queries send the query tokens and corpus_stats() statistics, so
+    the merged shard results equal scoring the corpus in one piece.
+
+    If a worker loses its shards (it was restarted), the index is marked
+    lost and must be rebuilt; searches in the meantime miss those shards.
+    """
+
+    def __init__(self, pool: ShardPool, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.pool = pool
+        self.n_shards = pool.n_shards
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.doc_len = {}
+        self.doc_version = {}
+        self.doc_payload = {}
+        self.doc_seq = {}
+        self.df = {}
+        self.df_hist = {}
+        self.total_len = 0
+        self.lost = False
+        self.created = time.monotonic()
+        self._seq = 0
+        self._lock = threading.RLock()
+        self._shard_ids = [(next(_index_ids), shard_no) for shard_no in range(self.n_shards)]
+        weakref.finalize(self, pool.release, self._shard_ids)
+        self._run([[] for _ in self._shard_ids], [[] for _ in self._shard_ids], create=True)
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def __contains__(self, key):
+        return key in self.doc_len
+
+    def _shard(self, key) -> int:
+        return stable_hash(repr(key)) % self.n_shards
+
+    def version(self, key):
+        """Return the stored version for a document key, or None if not indexed."""
+        return self.doc_version.get(key)
+
+    def payload(self, key):
+        """Return the payload stored with a document, or None."""
+        return self.doc_payload.get(key)
+
+    def order(self, key):
+        """Return the insertion sequence number of a document (higher is newer)."""
+        return self.doc_seq.get(key)
+
+    def newest(self, n: int, exclude=()) -> list:
+        """Return up to n document keys, most recently added first, skipping those in exclude."""
+        with self._lock:
+            found = []
+            for key in reversed(self.doc_len):
+                if len(found) >= n:
+                    break
+                if key not in exclude:
+                    found.append(key)
+            return found
+
+    def keys(self) -> set:
+        """Return the indexed document keys."""
+        with self._lock:
+            return set(self.doc_len)
+
+    def doc_freq(self, term: str) -> int:
+        """Return the number of documents containing a term."""
+        return self.df.get(term, 0)
+
+    def df_histogram(self) -> dict:
+        """Return {document frequency: number of terms with it}."""
+        return self.df_hist
+
+    def stats(self, terms):
+        """Return ({term: idf}, avgdl) over this corpus alone."""
+        return corpus_stats([self], terms, self.epsilon)
+
+    def _count(self, terms, delta: int):
+        for term in terms:
+            old = self.df.get(term, 0)
+            new = old + delta
+            if new:
+                self.df[term] = new
+            else:
+                del self.df[term]
+            if old:
+                count = self.df_hist[old] - 1
+                if count:
+                    self.df_hist[old] = count
+                else:
+                    del self.df_hist[old]
+            if new:
+                self.df_hist[new] = self.df_hist.get(new, 0) + 1
+
+    def _lose(self, error):
+        if not self.lost:
+            logger.error(f"Lost shards of index {self._shard_ids[0][0]}, it will be rebuilt: {error}")
+        self.lost = True
+
+    def _run(self, adds: list, removes: list, create: bool = False) -> list:
+        """Send per-shard deltas to the workers; returns the retired term sets they report."""
+        futures = [
+            self.pool.submit(shard_no, _apply_shard, shard_id, adds[shard_no], removes[shard_no], create)
+            for shard_no, shard_id in enumerate(self._shard_ids)
+            if create or adds[shard_no] or removes[shard_no]
+        ]
+        retired = []
+        for future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                self._lose(e)
+                continue
+            if result is None:
+                self._lose("shard not resident")
+                continue
+            retired.extend(result)
+        return retired
+
+    def append(self, docs: list):
+        """
+        Add documents, replacing any with the same keys.
+
+        Args:
+            docs: List of (key, tokens, version, payload) tuples, oldest first
+        """
+        with self._lock:
+            adds = [[] for _ in self._shard_ids]
+            for key, tokens, _, _ in docs:
+                adds[self._shard(key)].append((key, tokens))
+            retired = self._run(adds, [[] for _ in self._shard_ids])
+            for key, tokens, version, payload in docs:
+                self._count(set(tokens), 1)
+                if key in self.doc_len:
+                    self.total_len -= self.doc_len.pop(key)
+                self.doc_len[key] = len(tokens)
+                self.doc_version[key] = version
+                self.doc_payload[key] = payload
+                self._seq += 1
+                self.doc_seq[key] = self._seq
+                self.total_len += len(tokens)
+            for terms in retired:
+                self._count(terms, -1)
+
+    def delete(self, keys: list):
+        """Remove documents; unknown keys are ignored."""
+        with self._lock:
+            keys = [key for key in keys if key in self.doc_len]
+            if not keys:
+                return
+            removes = [[] for _ in self._shard_ids]
+            for key in keys:
+                removes[self._shard(key)].append(key)
+            for terms in self._run([[] for _ in self._shard_ids], removes):
+                self._count(terms, -1)
+            for key in keys:
+                self.total_len -= self.doc_len.pop(key)
+                self.doc_version.pop(key, None)
+                self.doc_payload.pop(key, None)
+                self.doc_seq.pop(key, None)
+
+    def batch_top_k(self, query_token_lists: list, k: int, stats=None) -> list:
+        """
+        Score queries on every shard in one round trip per worker.
+
+        Args:
+            query_token_lists: Tokenized queries
+            k: Number of results wanted per query
+            stats: Optional ({term: idf}, avgdl) from corpus_stats(); defaults to this index's own
+
+        Returns:
+            One {key: score} per query, holding every document that can rank in its top k
+        """
+        if stats is None:
+            stats = self.stats({token for tokens in query_token_lists for token in tokens})
+        futures = [
+            self.pool.submit(shard_no, _score_shard, shard_id, query_token_lists, k, stats)
+            for shard_no, shard_id in enumerate(self._shard_ids)
+        ]
+        merged = [{} for _ in query_token_lists]
+        for future in futures:
+            try:
+                hits = future.result()
+            except Exception as e:
+                self._lose(e)
+                continue
+            if hits is None:
+                self._lose("shard not resident")
+                continue
+            for scores, shard_scores in zip(merged, hits):
+                scores.update(shard_scores)
+        return merged
+
+    def top_k(self, query_tokens: list, k: int, stats=None) -> dict:
+        """Score one query; see batch_top_k."""
+        return self.batch_top_k([query_tokens], k, stats)[0]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_shard_pool(n_shards: int) -> ShardPool:
+    """Return the process-wide shard pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.n_shards != n_shards:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ShardPool(n_shards)
+        return _pool
+
+def shutdown_shard_pool():
+    """Stop the process-wide shard pool, if it was started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+atexit.register(shutdown_shard_pool)
@@ -0,0 +1,65 @@
+import os
+import bisect
+import hashlib
+
+
+def stable_hash(key: str) -> int:
+    """Stable 64-bit hash of a key (unlike hash(), the same in every process)."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ConsistentHashRing:
+    """
+    Consistent hash ring mapping keys (user ids) to shard numbers.
+
+    Every shard owns `vnodes` points on the ring, placed by hashing the shard
+    number, and a key belongs to the first point at or after its own hash.
+    Points of existing shards do not move when shards are added, so growing
+    from N to N + 1 shards moves only about 1 / (N + 1) of the keys, all of
+    them onto the new shard.
+    """
+
+    def __init__(self, shards: int, vnodes: int = 64):
+        """
+        Args:
+            shards: Number of shards (numbered 0 to shards - 1)
+            vnodes: Ring points per shard; more points spread keys more evenly
+        """
+        if shards < 1:
+            raise ValueError("A hash ring needs at least one shard")
+        self.shards = shards
+        self.vnodes = vnodes
+        points = sorted(
+            (stable_hash(f"shard-{shard}-{vnode}"), shard)
+            for shard in range(shards)
+            for vnode in range(vnodes)
+        )
+        self._positions = [position for position, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> int:
+        """Return the shard number owning a key."""
+        if self.shards == 1:
+            return 0
+        index = bisect.bisect_left(self._positions, stable_hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+def shard_paths(base_path: str, shards: int) -> list:
+    """
+    Return the database file of every shard.
+
+    Shard 0 is the base database itself, so a single shard is the unsharded
+    layout; shard i > 0 lives next to it, e.g. conversations-shard3.db.
+
+    Args:
+        base_path: Path of the main database file
+        shards: Number of shards
+
+    Returns:
+        List of database paths indexed by shard number
+    """
+    if shards > 1 and base_path == ":memory:":
+        raise ValueError("Sharded conversation storage needs a file database")
+    root, ext = os.path.splitext(base_path)
+    return [base_path] + [f"{root}-shard{shard}{ext}" for shard in range(1, shards)]
@@ -0,0 +1,169 @@
+import numpy as np
+from scipy import sparse
+
+
+class SparseBM25:
+    """
+    Vectorized Okapi BM25 scorer backed by a CSR term-document frequency matrix.
+
+    Raw term frequencies are stored and each query weighs only the rows of
+    its own terms, so the same matrix can be scored with its own corpus
+    statistics or with those of a larger corpus it is part of (see
+    bm25.corpus_stats). Scoring one or many queries is a single sparse
+    matrix product. Scores are identical to rank_bm25's BM25Okapi for the
+    same corpus.
+    """
+
+    def __init__(self, tokenized_docs: list, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocabulary = {}
+        rows, cols, counts = [], [], []
+        doc_len = np.zeros(len(tokenized_docs), dtype=np.float64)
+        for row, tokens in enumerate(tokenized_docs):
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, freq in frequencies.items():
+                rows.append(row)
+                cols.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                counts.append(freq)
+            doc_len[row] = len(tokens)
+        self._build(
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(cols, dtype=np.int64),
+            np.asarray(counts, dtype=np.float64),
+            doc_len,
+        )
+
+    @classmethod
+    def from_index(cls, index, keys=None):
+        """
+        Build a scorer from a BM25Index snapshot.
+
+        Args:
+            index: BM25Index to snapshot
+            keys: Document keys to include, in row order (defaults to every indexed document)
+
+        Returns:
+            Tuple of (SparseBM25, list of document keys in row order)
+        """
+        scorer = cls.__new__(cls)
+        scorer.k1, scorer.b, scorer.epsilon = index.k1, index.b, index.epsilon
+        scorer.vocabulary = {}
+        with index._lock:
+            keys = list(index.doc_len) if keys is None else list(keys)
+            rows, cols, counts = [], [], []
+            for row, key in enumerate(keys):
+                for term in index.doc_terms[key]:
+                    rows.append(row)
+                    cols.append(scorer.vocabulary.setdefault(term, len(scorer.vocabulary)))
+                    counts.append(index.postings[term][key])
+            doc_len = np.fromiter((index.doc_len[key] for key in keys), dtype=np.float64, count=len(keys))
+        scorer._build(
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(cols, dtype=np.int64),
+            np.asarray(counts, dtype=np.float64),
+            doc_len,
+        )
+        return scorer, keys
+
+    def _build(self, rows, cols, counts, doc_len):
+        self.doc_len = doc_len
+        self.total_len = float(doc_len.sum())
+        # Stored transposed (terms x docs) so a query selects its term rows
+        self.tf_t = sparse.csr_matrix((counts, (cols, rows)), shape=(len(self.vocabulary), len(doc_len)))
+        self.df = np.diff(self.tf_t.indptr)
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @property
+    def n_docs(self):
+        return len(self.doc_len)
+
+    def doc_freq(self, term: str) -> int:
+        """Return the number of documents containing a term."""
+        col = self.vocabulary.get(term)
+        return int(self.df[col]) if col is not None else 0
+
+    def df_histogram(self) -> dict:
+        """Return {document frequency: number of terms with it}."""
+        counts = np.bincount(self.df)
+        return {int(freq): int(counts[freq]) for freq in np.flatnonzero(counts) if freq}
+
+    def stats(self, terms):
+        """Return ({term: idf}, avgdl) over this corpus alone."""
+        from .bm25 import corpus_stats
+
+        return corpus_stats([self], terms, self.epsilon)
+
+    def term_weights(self, terms: list, stats):
+        """
+        Return the (terms x docs) CSR matrix of BM25 weights for the given vocabulary terms.
+
+        Args:
+            terms: Terms present in the vocabulary
+            stats: ({term: idf}, avgdl) to weigh them with
+        """
+        idf, avgdl = stats
+        rows = self.tf_t[[self.vocabulary[term] for term in terms]]
+        if not avgdl:
+            return rows * 0.0
+        counts = rows.data
+        doc_len = self.doc_len[rows.indices]
+        term_idf = np.repeat(np.fromiter((idf.get(term, 0.0) for term in terms), dtype=np.float64, count=len(terms)), np.diff(rows.indptr))
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avgdl)
+        weights = term_idf * (counts * (self.k1 + 1) / (counts + norm))
+        return sparse.csr_matrix((weights, rows.indices, rows.indptr), shape=rows.shape)
+
+    def get_batch_scores(self, tokenized_queries: list, stats=None) -> np.ndarray:
+        """
+        Score every document for every query in one sparse product.
+
+        Args:
+            tokenized_queries: List of tokenized queries
+            stats: Optional ({term: idf}, avgdl) covering the query terms; defaults to this corpus's own
+
+        Returns:
+            Dense array of shape (len(tokenized_queries), n_docs)
+        """
+        terms = list(dict.fromkeys(token for tokens in tokenized_queries for token in tokens if token in self.vocabulary))
+        if not terms:
+            return np.zeros((len(tokenized_queries), self.n_docs))
+        if stats is None:
+            stats = self.stats(terms)
+        position = {term: i for i, term in enumerate(terms)}
+        rows, cols = [], []
+        for row, tokens in enumerate(tokenized_queries):
+            for token in tokens:
+                col = position.get(token)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+        queries = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(tokenized_queries), len(terms)))
+        return np.asarray((queries @ self.term_weights(terms, stats)).todense())
+
+    def get_scores(self, query_tokens: list, stats=None) -> np.ndarray:
+        """Score every document against one tokenized query."""
+        return self.get_batch_scores([query_tokens], stats)[0]
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return indices of the k highest scores using a partial sort.
+
+    Ordering matches sorted(..., reverse=True): higher scores first and ties
+    broken by lower index, so results are identical to a full sort.
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        threshold = scores[np.argpartition(-scores, k - 1)[:k]].min()
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
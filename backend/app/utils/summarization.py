@@ -0,0 +1,243 @@
+import re
+import math
+import logging
+import argparse
+from collections import Counter
+from .analyzers import regex_analyzer
+from .database import load_conversation_turns, load_conversation_summaries, save_conversation_summaries
+from .maintenance import run_user_batch
+from ..core.config import settings
+
+logger = logging.getLogger("summarization")
+
+_CURSOR = "conversation_summary_cursor"
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_LABELS = {'user': "User", 'agent': "Assistant", 'summary': "Earlier"}
+
+
+def _label(role: str) -> str:
+    return _LABELS.get(role, role.capitalize())
+
+
+def extractive_summarizer(turns: list, max_chars: int) -> str:
+    """
+    Summarize turns by picking their most central sentences, without an LLM.
+
+    Each message contributes its first sentence as a candidate (a summary
+    being merged contributes all of its lines), scored by how often its words
+    recur across the excerpt (normalized by length), so recurring topics win
+    over one-off chatter. The best candidates that fit in max_chars are kept
+    in their original order.
+
+    Args:
+        turns: List of (role, content, timestamp) tuples, oldest first
+        max_chars: Maximum summary length
+
+    Returns:
+        Summary text
+    """
+    candidates = []
+    for role, content, _ in turns:
+        if role == 'summary':
+            candidates.extend(line.strip() for line in (content or "").splitlines() if line.strip())
+            continue
+        sentence = next((s.strip() for s in _SENTENCE_END.split(content or "") if s.strip()), "")
+        if sentence:
+            candidates.append(f"{_label(role)}: {sentence}")
+    frequencies = Counter(token for c in candidates for token in set(regex_analyzer(c)) if len(token) > 2)
+
+    def centrality(candidate):
+        tokens = {token for token in regex_analyzer(candidate) if len(token) > 2}
+        return sum(frequencies[token] for token in tokens) / math.sqrt(len(tokens) + 1)
+
+    chosen, used = set(), 0
+    for position in sorted(range(len(candidates)), key=lambda i: -centrality(candidates[i])):
+        length = len(candidates[position]) + 1
+        if used + length <= max_chars:
+            chosen.add(position)
+            used += length
+    if not chosen and candidates:
+        return candidates[0][:max_chars]
+    return "\n".join(candidates[i] for i in sorted(chosen))
+
+
+def llm_summarizer(turns: list, max_chars: int) -> str:
+    """
+    Summarize turns with settings.CONVERSATION_SUMMARY_MODEL.
+
+    Falls back to the extractive summarizer if the model call fails, so a
+    summarization run never stalls on an unavailable API.
+
+    Args:
+        turns: List of (role, content, timestamp) tuples, oldest first
+        max_chars: Maximum summary length
+
+    Returns:
+        Summary text
+    """
+    from langchain_openai import ChatOpenAI
+    from ..prompts import SUMMARIZE_CONVERSATION_PROMPT
+
+    conversation = "\n".join(f"{_label(role)}: {content}" for role, content, _ in turns)
+    try:
+        llm = ChatOpenAI(model=settings.CONVERSATION_SUMMARY_MODEL)
+        summary = llm.invoke([
+            {"role": "user", "content": SUMMARIZE_CONVERSATION_PROMPT.format(conversation=conversation, max_chars=max_chars)}
+        ])
+        summary = summary.content if hasattr(summary, "content") else summary
+        return summary.strip()[:max_chars]
+    except Exception as e:
+        logger.warning(f"LLM summarization failed, using extractive summary: {e}")
+        return extractive_summarizer(turns, max_chars)
+
+
+SUMMARIZERS = {
+    'extractive': extractive_summarizer,
+    'llm': llm_summarizer,
+}
+
+
+def register_summarizer(name: str, summarizer):
+    """
+    Register a custom summarizer.
+
+    Args:
+        name: Name used to select the summarizer
+        summarizer: Callable taking (turns, max_chars) and returning summary text
+    """
+    SUMMARIZERS[name] = summarizer
+
+
+def get_summarizer(name: str = None):
+    """
+    Look up a summarizer by name.
+
+    Args:
+        name: Summarizer name (defaults to settings.CONVERSATION_SUMMARIZER)
+
+    Returns:
+        Callable taking (turns, max_chars) and returning summary text
+    """
+    name = name or settings.CONVERSATION_SUMMARIZER
+    try:
+        return SUMMARIZERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown conversation summarizer: {name}") from None
+
+
+def summarize_user(user_id: str, keep_turns: int = None, batch_turns: int = None, max_summaries: int = None,
+                   summarizer: str = None, dry_run: bool = False) -> dict:
+    """
+    Roll a user's old conversation turns into summaries.
+
+    Everything but the newest keep_turns exchanges is summarized batch_turns
+    exchanges at a time, and the summarized rows are deleted in the same
+    transaction that stores their summaries. Past max_summaries, the oldest
+    summaries are merged into one, so both the table and the context stay
+    bounded for long-lived users.
+
+    Args:
+        user_id: The user identifier
+        keep_turns: Newest exchanges kept verbatim
+        batch_turns: Exchanges rolled into each summary
+        max_summaries: Summaries kept per user
+        summarizer: Summarizer name
+        dry_run: Report without writing or deleting anything
+
+    Returns:
+        Report with 'user_id', 'turns_summarized', 'rows_deleted',
+        'summaries_written' and 'summaries_merged'
+    """
+    keep_turns = settings.CONVERSATION_KEEP_TURNS if keep_turns is None else keep_turns
+    batch_turns = batch_turns or settings.CONVERSATION_SUMMARY_TURNS
+    max_summaries = max_summaries or settings.CONVERSATION_MAX_SUMMARIES
+    max_chars = settings.CONVERSATION_SUMMARY_CHARS
+    summarize = get_summarizer(summarizer)
+    if dry_run:
+        # Reports only need the counts; don't pay for LLM calls
+        summarize = lambda turns, max_chars: ""
+    report = {'user_id': user_id, 'turns_summarized': 0, 'rows_deleted': 0, 'summaries_written': 0, 'summaries_merged': 0}
+
+    # Group rows into exchanges so a prompt is never split from its answer
+    exchanges = {}
+    for row_id, turn_id, role, content, timestamp in load_conversation_turns(user_id):
+        exchanges.setdefault(turn_id, []).append((row_id, role, content, timestamp))
+    exchanges = list(exchanges.values())
+    old = exchanges[:max(len(exchanges) - keep_turns, 0)]
+
+    summaries, row_ids = [], []
+    for start in range(0, len(old), batch_turns):
+        batch = old[start:start + batch_turns]
+        rows = [row for exchange in batch for row in exchange]
+        summaries.append({
+            'summary': summarize([(role, content, timestamp) for _, role, content, timestamp in rows], max_chars),
+            'first_timestamp': rows[0][3],
+            'last_timestamp': rows[-1][3],
+            'turns': len(batch),
+        })
+        row_ids.extend(row[0] for row in rows)
+    report['turns_summarized'] = len(old)
+    report['rows_deleted'] = len(row_ids)
+    report['summaries_written'] = len(summaries)
+
+    # Merge the oldest summaries (existing and new) into one once there are too many
+    existing = load_conversation_summaries(user_id)
+    merged_ids = []
+    overflow = len(existing) + len(summaries) - max_summaries
+    if overflow > 0:
+        pool = existing + summaries
+        oldest = pool[:overflow + 1]
+        merged = {
+            'summary': summarize([('summary', s['summary'], s['last_timestamp']) for s in oldest], max_chars),
+            'first_timestamp': oldest[0]['first_timestamp'],
+            'last_timestamp': oldest[-1]['last_timestamp'],
+            'turns': sum(s['turns'] for s in oldest),
+        }
+        merged_ids = [s['id'] for s in oldest if 'id' in s]
+        summaries = [merged] + pool[overflow + 1:]
+        summaries = [s for s in summaries if 'id' not in s]
+        report['summaries_merged'] = len(oldest)
+        report['summaries_written'] = len(summaries)
+
+    if not dry_run and (summaries or merged_ids):
+        save_conversation_summaries(user_id, summaries, row_ids=row_ids, summary_ids=merged_ids)
+    if report['turns_summarized'] or report['summaries_merged']:
+        logger.info(
+            f"{'Would roll' if dry_run else 'Rolled'} {report['turns_summarized']} turns of user {user_id} into "
+            f"{report['summaries_written']} summaries, merging {report['summaries_merged']}"
+        )
+    return report
+
+
+def run_summarization(max_users: int = None, dry_run: bool = False) -> dict:
+    """
+    Summarize the next batch of users, resuming where the previous run stopped.
+
+    Users are visited in id order from a cursor persisted in the database
+    (see run_user_batch).
+
+    Args:
+        max_users: Users to process this run (defaults to settings.SUMMARIZATION_BATCH_USERS)
+        dry_run: Report without writing anything or moving the cursor
+
+    Returns:
+        Summary report with per-user reports under 'users'
+    """
+    return run_user_batch(
+        _CURSOR,
+        lambda user_id: summarize_user(user_id, dry_run=dry_run),
+        ('turns_summarized', 'rows_deleted', 'summaries_written'),
+        max_users or settings.SUMMARIZATION_BATCH_USERS,
+        dry_run=dry_run,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll old conversation turns into summaries")
+    parser.add_argument("--max-users", type=int, default=None, help="users to process this run")
+    parser.add_argument("--dry-run", action="store_true", help="report without writing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    summary = run_summarization(args.max_users, args.dry_run)
+    summary.pop('users')
+    print(summary)
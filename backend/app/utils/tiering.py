@@ -0,0 +1,136 @@
+import time
+import logging
+import argparse
+from datetime import datetime
+from .database import archive_memories, load_memory_access
+from .maintenance import run_user_batch
+from .search import remove_memories
+from .retrieval_cache import retrieval_cache
+from ..core.config import settings
+
+logger = logging.getLogger("tiering")
+
+_CURSOR = "memory_tiering_cursor"
+
+
+def _epoch(value):
+    """Convert a mem0 ISO timestamp to epoch seconds, or None if it cannot be parsed."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def stale_memories(memories: list, cold_after_days: float, now: float = None, user_id: str = None) -> list:
+    """
+    Select memories not written, retrieved or cited within the window.
+
+    Memories whose age cannot be determined stay hot.
+
+    Args:
+        memories: Memory dictionaries with 'id' and 'memory'
+        cold_after_days: Days without activity after which a memory is stale
+        now: Reference time in epoch seconds (defaults to the current time)
+        user_id: Owner of the memories, whose shard holds their access statistics
+
+    Returns:
+        List of the stale memory dictionaries
+    """
+    now = time.time() if now is None else now
+    cutoff = now - cold_after_days * 86400
+    access = load_memory_access([m['id'] for m in memories], user_id=user_id)
+    stale = []
+    for m in memories:
+        seen = [t for t in (
+            access.get(m['id'], {}).get('last_access'),
+            _epoch(m.get('updated_at')),
+            _epoch(m.get('created_at')),
+        ) if t is not None]
+        if seen and max(seen) < cutoff:
+            stale.append(m)
+    return stale
+
+
+def archive_user(user_id: str, cold_after_days: float = None, dry_run: bool = False) -> dict:
+    """
+    Move a user's stale memories to the cold store.
+
+    Archived memories are removed from mem0 and the search indexes, so the
+    default retrieval path no longer loads or scores them. They are still
+    searched when hot results score poorly, and citations keep resolving.
+
+    Args:
+        user_id: The user identifier
+        cold_after_days: Inactivity window (defaults to settings.MEMORY_COLD_AFTER_DAYS)
+        dry_run: Report what would be archived without moving anything
+
+    Returns:
+        Report dict with memories scanned, archived and bytes archived
+    """
+    from .memory import get_memory_client, iter_memories, memory_cache
+
+    cold_after_days = settings.MEMORY_COLD_AFTER_DAYS if cold_after_days is None else cold_after_days
+    memories = [m for page in iter_memories(user_id) for m in page if not m.get('pending')]
+    stale = stale_memories(memories, cold_after_days, user_id=user_id)
+
+    report = {'user_id': user_id, 'memories_scanned': len(memories), 'archived': 0, 'bytes_archived': 0}
+    if dry_run:
+        report['archived'] = len(stale)
+        report['bytes_archived'] = sum(len(m['memory'].encode('utf-8')) for m in stale)
+        return report
+
+    # Copy before deleting, so a failure never loses a memory
+    archive_memories(user_id, stale)
+    client = get_memory_client()
+    archived = []
+    for memory in stale:
+        try:
+            client.delete(memory['id'])
+        except Exception as e:
+            logger.error(f"Could not archive memory {memory['id']} for user {user_id}: {e}")
+            continue
+        archived.append(memory['id'])
+        report['archived'] += 1
+        report['bytes_archived'] += len(memory['memory'].encode('utf-8'))
+
+    if archived:
+        remove_memories(user_id, archived)
+        memory_cache.invalidate(user_id)
+        retrieval_cache.bump(user_id, 'memory')
+    logger.info(f"Tiering for user {user_id}: {report}")
+    return report
+
+
+def run_tiering(max_users: int = None, cold_after_days: float = None, dry_run: bool = False) -> dict:
+    """
+    Archive stale memories for the next batch of users, resuming where the previous run stopped.
+
+    Args:
+        max_users: Users to process this run (defaults to settings.TIERING_BATCH_USERS)
+        cold_after_days: Inactivity window in days
+        dry_run: Report without archiving anything or moving the cursor
+
+    Returns:
+        Summary report with per-user reports under 'users'
+    """
+    return run_user_batch(
+        _CURSOR,
+        lambda user_id: archive_user(user_id, cold_after_days=cold_after_days, dry_run=dry_run),
+        ('memories_scanned', 'archived', 'bytes_archived'),
+        max_users or settings.TIERING_BATCH_USERS,
+        dry_run=dry_run,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move stale memories to the cold store")
+    parser.add_argument("--max-users", type=int, default=None, help="users to process this run")
+    parser.add_argument("--days", type=float, default=None, help="inactivity window in days")
+    parser.add_argument("--dry-run", action="store_true", help="report without archiving")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    summary = run_tiering(args.max_users, args.days, args.dry_run)
+    summary.pop('users')
+    print(summary)
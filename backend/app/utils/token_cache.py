@@ -0,0 +1,94 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+class TokenCache:
+    """
+    Byte-bounded LRU cache of tokenized documents.
+
+    Entries are keyed by a document identity plus a version (for memories the
+    mem0 id and content hash, for conversation turns the role and content
+    hash), so an entry is only reused while the underlying text is unchanged.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _sizeof(key, tokens) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(tokens) + sum(sys.getsizeof(token) for token in tokens)
+
+    def get(self, key):
+        """Return cached tokens for a key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, tokens) -> tuple:
+        """Store tokens for a key, evicting least recently used entries as needed."""
+        tokens = tuple(tokens)
+        size = self._sizeof(key, tokens)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            if size > self.max_bytes:
+                return tokens
+            self._entries[key] = (tokens, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return tokens
+
+    def get_or_tokenize(self, key, text: str, tokenize) -> tuple:
+        """
+        Return cached tokens for a key, tokenizing and caching text on a miss.
+
+        Args:
+            key: Document identity and version
+            text: Document text, tokenized only on a miss
+            tokenize: Callable taking a string and returning a list of tokens
+
+        Returns:
+            Tuple of tokens
+        """
+        tokens = self.get(key)
+        if tokens is None:
+            tokens = self.put(key, tokenize(text))
+        return tokens
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
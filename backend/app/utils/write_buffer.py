@@ -0,0 +1,193 @@
+import time
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger("write_buffer")
+
+
+class GroupCommitBuffer:
+    """
+    Write-behind buffer that commits many small writes in one transaction.
+
+    Writers append items and get a Future back; a background thread
+    collects items for up to max_delay seconds (or until max_rows are
+    waiting) and hands each database's share to write_fn in a single call,
+    so one commit (and one fsync) covers the whole batch. Callers that need
+    durability wait on the Future, which resolves once the batch commits.
+    Failed batches are retried, then their Futures fail with the error.
+    Follow-up work that must not repeat the write goes in on_committed,
+    which runs once per committed batch, outside the retry loop.
+    """
+
+    def __init__(self, write_fn, max_rows: int = 256, max_delay: float = 0.005, max_retries: int = 2, retry_backoff: float = 0.05, on_committed=None):
+        """
+        Args:
+            write_fn: Callable (key, items) writing items in one transaction and raising on failure
+            on_committed: Optional callable (key, items) run after a batch commits; failures are logged
+            max_rows: Maximum number of items committed per batch
+            max_delay: Seconds the first item of a batch waits for company
+            max_retries: Retries of a failed batch
+            retry_backoff: Delay before the first retry in seconds, doubled after each retry
+        """
+        self.write_fn = write_fn
+        self.on_committed = on_committed
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.batches = 0
+        self.committed = 0
+        self.failed = 0
+        self._items = []
+        self._pending = {}
+        self._in_flight = 0
+        self._flush_requested = False
+        self._stopping = False
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+            self._thread.start()
+
+    def submit(self, key, item, user_id: str = None) -> Future:
+        """
+        Queue an item for the next group commit.
+
+        Args:
+            key: Destination of the item (e.g. the database path); items are batched per key
+            item: Item passed to write_fn
+            user_id: Optional owner, so readers can wait for that user's writes
+
+        Returns:
+            Future resolved once the item is committed
+        """
+        future = Future()
+        with self._cond:
+            self._items.append((time.monotonic(), key, user_id, item, future))
+            self._pending[(key, user_id)] = self._pending.get((key, user_id), 0) + 1
+            self._ensure_worker()
+            self._cond.notify_all()
+        return future
+
+    def depth(self) -> int:
+        """Return the number of items waiting or being committed."""
+        with self._cond:
+            return len(self._items) + self._in_flight
+
+    def _next_batch(self) -> list:
+        with self._cond:
+            while not self._items:
+                if self._stopping:
+                    return None
+                self._cond.wait()
+            deadline = self._items[0][0] + self.max_delay
+            while len(self._items) < self.max_rows and not self._flush_requested and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._items = self._items[:self.max_rows], self._items[self.max_rows:]
+            if not self._items:
+                self._flush_requested = False
+            self._in_flight += len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            by_key = {}
+            for entry in batch:
+                by_key.setdefault(entry[1], []).append(entry)
+            for key, entries in by_key.items():
+                self._commit(key, entries)
+            with self._cond:
+                self._in_flight -= len(batch)
+                for _, key, user_id, _, _ in batch:
+                    remaining = self._pending[(key, user_id)] - 1
+                    if remaining:
+                        self._pending[(key, user_id)] = remaining
+                    else:
+                        del self._pending[(key, user_id)]
+                self._cond.notify_all()
+
+    def _commit(self, key, entries: list):
+        items = [item for _, _, _, item, _ in entries]
+        delay = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.write_fn(key, items)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(items)
+                    logger.error(f"Dropping {len(items)} buffered writes after {attempt + 1} attempts: {e}")
+                    for _, _, _, _, future in entries:
+                        future.set_exception(e)
+                    return
+                logger.warning(f"Group commit failed (attempt {attempt + 1}), retrying: {e}")
+                time.sleep(delay)
+                delay *= 2
+                continue
+            self.batches += 1
+            self.committed += len(items)
+            if self.on_committed is not None:
+                try:
+                    self.on_committed(key, items)
+                except Exception as e:
+                    logger.error(f"Post-commit callback failed for {len(items)} committed writes: {e}")
+            for _, _, _, _, future in entries:
+                future.set_result(None)
+            return
+
+    def wait_for(self, key, user_id: str = None, timeout: float = None) -> bool:
+        """
+        Wait until a user's buffered writes to key are committed.
+
+        Returns:
+            True if nothing is pending for the user any more
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if (key, user_id) in self._pending:
+                self._flush_requested = True
+                self._cond.notify_all()
+            while (key, user_id) in self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Commit everything buffered so far.
+
+        Returns:
+            True if the buffer drained within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._items or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: float = 30.0):
+        """Flush buffered writes (up to timeout) and stop the worker thread."""
+        if not self.flush(timeout):
+            logger.warning(f"Group-commit buffer shut down with {self.depth()} writes outstanding")
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=1.0)
@@ -0,0 +1,92 @@
+import re
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from .database import find_memory_write, record_memory_writes
+
+logger = logging.getLogger("write_dedupe")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalize a prompt for duplicate detection (Unicode form, case and whitespace)."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+class WriteDedupeIndex:
+    """
+    Per-user index of recently written prompts, keyed by content hash.
+
+    A prompt whose normalized form was written for the same user within
+    window_seconds is not sent to mem0 again; the memory ids of the first
+    write are returned instead. Hashes live in the user's conversation
+    database shard, so every worker process shares them.
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.skipped = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(prompt: str) -> str:
+        return hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).hexdigest()
+
+    def lookup(self, user_id: str, prompt: str, pending: list = (), stored: bool = True):
+        """
+        Return the memory ids of a recent identical write, or None.
+
+        A hit is counted as a skipped write.
+
+        Args:
+            user_id: The user identifier
+            prompt: The prompt about to be written
+            pending: Placeholder memories of prompts queued but not written yet
+            stored: Also look up writes recorded in the database (a blocking read)
+
+        Returns:
+            List of memory ids (placeholder ids for a queued duplicate), or None
+        """
+        if not self.window_seconds:
+            return None
+        normalized = normalize_prompt(prompt)
+        memory_ids = [m['id'] for m in pending if normalize_prompt(m['memory']) == normalized][:1] or None
+        if memory_ids is None and stored:
+            try:
+                memory_ids = find_memory_write(user_id, self.content_hash(prompt), time.time() - self.window_seconds)
+            except Exception as e:
+                logger.error(f"Write dedupe lookup failed for user {user_id}: {e}")
+                return None
+        if memory_ids is not None:
+            with self._lock:
+                self.skipped += 1
+        return memory_ids
+
+    def record(self, user_id: str, prompts: list, memory_ids: list):
+        """
+        Record prompts written together and the memory ids mem0 returned for them.
+
+        Args:
+            user_id: The user identifier
+            prompts: Prompts sent in one mem0 add call
+            memory_ids: Memory ids in the add result
+        """
+        if not self.window_seconds:
+            return
+        hashes = list(dict.fromkeys(self.content_hash(prompt) for prompt in prompts))
+        try:
+            record_memory_writes(user_id, hashes, memory_ids, expire_before=time.time() - self.window_seconds)
+        except Exception as e:
+            logger.error(f"Could not record written prompts for user {user_id}: {e}")
+            return
+        with self._lock:
+            self.recorded += len(hashes)
+
+    def stats(self) -> dict:
+        """Return skipped and recorded write counters."""
+        with self._lock:
+            return {'skipped': self.skipped, 'recorded': self.recorded, 'window_seconds': self.window_seconds}
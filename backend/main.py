@@ -1,5 +1,7 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import logging
 
 from app.simple_agent.websocket import router as simple_ws_router
@@ -11,6 +13,8 @@ from app.sequential_agent.agent_router import router as sequential_agent_router
 from app.multiagent.router import router as multiagent_router
 
 from app.core.config import settings
+from app.utils.memory import warmup_memory_client, shutdown_memory_client
+from app.utils.database import init_database, close_connections
 
 from dotenv import load_dotenv
 
@@ -20,12 +24,25 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up the memory client and database on startup and drain background work on shutdown"""
+    init_database()
+    if settings.MEMORY_WARMUP:
+        await asyncio.to_thread(warmup_memory_client)
+    yield
+    await asyncio.to_thread(shutdown_memory_client)
+    from app.utils.sharding import shutdown_shard_pool
+    shutdown_shard_pool()
+    close_connections()
+
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application"""
     app = FastAPI(
         title="Deep Research Memory API",
         description="A FastAPI application for deep research memory management",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
     
     # Add CORS middleware
@@ -7,24 +7,38 @@ from unittest.mock import Mock, AsyncMock, patch
 from fastapi.testclient import TestClient
 from typing import Generator, AsyncGenerator
 
-# Mock mem0 client before importing app modules
-with patch('mem0.Memory') as mock_memory:
-    mock_memory.from_config.return_value = Mock()
-    
-    # Import your app and components
-    import sys
-    import os
-    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    
-    from main import app
-    from app.utils.database import fetch_conversation_history, store_conversation
-    from app.utils.memory import write_memory, fetch_cited_memories
-    from app.utils.search import bm25_hybrid_search
-    from app.utils.llm import ground_context, llm_annotate_with_citations
-    from app.utils.context import format_context
-    from app.simple_agent.agent import agent_pipeline
-    from app.simple_agent.agent_service import AgentService
-    from app.core.config import Settings
+# Import your app and components (the mem0 client is created lazily, so nothing is opened here)
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+from app.utils.database import fetch_conversation_history, store_conversation
+from app.utils.memory import write_memory, fetch_cited_memories
+from app.utils.search import bm25_hybrid_search
+from app.utils.llm import ground_context, llm_annotate_with_citations
+from app.utils.context import format_context
+from app.simple_agent.agent import agent_pipeline
+from app.simple_agent.agent_service import AgentService
+from app.core.config import Settings
+
+
+@pytest.fixture(autouse=True)
+def stub_memory_client():
+    """Never build a real mem0 client; tests that need one patch in their own mock"""
+    with patch('app.utils.memory.mem0_client', Mock()):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def isolated_database(tmp_path):
+    """Point the conversation database (and so every shard) at a per-test file, never ./research_agent_conversations.db"""
+    from app.core.config import settings
+    from app.utils.database import close_connections
+
+    with patch('app.utils.database.DB_PATH', str(tmp_path / "conversations.db")), \
+         patch.object(settings, 'DATABASE_SHARDS', 1):
+        yield
+        close_connections()
 
 
 @pytest.fixture
@@ -68,7 +82,11 @@ def temp_db():
     yield db_path
     
     # Cleanup
-    os.unlink(db_path)
+    from app.utils.database import close_connections
+    close_connections()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
 
 
 @pytest.fixture
@@ -139,9 +157,39 @@ def mock_mem0_client():
         'created_at': '2024-01-01T10:00:00Z'
     })
     mock.get_all = Mock(return_value={'results': []})
+    mock.vector_store = None
     return mock
 
 
+@pytest.fixture(autouse=True)
+def synchronous_memory_writes():
+    """Write memories inline so tests can assert on mem0 calls right away"""
+    from app.core.config import settings
+    with patch.object(settings, 'MEMORY_WRITE_MODE', 'sync'):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def no_write_dedupe():
+    """Send every write to mem0 unless a test enables deduplication"""
+    from app.utils.memory import write_dedupe
+    with patch.object(write_dedupe, 'window_seconds', 0):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def reset_retrieval_cache():
+    """Start every test with empty retrieval and memory caches and no memory indexes"""
+    from app.utils.retrieval_cache import retrieval_cache
+    from app.utils.memory import memory_cache
+    from app.utils import search
+    retrieval_cache.clear()
+    memory_cache.clear()
+    search.user_indexes.clear()
+    search._sparse_snapshots.clear()
+    yield
+
+
 @pytest.fixture
 def agent_service():
     """Create an AgentService instance for testing"""
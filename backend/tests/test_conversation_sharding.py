@@ -0,0 +1,96 @@
+import pytest
+import sqlite3
+import os
+from unittest.mock import patch
+
+
+class TestConversationSharding:
+    """Test per-user sharding of conversation storage"""
+
+    @pytest.fixture
+    def shard_base(self, tmp_path):
+        from app.utils.database import close_connections
+
+        base = str(tmp_path / "conversations.db")
+        with patch('app.utils.database.DB_PATH', base):
+            yield base
+        close_connections()
+
+    def test_ring_is_stable_when_growing(self):
+        """Test that adding a shard only moves keys onto the new shard"""
+        from app.utils.shards import ConsistentHashRing
+
+        keys = [f"user-{i}" for i in range(2000)]
+        four, five = ConsistentHashRing(4), ConsistentHashRing(5)
+        moved = [key for key in keys if four.shard_for(key) != five.shard_for(key)]
+
+        assert all(five.shard_for(key) == 4 for key in moved)
+        assert 0.1 < len(moved) / len(keys) < 0.3
+        assert {four.shard_for(key) for key in keys} == {0, 1, 2, 3}
+
+    def test_memory_access_follows_user_shard(self, shard_base):
+        """Test that access statistics are queued to, and read from, the user's shard"""
+        from app.utils.database import (
+            init_database, record_memory_access, load_memory_access, conversation_db_path, flush_memory_access,
+        )
+
+        with patch('app.utils.database.settings.DATABASE_SHARDS', 3):
+            init_database()
+            user_id = next(f"user{i}" for i in range(100) if conversation_db_path(f"user{i}") != shard_base)
+            record_memory_access(['m1', 'm2'], user_id=user_id)
+            record_memory_access(['m1'], cited=True, user_id=user_id)
+            access = load_memory_access(['m1', 'm2'], user_id=user_id)
+            flush_memory_access()
+            on_main = sqlite3.connect(shard_base).execute("SELECT COUNT(*) FROM memory_access").fetchone()[0]
+
+        assert {memory_id: (a['retrievals'], a['citations']) for memory_id, a in access.items()} == {'m1': (1, 1), 'm2': (1, 0)}
+        assert on_main == 0
+
+    def test_users_routed_to_shard_files(self, shard_base):
+        """Test that the caller API is unchanged while users land on different files"""
+        from app.utils.database import (
+            store_conversation, fetch_conversation_history, conversation_db_path,
+            list_conversation_users, conversation_shard_stats,
+        )
+
+        users = [f"user{i}" for i in range(12)]
+        with patch('app.utils.database.settings.DATABASE_SHARDS', 3):
+            for user_id in users:
+                store_conversation(user_id, f"Question from {user_id}", "Answer")
+            histories = {user_id: fetch_conversation_history(user_id) for user_id in users}
+            paths = {conversation_db_path(user_id) for user_id in users}
+            listed = list_conversation_users(limit=100)
+            stats = conversation_shard_stats()
+
+        assert all(histories[u][0][1] == f"Question from {u}" for u in users)
+        assert len(paths) > 1 and all(os.path.exists(path) for path in paths)
+        assert listed == sorted(users)
+        assert sum(shard['rows'] for shard in stats) == 24
+        assert sum(shard['users'] for shard in stats) == 12
+
+    def test_reshard_moves_history_and_turns(self, shard_base):
+        """Test that resharding moves users to their new shard with turns intact, and reruns are no-ops"""
+        from app.utils.database import store_conversation, fetch_conversation_history, conversation_shard_stats, _connections, conversation_db_path
+        from app.utils.reshard import reshard
+
+        users = [f"user{i}" for i in range(12)]
+        for user_id in users:
+            store_conversation(user_id, "First", "One")
+            store_conversation(user_id, "Second", "Two")
+
+        summary = reshard(1, 3)
+        with patch('app.utils.database.settings.DATABASE_SHARDS', 3):
+            histories = {user_id: fetch_conversation_history(user_id) for user_id in users}
+            stats = conversation_shard_stats()
+            conn = _connections.connection(conversation_db_path("user1"))
+            rows = conn.execute("SELECT id, role, turn_id FROM conversation_history WHERE user_id = 'user1' ORDER BY id").fetchall()
+
+        assert summary['users_scanned'] == 12
+        assert 0 < summary['users_moved'] < 12
+        assert summary['rows_moved'] == 4 * summary['users_moved']
+        assert all([content for _, content, _ in histories[u]] == ["First", "One", "Second", "Two"] for u in users)
+        assert [shard['users'] for shard in stats] == summary['shard_users']
+        assert [(role, turn_id) for _, role, turn_id in rows] == [
+            ('user', rows[0][0]), ('agent', rows[0][0]), ('user', rows[2][0]), ('agent', rows[2][0])
+        ]
+        assert reshard(3, 3)['users_moved'] == 0
@@ -0,0 +1,815 @@
+import pytest
+from unittest.mock import Mock, patch
+from app.utils.search import bm25_hybrid_search
+from app.utils.memory import write_memory
+
+
+class TestBM25Index:
+    """Test the incremental BM25 inverted index"""
+
+    def test_scores_match_rank_bm25(self):
+        """Test that index scores match BM25Okapi on the same corpus"""
+        from rank_bm25 import BM25Okapi
+        from app.utils.bm25 import BM25Index
+
+        corpus = [
+            ['machine', 'learning', 'is', 'fun'],
+            ['deep', 'learning', 'uses', 'neural', 'networks'],
+            ['learning', 'is', 'learning'],
+            ['cats', 'and', 'dogs'],
+        ]
+        query = ['learning', 'neural', 'is']
+        expected = BM25Okapi(corpus).get_scores(query)
+
+        index = BM25Index()
+        for i, tokens in enumerate(corpus):
+            index.add(i, tokens)
+        scores = index.get_scores(query)
+
+        for i, value in enumerate(expected):
+            assert scores.get(i, 0.0) == pytest.approx(value)
+
+    def test_union_statistics_score_like_one_model(self):
+        """Test that separate indexes scored with corpus_stats match BM25Okapi over all their documents"""
+        from rank_bm25 import BM25Okapi
+        from app.utils.bm25 import BM25Index, corpus_stats
+
+        memories = [['python', 'tips'], ['python', 'python', 'web'], ['rust', 'tips'], ['python', 'data']]
+        window = [['python', 'tips', 'please'], ['tips', 'again']]
+        query = ['python', 'tips', 'web']
+        expected = BM25Okapi(memories + window).get_scores(query)
+
+        main, extra = BM25Index(), BM25Index()
+        for i, tokens in enumerate(memories):
+            main.add(i, tokens)
+        for i, tokens in enumerate(window):
+            extra.add(len(memories) + i, tokens)
+        stats = corpus_stats([main, extra], set(query))
+        assert stats[0]['python'] > 0  # floored by epsilon: python is in most documents
+
+        scores = {**main.get_scores(query, stats), **extra.get_scores(query, stats)}
+        top = main.top_k(query, 2, stats)
+
+        for i, value in enumerate(expected):
+            assert scores.get(i, 0.0) == pytest.approx(value)
+        assert sorted(top, key=top.get, reverse=True) == sorted(range(len(memories)), key=lambda i: -expected[i])[:2]
+
+    @pytest.mark.parametrize("backend, index_dir", [("index", False), ("index", True), ("sparse", False)])
+    def test_user_search_matches_stateless_after_prior_turns(self, tmp_path, backend, index_dir):
+        """Test that a user's memory index ranks like an exhaustive search and keeps conversation turns out"""
+        from app.utils.search import bm25_hybrid_search, segment_store, user_indexes
+
+        memories = [
+            {'id': 'a', 'memory': 'python python web frameworks'},
+            {'id': 'b', 'memory': 'rust tips'},
+            {'id': 'c', 'memory': 'python tips for data work'},
+        ]
+        history = [('user', 'Any tips on rust?', 1.0)]
+        user_indexes.drop('parity_user')
+        with patch('app.utils.search.settings.COLD_SCORE_THRESHOLD', 0), \
+             patch('app.utils.search.settings.INDEX_DIR', str(tmp_path) if index_dir else ''), \
+             patch('app.utils.search._record_retrievals'), \
+             patch('app.utils.search.settings.SEARCH_BACKEND', backend):
+            # Earlier requests searched a much larger conversation window
+            prior = [('user', f'tips tips tips number {i}', float(i)) for i in range(200)]
+            bm25_hybrid_search('tips', memories, prior, top_n=2, user_id='parity_user')
+            expected = [r.get('id', r.get('content')) for r in bm25_hybrid_search('python tips', memories, history, top_n=3)]
+            ranked = [r.get('id', r.get('content')) for r in bm25_hybrid_search('python tips', memories, history, top_n=3, user_id='parity_user')]
+            indexed = len(segment_store('parity_user')) if index_dir else len(user_indexes.get('parity_user'))
+
+        assert ranked == expected
+        assert indexed == len(memories)
+
+    def test_incremental_add_and_remove(self):
+        """Test that removing a document restores the previous statistics"""
+        from app.utils.bm25 import BM25Index
+
+        index = BM25Index()
+        index.add('a', ['alpha', 'beta'])
+        index.add('b', ['beta', 'gamma'])
+        before = index.get_scores(['alpha', 'gamma'])
+
+        index.add('c', ['alpha', 'alpha', 'delta'])
+        assert len(index) == 3
+        index.remove('c')
+
+        assert len(index) == 2
+        assert 'delta' not in index.postings
+        assert index.get_scores(['alpha', 'gamma']) == pytest.approx(before)
+
+    def test_add_replaces_existing_document(self):
+        """Test that re-adding a key replaces its tokens and version"""
+        from app.utils.bm25 import BM25Index
+
+        index = BM25Index()
+        index.add('a', ['old', 'text'], version=1)
+        index.add('a', ['new', 'text'], version=2)
+
+        assert len(index) == 1
+        assert index.version('a') == 2
+        assert 'old' not in index.postings
+        assert index.total_len == 2
+
+    def test_document_frequency_histogram_is_maintained(self):
+        """Test that the histogram of document frequencies follows adds, replacements and removals"""
+        from app.utils.bm25 import BM25Index
+
+        index = BM25Index()
+        index.add('a', ['alpha', 'beta'])
+        index.add('b', ['alpha', 'gamma'])
+        index.add('c', ['alpha', 'alpha'])
+        assert index.df_histogram() == {3: 1, 1: 2}
+
+        index.add('c', ['beta'])
+        index.remove('a')
+
+        assert index.df_histogram() == {1: 3}
+        assert index.newest(5) == ['c', 'b']
+
+    def test_top_k_matches_exhaustive_ranking(self):
+        """Test that MaxScore top-k returns the same ranking as exhaustive scoring"""
+        import random
+        import heapq
+        from app.utils.bm25 import BM25Index
+
+        rng = random.Random(7)
+        vocabulary = [f"t{i}" for i in range(40)]
+        index = BM25Index()
+        for i in range(300):
+            # Zipf-like term distribution so some posting lists are long
+            index.add(i, [vocabulary[min(int(rng.paretovariate(1.2)) - 1, 39)] for _ in range(rng.randint(3, 20))])
+
+        for query in (['t0', 't7', 't30'], ['t1', 't1', 't2'], ['t0', 't25'], ['t39']):
+            exhaustive = index.get_scores(query)
+            pruned = index.top_k(query, 10)
+            expected = heapq.nlargest(10, range(300), key=lambda i: exhaustive.get(i, 0.0))
+            actual = heapq.nlargest(10, range(300), key=lambda i: pruned.get(i, 0.0))
+            assert actual == expected
+            for i in actual:
+                assert pruned.get(i, 0.0) == pytest.approx(exhaustive.get(i, 0.0))
+
+    def test_top_k_skips_postings_of_common_terms(self):
+        """Test that a rare term's strong hits let the common term's posting list be skipped"""
+        from app.utils.bm25 import BM25Index
+
+        index = BM25Index()
+        for i in range(500):
+            index.add(i, ['common', f'word{i}'] + (['rare', 'rare'] if i < 3 else []))
+
+        index.postings_scored = 0
+        index.get_scores(['rare', 'common'])
+        exhaustive_cost = index.postings_scored
+
+        index.postings_scored = 0
+        scores = index.top_k(['rare', 'common'], 3)
+
+        assert set(scores) == {0, 1, 2}
+        assert index.postings_scored < exhaustive_cost / 10
+
+    def test_conversation_window_does_not_defeat_pruning(self):
+        """Test that a user search prunes the memory index even with a conversation window"""
+        from app.utils.search import user_indexes
+
+        memories = [{'id': f'm{i}', 'memory': f"common word{i}" + (" rare rare" if i < 3 else "")} for i in range(500)]
+        history = [('user', 'common question', 1.0), ('agent', 'a common answer', 2.0)]
+        user_indexes.drop('prune_user')
+        with patch('app.utils.search._tokenize', side_effect=lambda text: text.lower().split()), \
+             patch('app.utils.search._record_retrievals'), \
+             patch('app.utils.search.settings.COLD_SCORE_THRESHOLD', 0), \
+             patch('app.utils.search.settings.SEARCH_BACKEND', 'index'):
+            expected = bm25_hybrid_search('rare common', memories, history, top_n=3)
+            bm25_hybrid_search('warm up', memories, history, top_n=3, user_id='prune_user')
+            index = user_indexes.get('prune_user')
+            index.postings_scored = 0
+            result = bm25_hybrid_search('rare common', memories, history, top_n=3, user_id='prune_user')
+
+        assert result == expected
+        assert [r['id'] for r in result] == ['m0', 'm1', 'm2']
+        assert index.postings_scored < len(memories) / 10
+
+    def test_top_k_returns_all_matches_when_fewer_than_k(self):
+        """Test that every matching document is returned when fewer than k match"""
+        from app.utils.bm25 import BM25Index
+
+        index = BM25Index()
+        index.add('a', ['alpha', 'beta'])
+        index.add('b', ['beta', 'gamma'])
+        index.add('c', ['delta'])
+
+        assert set(index.top_k(['alpha', 'gamma'], 5)) == {'a', 'b'}
+
+    def test_user_index_registry_evicts_least_recent(self):
+        """Test that the registry keeps at most max_users indexes"""
+        from app.utils.bm25 import UserIndexRegistry
+
+        registry = UserIndexRegistry(max_users=2)
+        first = registry.get('u1')
+        registry.get('u2')
+        registry.get('u1')
+        registry.get('u3')
+
+        assert registry.peek('u1') is first
+        assert registry.peek('u2') is None
+
+    def test_write_memory_updates_user_index(self, mock_mem0_client):
+        """Test that write_memory applies mem0 events to the user's built index"""
+        from app.utils.search import user_indexes
+
+        mock_mem0_client.add.return_value = {'results': [
+            {'id': 'mem_new', 'memory': 'Likes hiking', 'event': 'ADD'},
+        ]}
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.search._tokenize', side_effect=lambda text: text.lower().split()):
+            write_memory("I like hiking", "index_user")
+            assert user_indexes.peek('index_user') is None  # not built yet: building lists the write
+
+            bm25_hybrid_search("hiking", [{'id': 'mem_old', 'memory': 'Likes tea'}], [], user_id='index_user')
+            write_memory("I like hiking", "index_user")
+            assert ('memory', 'mem_new') in user_indexes.get('index_user')
+
+            mock_mem0_client.add.return_value = {'results': [
+                {'id': 'mem_new', 'memory': 'Likes hiking', 'event': 'DELETE'},
+            ]}
+            write_memory("Forget hiking", "index_user")
+            assert ('memory', 'mem_new') not in user_indexes.get('index_user')
+
+
+class TestMemoryIndexLifecycle:
+    """Test building user memory indexes once and keeping them current"""
+
+    @pytest.fixture(autouse=True)
+    def plain_search(self):
+        with patch('app.utils.search._tokenize', side_effect=lambda text: text.lower().split()), \
+             patch('app.utils.search._record_retrievals'), \
+             patch('app.utils.search.settings.COLD_SCORE_THRESHOLD', 0):
+            yield
+
+    def test_built_index_is_searched_without_listing(self):
+        """Test that the listing is read once and later searches see writes through deltas only"""
+        from app.utils.search import index_memories, memory_index_ready, remove_memories
+
+        listing = [{'id': 'm1', 'memory': 'rust tips'}, {'id': 'm2', 'memory': 'python tips'}, {'id': 'm4', 'memory': 'go tips'}]
+        with patch('app.utils.memory.get_all_memories', return_value=listing) as mock_list:
+            assert not memory_index_ready('life_user')
+            first = bm25_hybrid_search('python', None, [], top_n=1, user_id='life_user')
+            index_memories('life_user', [{'id': 'm3', 'memory': 'python python web'}])
+            remove_memories('life_user', ['m2'])
+            second = bm25_hybrid_search('python', None, [], top_n=5, user_id='life_user')
+
+        mock_list.assert_called_once_with('life_user')
+        assert memory_index_ready('life_user')
+        assert [r['id'] for r in first] == ['m2']
+        assert [r['id'] for r in second] == ['m3', 'm1', 'm4']
+
+    def test_writes_during_build_are_replayed(self):
+        """Test that a write landing while the listing is read reaches the installed index"""
+        from app.utils.search import index_memories, user_indexes
+
+        def listing(user_id):
+            # A write is applied between reading the listing and installing the index
+            index_memories(user_id, [{'id': 'late', 'memory': 'late write about gardening'}])
+            return [{'id': 'm1', 'memory': 'rust tips'}]
+
+        with patch('app.utils.memory.get_all_memories', side_effect=listing):
+            result = bm25_hybrid_search('gardening', None, [], top_n=1, user_id='race_user')
+
+        assert [r['id'] for r in result] == ['late']
+        assert len(user_indexes.peek('race_user')) == 2
+
+    def test_pending_placeholders_are_searched_but_not_indexed(self):
+        """Test that queued writes are found from their placeholders and stay out of the index"""
+        from app.utils.search import user_indexes
+
+        placeholder = {'id': 'pending:1', 'memory': 'queued note about kayaks', 'pending': True}
+        with patch('app.utils.memory.get_all_memories', return_value=[{'id': 'm1', 'memory': 'rust tips'}, {'id': 'm2', 'memory': 'go tips'}, placeholder]), \
+             patch('app.utils.memory.pending_memories', return_value=[placeholder]):
+            result = bm25_hybrid_search('kayaks', None, [], top_n=1, user_id='queue_user')
+
+        assert [r['id'] for r in result] == ['pending:1']
+        assert ('memory', 'pending:1') not in user_indexes.peek('queue_user')
+
+    def test_index_is_rebuilt_after_refresh_interval(self):
+        """Test that an index older than SEARCH_INDEX_REFRESH_SECONDS is rebuilt from a listing"""
+        from app.utils.search import memory_index_ready, settings, user_indexes
+
+        with patch('app.utils.memory.get_all_memories', return_value=[{'id': 'm1', 'memory': 'rust tips'}]) as mock_list:
+            bm25_hybrid_search('rust', None, [], user_id='stale_user')
+            assert memory_index_ready('stale_user')
+            user_indexes.peek('stale_user').created -= settings.SEARCH_INDEX_REFRESH_SECONDS + 1
+            assert not memory_index_ready('stale_user')
+            bm25_hybrid_search('rust', None, [], user_id='stale_user')
+
+        assert mock_list.call_count == 2
+
+
+class TestSegmentStore:
+    """Test the mmap'd on-disk segment index"""
+
+    CORPUS = {
+        ('memory', 'm1'): ['machine', 'learning', 'is', 'fun'],
+        ('memory', 'm2'): ['deep', 'learning', 'uses', 'neural', 'networks'],
+        ('conversation', 'user', 'c1'): ['learning', 'is', 'learning'],
+        ('conversation', 'agent', 'c2'): ['cats', 'and', 'dogs'],
+    }
+
+    def _reference(self, corpus):
+        from app.utils.bm25 import BM25Index
+
+        index = BM25Index()
+        for key, tokens in corpus.items():
+            index.add(key, tokens)
+        return index
+
+    def test_scores_match_in_memory_index(self, tmp_path):
+        """Test that segment scores equal BM25Index scores across several segments"""
+        from app.utils.segments import SegmentStore
+
+        store = SegmentStore(str(tmp_path))
+        items = list(self.CORPUS.items())
+        store.append([(key, tokens, 'v1') for key, tokens in items[:2]])
+        store.append([(key, tokens, 'v1') for key, tokens in items[2:]])
+        query = ['learning', 'neural', 'is', 'learning']
+
+        assert store.segment_count == 2
+        assert store.get_scores(query) == self._reference(self.CORPUS).get_scores(query)
+
+    def test_scores_with_union_statistics(self, tmp_path):
+        """Test that segments scored alongside an in-memory part match one index of both"""
+        from app.utils.bm25 import BM25Index, corpus_stats
+        from app.utils.segments import SegmentStore
+
+        items = list(self.CORPUS.items())
+        store = SegmentStore(str(tmp_path))
+        store.append([(key, tokens, 'v1') for key, tokens in items[:2]])
+        window = BM25Index()
+        for key, tokens in items[2:]:
+            window.add(key, tokens)
+        query = ['learning', 'neural', 'is', 'learning']
+
+        stats = corpus_stats([store, window], set(query))
+        scores = {**store.get_scores(query, stats), **window.get_scores(query, stats)}
+        expected = self._reference(self.CORPUS).get_scores(query)
+
+        assert scores.keys() == expected.keys()
+        for key, value in expected.items():
+            assert scores[key] == pytest.approx(value)
+
+    def test_supersede_delete_and_merge(self, tmp_path):
+        """Test that re-added and deleted keys stop counting, before and after a merge"""
+        from app.utils.segments import SegmentStore
+
+        store = SegmentStore(str(tmp_path))
+        store.append([(key, tokens, 'v1') for key, tokens in self.CORPUS.items()])
+        store.append([(('memory', 'm1'), ['machine', 'vision'], 'v2')])
+        store.delete([('conversation', 'agent', 'c2')])
+
+        corpus = dict(self.CORPUS)
+        corpus[('memory', 'm1')] = ['machine', 'vision']
+        del corpus[('conversation', 'agent', 'c2')]
+        query = ['machine', 'learning', 'dogs']
+        expected = self._reference(corpus).get_scores(query)
+
+        assert store.versions()[('memory', 'm1')] == 'v2'
+        assert ('conversation', 'agent', 'c2') not in store
+        assert store.get_scores(query) == pytest.approx(expected)
+
+        store.merge()
+        assert store.segment_count == 1
+        assert len(store) == 3
+        assert store.get_scores(query) == pytest.approx(expected)
+
+    def test_merge_threshold_compacts_segments(self, tmp_path):
+        """Test that appends merge in the background once too many segments accumulate, retiring the old files"""
+        from app.utils.segments import SegmentStore
+
+        store = SegmentStore(str(tmp_path), merge_threshold=3, retire_after=0)
+        for i in range(4):
+            store.append([(('memory', f'm{i}'), ['token', f'word{i}'], 'v1')])
+        store.wait_for_merge()
+
+        assert store.segment_count == 1
+        assert len(store) == 4
+        # Merged segments stay on disk for readers of the old manifest until the next write sweeps them
+        assert len(list(tmp_path.glob('*.seg'))) == 5
+        store.append([(('memory', 'm4'), ['token'], 'v1')])
+        assert len(list(tmp_path.glob('*.seg'))) == 2
+
+    def test_statistics_follow_writes_and_merges(self, tmp_path):
+        """Test that manifest statistics match an in-memory index through supersedes, deletes and a merge"""
+        from app.utils.segments import SegmentStore
+
+        store = SegmentStore(str(tmp_path))
+        store.append([(key, tokens, 'v1') for key, tokens in self.CORPUS.items()])
+        store.append([(('memory', 'm1'), ['machine', 'vision', 'vision'], 'v2'), (('memory', 'm3'), ['dogs', 'learning'], 'v1')])
+        store.delete([('conversation', 'agent', 'c2'), ('memory', 'missing')])
+        corpus = dict(self.CORPUS)
+        corpus[('memory', 'm1')] = ['machine', 'vision', 'vision']
+        corpus[('memory', 'm3')] = ['dogs', 'learning']
+        del corpus[('conversation', 'agent', 'c2')]
+        reference = self._reference(corpus)
+
+        for merged in (False, True):
+            assert len(store) == len(reference)
+            assert store.total_len == reference.total_len
+            assert store.df_histogram() == reference.df_histogram()
+            assert {term: store.doc_freq(term) for term in reference.postings} == {term: reference.doc_freq(term) for term in reference.postings}
+            store.merge()
+
+    def test_reader_of_a_replaced_manifest_retries(self, tmp_path):
+        """Test that a reader whose manifest names deleted segments reloads the current one"""
+        from app.utils.segments import SegmentStore
+
+        writer = SegmentStore(str(tmp_path), retire_after=0)
+        reader = SegmentStore(str(tmp_path))
+        writer.append([(('memory', 'm1'), ['shared', 'index'], 'v1')])
+        writer.append([(('memory', 'm2'), ['shared'], 'v1')])
+        stale = reader._read_manifest()
+        writer.merge()
+        writer.delete([('memory', 'm2')])
+        reads = iter([stale])
+
+        with patch.object(reader, '_read_manifest', side_effect=lambda: next(reads, None) or SegmentStore._read_manifest(reader)):
+            assert set(reader.get_scores(['shared'])) == {('memory', 'm1')}
+
+    def test_writes_during_a_merge_are_kept(self, tmp_path):
+        """Test that appends and deletes landing while a merge is written survive its commit"""
+        from app.utils import segments
+
+        store = segments.SegmentStore(str(tmp_path))
+        store.append([(('memory', 'm1'), ['alpha'], 'v1')])
+        store.append([(('memory', 'm2'), ['alpha', 'beta'], 'v1')])
+        write = segments.merge_segments
+
+        def merge_with_writes(*args, **kwargs):
+            written = write(*args, **kwargs)
+            store.append([(('memory', 'm3'), ['beta'], 'v1')])
+            store.delete([('memory', 'm1')])
+            return written
+
+        with patch.object(segments, 'merge_segments', side_effect=merge_with_writes):
+            store.merge()
+
+        assert store.segment_count == 2
+        assert set(store.versions()) == {('memory', 'm2'), ('memory', 'm3')}
+        assert store.doc_freq('alpha') == 1
+
+    def test_other_process_sees_new_segments(self, tmp_path):
+        """Test that a second store over the same directory picks up writes"""
+        from app.utils.segments import SegmentStore
+
+        writer = SegmentStore(str(tmp_path))
+        reader = SegmentStore(str(tmp_path))
+        assert len(reader) == 0
+
+        writer.append([(('memory', 'm1'), ['shared', 'index'], 'v1')])
+
+        assert set(reader.get_scores(['shared'])) == {('memory', 'm1')}
+
+    def test_hybrid_search_uses_segments(self, tmp_path, sample_memories, sample_conversation_history):
+        """Test that bm25_hybrid_search ranks identically from on-disk segments"""
+        from app.utils import search
+
+        expected = bm25_hybrid_search("machine learning", sample_memories, sample_conversation_history, top_n=4)
+        with patch.object(search.settings, 'INDEX_DIR', str(tmp_path)):
+            result = bm25_hybrid_search("machine learning", sample_memories, sample_conversation_history, top_n=4, user_id="disk_user")
+            assert len(search.segment_store("disk_user")) == len(sample_memories)
+
+            # A repeat search finds nothing new to write
+            bm25_hybrid_search("neural", sample_memories, sample_conversation_history, user_id="disk_user")
+            assert search.segment_store("disk_user").segment_count == 1
+        search._segment_stores.pop("disk_user").close()
+
+        assert result == expected
+
+
+class TestSparseBM25:
+    """Test the vectorized CSR BM25 backend"""
+
+    CORPUS = [
+        ['machine', 'learning', 'is', 'fun'],
+        ['deep', 'learning', 'uses', 'neural', 'networks'],
+        ['learning', 'is', 'learning'],
+        ['cats', 'and', 'dogs'],
+    ]
+
+    def test_scores_match_rank_bm25(self):
+        """Test that sparse scores match BM25Okapi for single and batch queries"""
+        from rank_bm25 import BM25Okapi
+        from app.utils.sparse_bm25 import SparseBM25
+
+        reference = BM25Okapi(self.CORPUS)
+        scorer = SparseBM25(self.CORPUS)
+        queries = [['learning', 'neural'], ['cats', 'unknown'], ['is', 'is']]
+
+        batch = scorer.get_batch_scores(queries)
+
+        assert batch.shape == (3, 4)
+        for row, query in zip(batch, queries):
+            assert row == pytest.approx(reference.get_scores(query))
+        assert scorer.get_scores(queries[0]) == pytest.approx(reference.get_scores(queries[0]))
+
+    def test_from_index_matches_index_scores(self):
+        """Test that a CSR snapshot of a BM25Index scores identically"""
+        from app.utils.bm25 import BM25Index
+        from app.utils.sparse_bm25 import SparseBM25
+
+        index = BM25Index()
+        for i, tokens in enumerate(self.CORPUS):
+            index.add(f'doc{i}', tokens)
+        scorer, keys = SparseBM25.from_index(index)
+
+        expected = index.get_scores(['learning', 'dogs'])
+        scores = scorer.get_scores(['learning', 'dogs'])
+
+        for row, key in enumerate(keys):
+            assert scores[row] == pytest.approx(expected.get(key, 0.0))
+
+    def test_scores_with_union_statistics(self):
+        """Test that a snapshot scored with union statistics matches BM25Okapi over the union"""
+        from rank_bm25 import BM25Okapi
+        from app.utils.bm25 import BM25Index, corpus_stats
+        from app.utils.sparse_bm25 import SparseBM25
+
+        window = [['learning', 'noise'], ['dogs', 'learning', 'learning']]
+        index, extra = BM25Index(), BM25Index()
+        for i, tokens in enumerate(self.CORPUS):
+            index.add(f'doc{i}', tokens)
+        for i, tokens in enumerate(window):
+            extra.add(i, tokens)
+        scorer, keys = SparseBM25.from_index(index)
+        query = ['learning', 'dogs']
+
+        scores = scorer.get_scores(query, corpus_stats([index, extra], set(query)))
+
+        assert keys == [f'doc{i}' for i in range(len(self.CORPUS))]
+        assert scores == pytest.approx(BM25Okapi(self.CORPUS + window).get_scores(query)[:len(self.CORPUS)])
+
+    def test_top_k_indices_matches_full_sort(self):
+        """Test that partial top-k keeps full-sort ordering including ties"""
+        import numpy as np
+        from app.utils.sparse_bm25 import top_k_indices
+
+        scores = np.array([0.5, 2.0, 0.5, 2.0, 0.0, 0.5])
+        expected = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+
+        for k in range(0, len(scores) + 2):
+            assert list(top_k_indices(scores, k)) == expected[:k]
+
+    def test_sparse_backend_matches_index_backend(self, sample_memories, sample_conversation_history):
+        """Test that both backends of bm25_hybrid_search return the same results"""
+        with patch('app.utils.search._tokenize', side_effect=lambda text: text.lower().split()):
+            for prompt in ['neural networks', 'machine learning', 'language']:
+                index_results = bm25_hybrid_search(prompt, sample_memories, sample_conversation_history, top_n=4, backend='index')
+                sparse_results = bm25_hybrid_search(prompt, sample_memories, sample_conversation_history, top_n=4, backend='sparse')
+                assert sparse_results == index_results
+
+    def test_snapshot_absorbs_writes_without_rebuild(self):
+        """Test that a user's CSR snapshot is reused across writes and still scores like the index"""
+        from app.utils.search import _sparse_snapshots, index_memories, remove_memories
+
+        listing = [{'id': f'm{i}', 'memory': f'note {i} about rust'} for i in range(6)]
+        listing[2]['memory'] = 'python tips'
+        with patch('app.utils.memory.get_all_memories', return_value=listing), \
+             patch('app.utils.search._tokenize', side_effect=lambda text: text.lower().split()), \
+             patch('app.utils.search._record_retrievals'), \
+             patch('app.utils.search.settings.COLD_SCORE_THRESHOLD', 0):
+            bm25_hybrid_search('python', None, [], user_id='sparse_user', backend='sparse')
+            snapshot = _sparse_snapshots['sparse_user']
+            index_memories('sparse_user', [{'id': 'm7', 'memory': 'python python web'}, {'id': 'm3', 'memory': 'python rust'}])
+            remove_memories('sparse_user', ['m2'])
+            results = {}
+            for prompt in ['python', 'rust web', 'note about']:
+                results[prompt] = bm25_hybrid_search(prompt, None, [], top_n=4, user_id='sparse_user', backend='sparse')
+                assert results[prompt] == bm25_hybrid_search(prompt, None, [], top_n=4, user_id='sparse_user', backend='index')
+
+        assert _sparse_snapshots['sparse_user'] is snapshot
+        assert [r['id'] for r in results['python']][:2] == ['m7', 'm3']
+        assert 'm2' not in [r['id'] for r in results['python']]
+
+    def test_batch_search(self, sample_memories):
+        """Test that batch search returns one ranked result list per prompt"""
+        from app.utils.search import bm25_batch_search
+
+        with patch('app.utils.search._tokenize', side_effect=lambda text: text.lower().split()):
+            results = bm25_batch_search(['neural', 'language'], sample_memories, [], top_n=1, user_id='batch_user')
+
+        assert len(results) == 2
+        assert results[0][0]['id'] == 'mem_002'
+        assert results[1][0]['id'] == 'mem_003'
+
+
+class TestShardedScoring:
+    """Test memory indexes held by shard worker processes"""
+
+    WORDS = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta']
+
+    @pytest.fixture
+    def pool(self):
+        from app.utils.sharding import ShardPool
+
+        pool = ShardPool(3)
+        yield pool
+        pool.shutdown()
+
+    def _docs(self, n):
+        return [(f'd{i}', [self.WORDS[j % len(self.WORDS)] for j in range(i, i + 1 + i % 5)]) for i in range(n)]
+
+    def test_sharded_index_matches_bm25_index(self, pool):
+        """Test that shards scored with union statistics rank like one index, through adds, updates and removes"""
+        from app.utils.bm25 import BM25Index
+        from app.utils.sharding import ShardedIndex
+
+        sharded, reference = ShardedIndex(pool), BM25Index()
+        docs = self._docs(40)
+        sharded.append([(key, tokens, 1, {'key': key}) for key, tokens in docs])
+        for key, tokens in docs:
+            reference.add(key, tokens)
+        sharded.append([('d3', ['gamma', 'gamma'], 2, None), ('new', ['zeta', 'omega'], 1, None)])
+        reference.add('d3', ['gamma', 'gamma'])
+        reference.add('new', ['zeta', 'omega'])
+        sharded.delete(['d5', 'd8', 'missing'])
+        reference.remove('d5')
+        reference.remove('d8')
+
+        assert len(sharded) == len(reference)
+        assert sharded.total_len == reference.total_len
+        assert sharded.df_histogram() == reference.df_histogram()
+        for query in (['gamma', 'delta', 'zeta'], ['omega'], ['alpha', 'alpha']):
+            assert sharded.stats(set(query)) == pytest.approx(reference.stats(set(query)))
+            expected = reference.get_scores(query)
+            for key, score in sharded.top_k(query, 5).items():
+                assert score == pytest.approx(expected[key])
+            top = sorted(expected.values(), reverse=True)[:5]
+            assert sorted(sharded.top_k(query, 5).values(), reverse=True)[:5] == pytest.approx(top)
+        assert sharded.newest(2) == ['new', 'd3']
+        assert sharded.payload('d0') == {'key': 'd0'}
+        assert not sharded.lost
+
+    def test_lost_worker_marks_index_lost(self, pool):
+        """Test that an index whose worker restarted reports itself lost instead of scoring a partial corpus silently"""
+        from app.utils.sharding import ShardedIndex
+
+        index = ShardedIndex(pool)
+        index.append([(key, tokens, 1, None) for key, tokens in self._docs(12)])
+        pool._executors[1].shutdown()
+        pool._executors[1] = None
+        index.top_k(['gamma'], 3)
+
+        assert index.lost
+
+    def test_large_user_index_is_sharded_and_receives_deltas(self):
+        """Test that a user past BM25_SHARD_THRESHOLD is indexed in shards that writes reach as deltas"""
+        from app.utils.search import index_memories, remove_memories, user_indexes
+        from app.utils.sharding import ShardedIndex, shutdown_shard_pool
+
+        memories = [{'id': key, 'memory': ' '.join(tokens)} for key, tokens in self._docs(40)]
+        expected = bm25_hybrid_search("gamma delta zeta", memories, [], top_n=7)
+        try:
+            with patch('app.utils.memory.get_all_memories', return_value=memories) as mock_list, \
+                 patch('app.utils.search._record_retrievals'), \
+                 patch('app.utils.search.settings.COLD_SCORE_THRESHOLD', 0), \
+                 patch('app.utils.search.settings.BM25_SHARD_THRESHOLD', 10), \
+                 patch('app.utils.search.settings.BM25_SHARDS', 3):
+                sharded = bm25_hybrid_search("gamma delta zeta", None, [], top_n=7, user_id='big_user')
+                index_memories('big_user', [{'id': 'late', 'memory': 'omega omega'}])
+                remove_memories('big_user', ['d0'])
+                after = bm25_hybrid_search("omega alpha", None, [], top_n=3, user_id='big_user')
+                index = user_indexes.peek('big_user')
+        finally:
+            shutdown_shard_pool()
+
+        mock_list.assert_called_once()
+        assert isinstance(index, ShardedIndex)
+        assert [r['id'] for r in sharded] == [r['id'] for r in expected]
+        assert after[0]['id'] == 'late'
+        assert 'd0' not in [r['id'] for r in after]
+
+    @pytest.mark.asyncio
+    async def test_async_search_matches_sync(self, sample_memories):
+        """Test that the thread-offloaded search returns the same results"""
+        from app.utils.search import abm25_hybrid_search
+
+        result = await abm25_hybrid_search("neural networks", sample_memories, [], top_n=2)
+
+        assert result == bm25_hybrid_search("neural networks", sample_memories, [], top_n=2)
+
+
+class TestAnalyzers:
+    """Test the pluggable search analyzers"""
+
+    def test_regex_analyzer_lowercases_and_drops_punctuation(self):
+        """Test that the regex analyzer keeps words and contractions only"""
+        from app.utils.analyzers import regex_analyzer
+
+        assert regex_analyzer("What's Deep-Learning? It's GREAT!") == ["what's", 'deep', 'learning', "it's", 'great']
+
+    def test_get_analyzer_defaults_to_settings(self):
+        """Test that the configured analyzer is returned by default"""
+        from app.utils.analyzers import get_analyzer, regex_analyzer
+
+        with patch('app.utils.analyzers.settings') as mock_settings:
+            mock_settings.SEARCH_ANALYZER = 'regex'
+            assert get_analyzer() is regex_analyzer
+
+    def test_get_analyzer_unknown_name(self):
+        """Test that an unknown analyzer name raises ValueError"""
+        from app.utils.analyzers import get_analyzer
+
+        with pytest.raises(ValueError, match="Unknown search analyzer"):
+            get_analyzer('missing')
+
+    def test_register_custom_analyzer(self):
+        """Test that custom analyzers can be registered and selected"""
+        from app.utils.analyzers import ANALYZERS, get_analyzer, register_analyzer
+
+        register_analyzer('whitespace', str.split)
+        try:
+            assert get_analyzer('whitespace')("a b") == ['a', 'b']
+        finally:
+            ANALYZERS.pop('whitespace')
+
+    def test_nltk_loaded_lazily(self):
+        """Test that NLTK is only loaded when the nltk analyzer is first used"""
+        import app.utils.analyzers as analyzers
+
+        with patch.object(analyzers, '_nltk_tokenize', None), \
+             patch.object(analyzers, '_load_nltk', return_value=lambda text: text.split()) as mock_load:
+            assert analyzers.nltk_analyzer("Hello World") == ['hello', 'world']
+            mock_load.assert_called_once()
+
+
+class TestTokenCache:
+    """Test the tokenized-document LRU cache"""
+
+    def test_hit_and_miss_counters(self):
+        """Test that repeated lookups are served from the cache"""
+        from app.utils.token_cache import TokenCache
+
+        cache = TokenCache(max_bytes=10_000)
+        tokenize = Mock(side_effect=str.split)
+
+        assert cache.get_or_tokenize(('m', 1), "a b", tokenize) == ('a', 'b')
+        assert cache.get_or_tokenize(('m', 1), "a b", tokenize) == ('a', 'b')
+
+        tokenize.assert_called_once()
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_rate'] == 0.5
+
+    def test_byte_limit_evicts_least_recently_used(self):
+        """Test that the cache stays under its byte limit by evicting old entries"""
+        from app.utils.token_cache import TokenCache
+
+        probe = TokenCache(max_bytes=10_000)
+        probe.put('a', ['x' * 10])
+        entry_size = probe.current_bytes
+
+        cache = TokenCache(max_bytes=entry_size * 2)
+        cache.put('a', ['x' * 10])
+        cache.put('b', ['y' * 10])
+        cache.get('a')
+        cache.put('c', ['z' * 10])
+
+        assert cache.current_bytes <= cache.max_bytes
+        assert cache.get('b') is None
+        assert cache.get('a') == ('x' * 10,)
+        assert cache.stats()['evictions'] == 1
+
+    def test_oversized_entry_not_cached(self):
+        """Test that entries larger than the whole cache are returned but not stored"""
+        from app.utils.token_cache import TokenCache
+
+        cache = TokenCache(max_bytes=10)
+
+        assert cache.put('a', ['long token']) == ('long token',)
+        assert len(cache) == 0
+
+    def test_memory_version_change_retokenizes(self, sample_memories):
+        """Test that memories are re-tokenized only when their version changes"""
+        from app.utils.search import token_cache
+
+        token_cache.clear()
+        memory = dict(sample_memories[0])
+        tokenize = Mock(side_effect=lambda text: text.lower().split())
+        with patch('app.utils.search._tokenize', tokenize):
+            bm25_hybrid_search("machine", [memory], [], top_n=1)
+            bm25_hybrid_search("learning", [memory], [], top_n=1)
+            assert tokenize.call_count == 3  # memory once, two queries
+
+            memory['memory'] = 'Updated text'
+            memory['updated_at'] = '2024-02-01T10:00:00Z'
+            bm25_hybrid_search("updated", [memory], [], top_n=1)
+            assert tokenize.call_count == 5
+
+    def test_conversation_turns_are_cached(self, sample_conversation_history):
+        """Test that conversation turns hit the cache on repeated searches"""
+        from app.utils.search import token_cache
+
+        token_cache.clear()
+        with patch('app.utils.search._tokenize', side_effect=lambda text: text.lower().split()):
+            bm25_hybrid_search("deep", [], sample_conversation_history, top_n=1)
+            hits_before = token_cache.hits
+            bm25_hybrid_search("deep", [], sample_conversation_history, top_n=1)
+
+        assert token_cache.hits - hits_before == len(sample_conversation_history)
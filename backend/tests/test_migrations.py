@@ -0,0 +1,55 @@
+import sqlite3
+from unittest.mock import Mock, patch
+
+
+class TestSchemaMigrations:
+    """Test versioned migrations of the conversation database"""
+
+    def test_legacy_database_migrated_in_place(self, temp_db):
+        """Test that legacy rows keep their order and gain typed timestamps and turn ids"""
+        from app.utils.database import fetch_conversation_history, store_conversation, _connect
+        from app.utils.migrations import SCHEMA_VERSION, schema_version
+
+        conn = sqlite3.connect(temp_db)
+        conn.executemany("INSERT INTO conversation_history VALUES (?, ?, ?, ?)", [
+            ('u1', 'user', 'Hello', '9.5'),
+            ('u1', 'agent', 'Hi there!', '9.5'),
+            ('u1', 'user', 'Much older', '0.0'),
+        ])
+        conn.commit()
+        conn.close()
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            store_conversation("u1", "Newest", "Answer")
+            history = fetch_conversation_history("u1", limit=10)
+            db = _connect()
+            turns = db.execute("SELECT role, turn_id FROM conversation_history ORDER BY id").fetchall()
+            version = schema_version(db)
+
+        assert [content for _, content, _ in history] == ['Much older', 'Hello', 'Hi there!', 'Newest', 'Answer']
+        assert history[0][2] == 0.0 and history[1][2] == 9.5
+        assert turns == [('user', 1), ('agent', 1), ('user', 3), ('user', 4), ('agent', 4)]
+        assert version == SCHEMA_VERSION
+
+    def test_history_reads_use_index(self, temp_db):
+        """Test that per-user reads are an index range scan without a sort"""
+        from app.utils.database import _connect
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            plan = " ".join(row[-1] for row in _connect().execute(
+                "EXPLAIN QUERY PLAN SELECT role, content, timestamp FROM conversation_history "
+                "WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?", ('u1', 10)
+            ).fetchall())
+
+        assert "conversation_history_user_time" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_migrate_is_idempotent(self, tmp_path):
+        """Test that a migrated database is left untouched"""
+        from app.utils.migrations import SCHEMA_VERSION, migrate
+
+        conn = sqlite3.connect(str(tmp_path / "fresh.db"))
+        assert migrate(conn) == SCHEMA_VERSION
+        with patch('app.utils.migrations.MIGRATIONS', [(1, "boom", Mock(side_effect=AssertionError))]):
+            assert migrate(conn) == SCHEMA_VERSION
+        conn.close()
@@ -34,7 +34,7 @@ class TestMultiAgentPipeline:
     @pytest.mark.asyncio
     async def test_conversation_agent(self):
         state = MultiAgentState(user_id="test_user", prompt="What is AI?")
-        with patch('app.multiagent.agents.fetch_conversation_history', return_value=[('user', 'Hi', '123')]):
+        with patch('app.multiagent.agents.afetch_conversation_history', new_callable=AsyncMock, return_value=[('user', 'Hi', '123')]):
             new_state = await conversation_agent(state)
             assert hasattr(new_state, 'conversations')
             assert any('Hi' in c for c in [x[1] for x in new_state.conversations])
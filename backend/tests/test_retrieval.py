@@ -2,7 +2,7 @@ import pytest
 import sqlite3
 import tempfile
 import os
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, AsyncMock, patch, MagicMock, call
 from app.utils.database import fetch_conversation_history
 from app.utils.search import bm25_hybrid_search
 from app.utils.memory import fetch_cited_memories, write_memory
@@ -14,7 +14,7 @@ class TestConversationHistoryRetrieval:
     
     def test_fetch_conversation_history_empty(self, temp_db):
         """Test fetching conversation history when no conversations exist"""
-        with patch('app.utils.database.sqlite3.connect') as mock_connect:
+        with patch('app.utils.database._connect') as mock_connect:
             mock_conn = Mock()
             mock_cursor = Mock()
             mock_connect.return_value = mock_conn
@@ -24,8 +24,8 @@ class TestConversationHistoryRetrieval:
             result = fetch_conversation_history("test_user", limit=10)
             
             assert result == []
-            # Should call execute twice (CREATE TABLE and SELECT)
-            assert mock_cursor.execute.call_count == 2
+            # Only the SELECT runs; the schema is created once per database
+            assert mock_cursor.execute.call_count == 1
     
     def test_fetch_conversation_history_with_data(self, temp_db):
         """Test fetching conversation history with existing data"""
@@ -46,7 +46,7 @@ class TestConversationHistoryRetrieval:
             ('agent', 'I am fine, thank you!', '1641081600.0')
         ]
         
-        with patch('app.utils.database.sqlite3.connect') as mock_connect:
+        with patch('app.utils.database._connect') as mock_connect:
             mock_conn = Mock()
             mock_cursor = Mock()
             mock_connect.return_value = mock_conn
@@ -66,7 +66,7 @@ class TestConversationHistoryRetrieval:
             for i in range(15)
         ]
         
-        with patch('app.utils.database.sqlite3.connect') as mock_connect:
+        with patch('app.utils.database._connect') as mock_connect:
             mock_conn = Mock()
             mock_cursor = Mock()
             mock_connect.return_value = mock_conn
@@ -76,8 +76,41 @@ class TestConversationHistoryRetrieval:
             result = fetch_conversation_history("test_user", limit=5)
             
             assert len(result) == 5
-            # Should call execute twice (CREATE TABLE and SELECT)
-            assert mock_cursor.execute.call_count == 2
+            # Only the SELECT runs; the schema is created once per database
+            assert mock_cursor.execute.call_count == 1
+
+
+    @pytest.mark.asyncio
+    async def test_async_store_and_fetch_round_trip(self, temp_db):
+        """Test the async conversation store API"""
+        from app.utils.database import afetch_conversation_history, astore_conversation
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            await astore_conversation("async_user", "Hello", "Hi there!")
+            result = await afetch_conversation_history("async_user", limit=10)
+
+        assert [(role, content) for role, content, _ in result] == [('user', 'Hello'), ('agent', 'Hi there!')]
+
+    @pytest.mark.asyncio
+    async def test_async_fetch_does_not_block_event_loop(self):
+        """Test that a slow database call runs off the event loop"""
+        import asyncio
+        import time
+        from app.utils.database import afetch_conversation_history
+
+        ticks = []
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        slow_fetch = lambda *args, **kwargs: time.sleep(0.2) or []
+        with patch('app.utils.database.fetch_conversation_history', side_effect=slow_fetch):
+            started = time.monotonic()
+            await asyncio.gather(afetch_conversation_history("u1"), ticker())
+
+        # The ticker finished while the fetch was still sleeping
+        assert len(ticks) == 5 and ticks[-1] - started < 0.15
 
 
 class TestBM25HybridSearch:
@@ -205,6 +238,111 @@ class TestMemoryRetrieval:
             assert result[0]['title'] == '[Error fetching memory]'
             assert 'Database error' in result[0]['content']
 
+    def test_iter_memories_pages_through_collection(self, mock_mem0_client):
+        """Test that memories are read from the collection in bounded pages"""
+        from app.utils.memory import iter_memories
+
+        stored = [(f"mem_{i}", {'data': f"memory {i}", 'user_id': 'u1', 'topic': 'ai'}) for i in range(5)]
+        def collection_get(where, limit, offset, include):
+            page = stored[offset:offset + limit]
+            return {'ids': [i for i, _ in page], 'metadatas': [p for _, p in page]}
+        mock_mem0_client.vector_store = Mock()
+        mock_mem0_client.vector_store.collection.get.side_effect = collection_get
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            pages = list(iter_memories("u1", filters={'topic': 'ai'}, page_size=2, max_candidates=4))
+
+        assert [[m['id'] for m in page] for page in pages] == [['mem_0', 'mem_1'], ['mem_2', 'mem_3']]
+        assert pages[0][0]['metadata'] == {'topic': 'ai'}
+        first_call = mock_mem0_client.vector_store.collection.get.call_args_list[0]
+        assert first_call.kwargs['where'] == {'$and': [{'user_id': 'u1'}, {'topic': 'ai'}]}
+        mock_mem0_client.get_all.assert_not_called()
+
+    def test_iter_memories_falls_back_to_get_all(self, mock_mem0_client, sample_memories):
+        """Test filtering and paging over get_all when no collection is available"""
+        from app.utils.memory import iter_memories
+
+        tagged = [dict(m, metadata={'topic': 'ml' if i < 2 else 'other'}) for i, m in enumerate(sample_memories)]
+        mock_mem0_client.get_all.return_value = {'results': tagged}
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            pages = list(iter_memories("u1", filters={'topic': 'ml'}, page_size=1))
+
+        mock_mem0_client.get_all.assert_called_once_with(user_id="u1")
+        assert [page[0]['id'] for page in pages] == ['mem_001', 'mem_002']
+
+    def test_get_all_memories_keeps_newest_candidates(self, mock_mem0_client, sample_memories):
+        """Test that get_all_memories is bounded to the most recent memories"""
+        from app.utils.memory import get_all_memories
+
+        mock_mem0_client.get_all.return_value = {'results': sample_memories}
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            result = get_all_memories("u1", max_candidates=2)
+
+        newest = sorted(sample_memories, key=lambda m: m.get('updated_at') or m['created_at'], reverse=True)[:2]
+        assert [m['id'] for m in result] == [m['id'] for m in newest]
+
+    def test_get_all_memories_reads_only_newest_payloads(self, mock_mem0_client, caplog):
+        """Test that the bound is applied in the store query and the truncation is logged"""
+        import logging
+        from app.utils.memory import get_all_memories
+
+        stored = {f"mem_{i}": {'data': f"memory {i}", 'user_id': 'u1', 'created_at': f"2024-01-0{i + 1}T10:00:00Z"} for i in range(5)}
+        def collection_get(ids=None, where=None, limit=None, offset=0, include=()):
+            chosen = ids if ids is not None else list(stored)[offset:offset + limit]
+            return {'ids': chosen, 'metadatas': [stored[i] for i in chosen] if 'metadatas' in include else None}
+        mock_mem0_client.vector_store = Mock()
+        mock_mem0_client.vector_store.collection.get.side_effect = collection_get
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), caplog.at_level(logging.INFO, logger="memory"):
+            result = get_all_memories("u1", max_candidates=2)
+
+        assert [m['id'] for m in result] == ['mem_4', 'mem_3']
+        payload_calls = [c for c in mock_mem0_client.vector_store.collection.get.call_args_list if 'metadatas' in c.kwargs['include']]
+        assert [c.kwargs['ids'] for c in payload_calls] == [['mem_3', 'mem_4']]
+        assert "newest 2 of 5 memories" in caplog.text
+
+    def test_fetch_cited_memories_reuses_records_in_hand(self, mock_mem0_client, sample_memories):
+        """Test that memories passed by the caller are not fetched again"""
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            citations = [(m['id'], m['created_at']) for m in sample_memories]
+
+            result = fetch_cited_memories(citations, memories=sample_memories)
+
+        mock_mem0_client.get.assert_not_called()
+        assert [mem['content'] for mem in result] == [m['memory'] for m in sample_memories]
+
+    def test_fetch_cited_memories_batches_missing_ids(self, mock_mem0_client, sample_memories):
+        """Test that missing records are fetched with one lookup by id list"""
+        mock_mem0_client.vector_store = Mock()
+        mock_mem0_client.vector_store.collection.get.return_value = {
+            'ids': ['mem_x'],
+            'metadatas': [{'data': 'Fetched in a batch', 'created_at': '2024-02-01T10:00:00Z'}],
+        }
+        citations = [(sample_memories[0]['id'], 'N/A'), ('mem_x', 'N/A'), ('mem_gone', '2024-03-01')]
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            result = fetch_cited_memories(citations, memories=sample_memories[:1])
+
+        mock_mem0_client.vector_store.collection.get.assert_called_once_with(ids=['mem_x', 'mem_gone'])
+        mock_mem0_client.get.assert_not_called()
+        assert result[1]['content'] == 'Fetched in a batch'
+        assert result[1]['timestamp'] == '2024-02-01T10:00:00Z'
+        assert result[2]['title'] == '[Memory not found]'
+        assert result[2]['timestamp'] == '2024-03-01'
+
+    def test_fetch_cited_memories_batch_failure_falls_back(self, mock_mem0_client):
+        """Test that a failing batched lookup falls back to per-id gets"""
+        mock_mem0_client.vector_store = Mock()
+        mock_mem0_client.vector_store.collection.get.side_effect = Exception("unsupported")
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            result = fetch_cited_memories([('mem_001', 'N/A')])
+
+        mock_mem0_client.get.assert_called_once_with('mem_001')
+        assert result[0]['content'] == 'Test memory content'
+
 
 class TestContextFormatting:
     """Test context formatting functionality"""
@@ -252,6 +390,13 @@ class TestContextFormatting:
         expected = '*Past Conversations:*\n\n\n*Relevant Memories (Hybrid Search):*\n\n'
         assert result == expected
 
+    def test_format_context_summaries(self):
+        """Test that summaries of older turns are labelled as such"""
+        result = format_context([], [('summary', 'User: Asked about sqlite.', 5.0), ('user', 'Hello', 9.0)])
+
+        assert 'Summary of earlier messages (until 5.0):\nUser: Asked about sqlite.' in result
+        assert 'Message Index: 1\nTimestamp: 9.0\nHello' in result
+
 
 class TestMemoryWriting:
     """Test memory writing functionality"""
@@ -270,5 +415,722 @@ class TestMemoryWriting:
         
         with patch('app.utils.memory.mem0_client', mock_mem0_client):
             result = write_memory("Test memory content", "test_user")
-            
-            assert result is None
\ No newline at end of file
+
+            assert result is None
+
+    def test_repeated_prompt_skips_extraction(self, mock_mem0_client, temp_db):
+        """Test that a resent prompt returns the existing memory ids without calling mem0"""
+        from app.utils.memory import write_dedupe
+
+        mock_mem0_client.add.return_value = {'results': [{'id': 'mem_1', 'memory': 'Likes tea', 'event': 'ADD'}]}
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.database.DB_PATH', temp_db), \
+             patch.object(write_dedupe, 'window_seconds', 3600), \
+             patch.object(write_dedupe, 'skipped', 0):
+            write_memory("I like tea", "u1")
+            repeat = write_memory("  i LIKE   tea ", "u1")
+            other_user = write_memory("I like tea", "u2")
+
+            assert write_dedupe.skipped == 1
+
+        assert mock_mem0_client.add.call_count == 2
+        assert repeat == {'results': [{'id': 'mem_1', 'event': 'NONE'}], 'deduplicated': True}
+        assert other_user == mock_mem0_client.add.return_value
+
+    def test_failed_write_is_not_recorded(self, mock_mem0_client, temp_db):
+        """Test that a failed write can be retried with the same prompt"""
+        from app.utils.memory import write_dedupe
+
+        mock_mem0_client.add.side_effect = [Exception("rate limited"), {'results': []}]
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.database.DB_PATH', temp_db), \
+             patch.object(write_dedupe, 'window_seconds', 3600):
+            assert write_memory("I like tea", "u1") is None
+            assert write_memory("I like tea", "u1") == {'results': []}
+            assert write_memory("I like tea", "u1")['deduplicated'] is True
+
+        assert mock_mem0_client.add.call_count == 2
+
+
+    def test_queued_write_checks_database_in_worker(self, mock_mem0_client, temp_db):
+        """Test that async writes look up earlier writes on the ingest worker, not the caller's thread"""
+        import threading
+        from app.utils import memory, write_dedupe as dedupe_module
+
+        mock_mem0_client.add.return_value = {'results': [{'id': 'mem_1', 'memory': 'Likes tea', 'event': 'ADD'}]}
+        lookup_threads = []
+        find = dedupe_module.find_memory_write
+
+        def tracked_find(*args, **kwargs):
+            lookup_threads.append(threading.current_thread().name)
+            return find(*args, **kwargs)
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.database.DB_PATH', temp_db), \
+             patch.object(memory.write_dedupe, 'window_seconds', 3600):
+            write_memory("I like tea", "u1")
+            with patch.object(dedupe_module, 'find_memory_write', side_effect=tracked_find), \
+                 patch.object(memory.settings, 'MEMORY_WRITE_MODE', 'async'):
+                assert write_memory("I like tea", "u1") == {'results': [], 'queued': True}
+                memory.shutdown_memory_ingest(timeout=5)
+
+        assert mock_mem0_client.add.call_count == 1
+        assert lookup_threads == ['memory-ingest']
+
+
+class TestMemoryIngestQueue:
+    """Test the write-behind memory ingest queue"""
+
+    def test_batches_prompts_per_user(self):
+        """Test that queued prompts are written in one call per user"""
+        from app.utils.ingest import MemoryIngestQueue
+
+        calls = []
+        ingest = MemoryIngestQueue(lambda prompts, user_id: calls.append((user_id, prompts)), batch_size=10)
+        with patch.object(ingest, '_ensure_worker'):
+            for prompt, user_id in (("a", "u1"), ("b", "u2"), ("c", "u1")):
+                ingest.submit(prompt, user_id)
+        assert ingest.depth() == 3
+
+        ingest._ensure_worker()
+        assert ingest.flush(timeout=5)
+        ingest.shutdown()
+        assert calls == [("u1", ["a", "c"]), ("u2", ["b"])]
+        assert ingest.depth() == 0
+        assert ingest.pending("u1") == []
+
+    def test_retries_then_drops(self):
+        """Test that failed writes are retried and dropped after max_retries"""
+        from app.utils.ingest import MemoryIngestQueue
+
+        write = Mock(side_effect=[Exception("rate limited"), None, Exception("down"), Exception("down")])
+        ingest = MemoryIngestQueue(write, max_retries=1, retry_backoff=0.01)
+
+        ingest.submit("kept", "u1")
+        assert ingest.flush(timeout=5)
+        ingest.submit("lost", "u1")
+        assert ingest.flush(timeout=5)
+        ingest.shutdown()
+
+        assert write.call_count == 4
+        assert (ingest.written, ingest.failed) == (1, 1)
+
+    def test_rejects_when_full(self):
+        """Test that submit reports a full queue instead of blocking"""
+        from app.utils.ingest import MemoryIngestQueue
+
+        ingest = MemoryIngestQueue(Mock(), max_size=1)
+        with patch.object(ingest, '_ensure_worker'):
+            assert ingest.submit("one", "u1")
+            assert not ingest.submit("two", "u1")
+        assert [m['memory'] for m in ingest.pending("u1")] == ["one"]
+
+    def test_async_write_exposes_pending_memory(self, mock_mem0_client, temp_db):
+        """Test read-your-writes: a queued prompt is searchable before extraction finishes"""
+        import threading
+        from app.utils import memory
+        from app.utils.memory import get_all_memories, shutdown_memory_ingest
+
+        release = threading.Event()
+        mock_mem0_client.add.side_effect = lambda *args, **kwargs: release.wait(5) and {'results': []}
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.database.DB_PATH', temp_db), \
+             patch.object(memory.write_dedupe, 'window_seconds', 3600), \
+             patch.object(memory.settings, 'MEMORY_WRITE_MODE', 'async'):
+            assert write_memory("I am allergic to peanuts", "ryw_user") == {'results': [], 'queued': True}
+            found = bm25_hybrid_search("peanuts", get_all_memories("ryw_user"), [], top_n=1, user_id="ryw_user")
+            assert found[0]['meta']['memory'] == "I am allergic to peanuts"
+            assert found[0]['id'].startswith("pending:")
+            # Resending while the first copy is queued does not queue it again
+            assert write_memory("I am allergic to peanuts", "ryw_user")['results'][0]['id'] == found[0]['id']
+
+            release.set()
+            shutdown_memory_ingest(timeout=5)
+            assert get_all_memories("ryw_user") == []
+
+        mock_mem0_client.add.assert_called_once()
+
+
+class TestMemorySnapshotCache:
+    """Test the per-user memory read-through cache"""
+
+    def test_repeat_listing_is_served_from_cache(self, mock_mem0_client, sample_memories):
+        """Test that a second listing does not hit the vector store"""
+        from app.utils.memory import get_all_memories, memory_cache
+
+        mock_mem0_client.get_all.return_value = {'results': sample_memories}
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            first = get_all_memories("cached_user")
+            second = get_all_memories("cached_user")
+
+        mock_mem0_client.get_all.assert_called_once_with(user_id="cached_user")
+        assert first == second
+        assert memory_cache.stats()['hits'] == 1
+
+    def test_write_patches_snapshot(self, mock_mem0_client, sample_memories):
+        """Test that mem0 events are applied to the cached listing without a refetch"""
+        from app.utils.memory import get_all_memories, memory_cache
+
+        mock_mem0_client.get_all.return_value = {'results': sample_memories}
+        mock_mem0_client.add.return_value = {'results': [
+            {'id': 'mem_new', 'memory': 'Prefers Rust', 'event': 'ADD'},
+            {'id': 'mem_002', 'memory': 'Deep learning', 'event': 'DELETE'},
+        ]}
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            get_all_memories("patched_user")
+            get_all_memories("patched_user", filters={'topic': 'ml'})
+            write_memory("I prefer Rust now", "patched_user")
+            result = get_all_memories("patched_user")
+
+        # One fetch per listing key; the write did not force a refetch
+        assert mock_mem0_client.get_all.call_count == 2
+        assert [m['id'] for m in result] == ['mem_new', 'mem_003', 'mem_001']
+        assert memory_cache.stats()['patches'] == 1
+        assert memory_cache.stats()['invalidations'] == 1
+
+    def test_entries_expire_and_evict(self):
+        """Test TTL expiry and byte-bounded LRU eviction"""
+        import time
+        from app.utils.memory_cache import MemorySnapshotCache, _sizeof
+
+        memories = [{'id': f'm{i}', 'memory': 'x' * 100} for i in range(5)]
+        cache = MemorySnapshotCache(max_bytes=10 ** 9, ttl_seconds=60)
+        cache.put(cache.key('u1'), memories)
+        with patch('app.utils.memory_cache.time.monotonic', return_value=time.monotonic() + 61):
+            assert cache.get(cache.key('u1')) is None
+
+        # Room for one listing only: caching a second evicts the first
+        cache = MemorySnapshotCache(max_bytes=int(_sizeof(memories) * 1.5), ttl_seconds=60)
+        cache.put(cache.key('u1'), memories)
+        cache.put(cache.key('u2'), memories)
+        assert cache.get(cache.key('u1')) is None
+        assert cache.get(cache.key('u2')) == memories
+        assert cache.stats()['evictions'] == 1
+
+
+class TestOnnxEmbedder:
+    """Test the local ONNX embedder and its on-disk cache"""
+
+    class _Encoding:
+        def __init__(self, ids):
+            self.ids = ids + [0] * (4 - len(ids))
+            self.attention_mask = [1] * len(ids) + [0] * (4 - len(ids))
+            self.type_ids = [0] * 4
+
+    def _embedder(self, tmp_path, batch_size=2):
+        import numpy as np
+        from app.utils.embeddings import EmbeddingCache, OnnxEmbedder
+
+        embedder = OnnxEmbedder("model.onnx", "tokenizer.json", cache=EmbeddingCache(str(tmp_path / "emb.db")), batch_size=batch_size)
+        embedder._tokenizer = Mock()
+        embedder._tokenizer.encode_batch.side_effect = lambda texts: [self._Encoding([len(t), 1]) for t in texts]
+        embedder._session = Mock()
+        embedder._session.get_inputs.return_value = [Mock(), Mock()]
+        embedder._session.get_inputs.return_value[0].name = 'input_ids'
+        embedder._session.get_inputs.return_value[1].name = 'attention_mask'
+        # Token embeddings: [id, 1, 0] per token, so mean pooling is easy to check
+        embedder._session.run.side_effect = lambda outputs, feeds: [np.stack([
+            np.stack([[float(i), 1.0, 0.0] for i in row]) for row in feeds['input_ids']
+        ])]
+        return embedder
+
+    def test_mean_pools_and_normalizes(self, tmp_path):
+        """Test pooling over the attention mask and L2 normalization"""
+        embedder = self._embedder(tmp_path)
+
+        vector = embedder.embed("abc")
+
+        # Mean of [3, 1, 0] and [1, 1, 0] is [2, 1, 0]
+        assert vector == pytest.approx([2 / 5 ** 0.5, 1 / 5 ** 0.5, 0.0])
+
+    def test_batches_and_never_embeds_twice(self, tmp_path):
+        """Test batched inference and that cached texts skip the model, across instances"""
+        embedder = self._embedder(tmp_path, batch_size=2)
+
+        first = embedder.embed_batch(["a", "bb", "a", "ccc"])
+        assert embedder._session.run.call_count == 2  # three distinct texts in batches of two
+        assert first[0] == first[2]
+
+        again = self._embedder(tmp_path)
+        assert again.embed_batch(["ccc", "bb"]) == [first[3], first[1]]
+        again._session.run.assert_not_called()
+
+    def test_client_configures_local_embedder(self):
+        """Test that the onnx provider reaches mem0 through its config, with the model's vector size"""
+        from app.utils import memory
+
+        with patch('app.utils.memory.mem0_client', None), \
+             patch('mem0.Memory') as mock_memory, \
+             patch('app.utils.memory.local_embedder') as mock_local, \
+             patch.object(memory.settings, 'EMBEDDING_PROVIDER', 'onnx'):
+            mock_local.return_value.dimensions = 384
+            memory.get_memory_client()
+
+        embedder = mock_memory.from_config.call_args[0][0]['embedder']
+        assert embedder == {'provider': 'langchain', 'config': {'model': mock_local.return_value, 'embedding_dims': 384}}
+
+    def test_embedder_satisfies_mem0_langchain_provider(self, tmp_path):
+        """Test that mem0's langchain provider accepts the local embedder and embeds through it"""
+        from mem0.configs.embeddings.base import BaseEmbedderConfig
+        from mem0.embeddings.langchain import LangchainEmbedding
+
+        embedder = self._embedder(tmp_path)
+        provider = LangchainEmbedding(BaseEmbedderConfig(model=embedder, embedding_dims=3))
+
+        assert provider.embed("abc") == embedder.embed("abc")
+
+    def test_mismatched_collection_refuses_to_start(self):
+        """Test that an embedder whose vector size differs from the stored vectors stops startup"""
+        from app.utils import memory
+
+        client = Mock()
+        client.embedding_model.config.embedding_dims = 384
+        client.vector_store.collection.get.return_value = {'embeddings': [[0.0] * 1536]}
+        with patch('app.utils.memory.mem0_client', None), \
+             patch('mem0.Memory') as mock_memory:
+            mock_memory.from_config.return_value = client
+            with pytest.raises(memory.EmbeddingDimensionError):
+                memory.warmup_memory_client()
+            client.vector_store.collection.get.return_value = {'embeddings': [[0.0] * 384]}
+            assert memory.get_memory_client() is client
+
+
+class TestMemoryClient:
+    """Test lazy creation of the mem0 client"""
+
+    def test_import_does_not_build_client(self):
+        """Test that importing the app neither imports mem0 nor touches disk"""
+        import subprocess
+        import sys
+
+        backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = (
+            "import os, sys; before = set(os.listdir('.')); import main; "
+            "assert 'mem0' not in sys.modules; assert set(os.listdir('.')) == before"
+        )
+        env = dict(os.environ, OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY', 'sk-test'))
+        result = subprocess.run([sys.executable, "-c", code], cwd=backend, env=env, capture_output=True, text=True)
+
+        assert result.returncode == 0, result.stderr
+
+    def test_client_built_once_from_settings(self):
+        """Test that the client is created on first use from settings and then reused"""
+        from app.utils import memory
+
+        with patch('app.utils.memory.mem0_client', None), \
+             patch('mem0.Memory') as mock_memory, \
+             patch.object(memory.settings, 'MEMORY_DB_PATH', '/tmp/memories'):
+            first = memory.get_memory_client()
+            second = memory.get_memory_client()
+
+        mock_memory.from_config.assert_called_once()
+        config = mock_memory.from_config.call_args.args[0]
+        assert config['vector_store']['config']['path'] == '/tmp/memories'
+        assert first is second is mock_memory.from_config.return_value
+
+    def test_shutdown_releases_client(self):
+        """Test that shutdown drops the client so the next use recreates it"""
+        from app.utils import memory
+
+        with patch('app.utils.memory.mem0_client', Mock()):
+            memory.shutdown_memory_client()
+            assert memory.mem0_client is None
+
+    def test_warmup_failure_does_not_raise(self):
+        """Test that a failing warmup is logged instead of stopping startup"""
+        from app.utils import memory
+
+        with patch('app.utils.memory.get_memory_client', side_effect=Exception("no network")):
+            memory.warmup_memory_client()
+
+
+class TestMemoryCompaction:
+    """Test near-duplicate memory compaction"""
+
+    @staticmethod
+    def _memories():
+        return [
+            {'id': 'a', 'memory': 'User prefers Python for machine learning projects', 'created_at': '2024-01-01T10:00:00Z'},
+            {'id': 'b', 'memory': 'User prefers Python for machine learning projects and tools', 'created_at': '2024-01-03T10:00:00Z'},
+            {'id': 'c', 'memory': 'User lives in Berlin and works remotely', 'created_at': '2024-01-02T10:00:00Z'},
+        ]
+
+    def test_clusters_near_duplicates(self):
+        """Test that only similar memories are grouped together"""
+        from app.utils.compaction import cluster_near_duplicates
+
+        clusters = cluster_near_duplicates(self._memories(), threshold=0.7)
+
+        assert [sorted(m['id'] for m in cluster) for cluster in clusters] == [['a', 'b']]
+        assert cluster_near_duplicates(self._memories(), threshold=0.95) == []
+
+    def test_compact_user_merges_and_records_aliases(self, mock_mem0_client, temp_db):
+        """Test that duplicates are deleted and their ids resolve to the canonical memory"""
+        from app.utils.compaction import compact_user
+
+        memories = self._memories()
+        mock_mem0_client.get_all.return_value = {'results': memories}
+        mock_mem0_client.get.return_value = memories[1]
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.database.DB_PATH', temp_db):
+            report = compact_user("u1", threshold=0.7)
+            cited = fetch_cited_memories([('a', 'N/A')])
+
+        mock_mem0_client.delete.assert_called_once_with('a')
+        assert report['clusters'] == 1
+        assert report['records_reclaimed'] == 1
+        assert report['bytes_reclaimed'] == len(memories[0]['memory'])
+        assert cited[0]['id'] == 'a'
+        assert cited[0]['memory_id'] == 'b'
+        assert cited[0]['content'] == memories[1]['memory']
+
+    def test_dry_run_deletes_nothing(self, mock_mem0_client, temp_db):
+        """Test that a dry run only reports"""
+        from app.utils.compaction import compact_user
+        from app.utils.database import resolve_memory_aliases
+
+        mock_mem0_client.get_all.return_value = {'results': self._memories()}
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.database.DB_PATH', temp_db):
+            report = compact_user("u1", threshold=0.7, dry_run=True)
+            aliases = resolve_memory_aliases(['a'])
+
+        mock_mem0_client.delete.assert_not_called()
+        assert report['records_reclaimed'] == 1
+        assert aliases == {}
+
+    def test_run_compaction_resumes_from_cursor(self, temp_db):
+        """Test that each run picks up after the last user and wraps around"""
+        from app.utils import compaction
+        from app.utils.database import store_conversation
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            for user_id in ('u1', 'u2', 'u3'):
+                store_conversation(user_id, "hello", "hi")
+            seen = []
+            with patch.object(compaction, 'compact_user', side_effect=lambda user_id, **kwargs: seen.append(user_id) or
+                              {'memories_scanned': 0, 'clusters': 0, 'records_reclaimed': 0, 'bytes_reclaimed': 0}):
+                compaction.run_compaction(max_users=2)
+                compaction.run_compaction(max_users=2)
+                compaction.run_compaction(max_users=2)
+
+        assert seen == ['u1', 'u2', 'u3', 'u1', 'u2']
+
+    def test_failing_user_does_not_stall_the_scan(self, temp_db):
+        """Test that a user whose job raises is skipped and the cursor still advances"""
+        from app.utils.database import store_conversation
+        from app.utils.maintenance import run_user_batch
+
+        def process(user_id):
+            if user_id == 'u1':
+                raise RuntimeError("boom")
+            return {'done': 1}
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            for user_id in ('u1', 'u2', 'u3'):
+                store_conversation(user_id, "hello", "hi")
+            first = run_user_batch("test_cursor", process, ('done',), max_users=2)
+            second = run_user_batch("test_cursor", process, ('done',), max_users=2)
+
+        assert (first['users_scanned'], first['done']) == (1, 1)
+        assert [report['done'] for report in second['users']] == [1]
+
+
+class TestMemoryTiering:
+    """Test hot/cold memory tiering"""
+
+    @staticmethod
+    def _memories():
+        return [
+            {'id': 'old', 'memory': 'User once asked about medieval castle architecture', 'created_at': '2020-01-01T10:00:00Z'},
+            {'id': 'used', 'memory': 'User studies reinforcement learning', 'created_at': '2020-01-01T10:00:00Z'},
+            {'id': 'new', 'memory': 'User prefers concise answers', 'created_at': '2999-01-01T10:00:00Z'},
+        ]
+
+    def test_stale_memories_use_access_stats(self, temp_db):
+        """Test that recently retrieved or cited memories stay hot"""
+        from app.utils.tiering import stale_memories
+        from app.utils.database import record_memory_access
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            record_memory_access(['used'], cited=True)
+            stale = stale_memories(self._memories(), cold_after_days=30)
+
+        assert [m['id'] for m in stale] == ['old']
+
+    def test_archived_memories_searched_only_as_fallback(self, mock_mem0_client, temp_db):
+        """Test that cold memories are excluded unless hot results score poorly"""
+        from app.utils import search
+        from app.utils.tiering import archive_user
+
+        memories = self._memories()
+        mock_mem0_client.get_all.return_value = {'results': memories}
+        mock_mem0_client.get.return_value = None
+        hot = memories[1:]
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.database.DB_PATH', temp_db):
+            report = archive_user("u1", cold_after_days=30)
+            strong = bm25_hybrid_search("reinforcement learning", hot, [], top_n=1, user_id="u1")
+            weak = bm25_hybrid_search("castle architecture", hot, [], top_n=1, user_id="u1")
+            cited = fetch_cited_memories([('old', 'N/A')])
+
+        mock_mem0_client.delete.assert_has_calls([call('old'), call('used')], any_order=True)
+        assert report['archived'] == 2
+        assert strong[0]['id'] == 'used'
+        assert weak[0]['id'] == 'old'
+        assert weak[0]['meta']['tier'] == 'cold'
+        assert ('memory', 'old') not in search.user_indexes.get("u1")
+        assert cited[0]['content'] == memories[0]['memory']
+
+    def test_search_and_citations_record_access(self, mock_mem0_client, temp_db, sample_memories):
+        """Test that retrievals and citations feed the access statistics"""
+        from app.utils.database import load_memory_access
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.database.DB_PATH', temp_db):
+            results = bm25_hybrid_search("machine learning", sample_memories, [], top_n=1, user_id="u1")
+            fetch_cited_memories([(results[0]['id'], 'N/A')], memories=sample_memories, user_id="u1")
+            access = load_memory_access([m['id'] for m in sample_memories], user_id="u1")
+
+        assert access == {results[0]['id']: {'last_access': access[results[0]['id']]['last_access'], 'retrievals': 1, 'citations': 1}}
+
+    @pytest.mark.asyncio
+    async def test_async_citations_skip_pending_access(self, mock_mem0_client, temp_db, sample_memories):
+        """Test that the async variant cites placeholders without recording access for them"""
+        from app.utils.memory import afetch_cited_memories
+        from app.utils.database import load_memory_access
+
+        pending = {'id': 'pending:abc', 'memory': 'Queued prompt', 'created_at': 'N/A'}
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.database.DB_PATH', temp_db), \
+             patch('app.utils.memory.record_memory_access') as mock_record:
+            cited = await afetch_cited_memories([('pending:abc', 'N/A'), ('mem_001', 'N/A')], memories=[pending] + sample_memories, user_id="u1")
+
+        assert [c['memory_id'] for c in cited] == ['pending:abc', 'mem_001']
+        mock_record.assert_called_once_with(['mem_001'], cited=True, user_id="u1")
+
+
+class TestFusedHybridSearch:
+    """Test vector + BM25 fusion"""
+
+    def test_reciprocal_rank_fusion(self):
+        """Test that documents ranked well in several lists come first"""
+        from app.utils.search import reciprocal_rank_fusion
+
+        fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'd']], k=60)
+
+        assert [key for key, _ in fused] == ['b', 'a', 'd', 'c']
+        assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+    def test_fused_search_combines_vector_and_lexical(self, mock_mem0_client, sample_memories, sample_conversation_history):
+        """Test that fused results include vector hits, listed memories and conversation turns"""
+        from app.utils.memory import memory_cache
+        from app.utils.search import fused_hybrid_search, user_indexes
+
+        user_indexes.drop('fused_user')
+        memory_cache.invalidate('fused_user')
+        # mem_001 is only in the user's memory listing, mem_003 only in the vector results
+        mock_mem0_client.get_all.return_value = {'results': sample_memories[:2]}
+        mock_mem0_client.search.return_value = {'results': [dict(sample_memories[2], score=0.9)]}
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            results = fused_hybrid_search("machine learning language", 'fused_user', sample_conversation_history, top_n=10, vector_k=5)
+
+        mock_mem0_client.search.assert_called_once_with(query="machine learning language", user_id='fused_user', limit=5)
+        memory_ids = [r['id'] for r in results if r['type'] == 'memory']
+        assert memory_ids[0] == 'mem_003'
+        assert 'mem_001' in memory_ids
+        assert any(r['type'] == 'conversation' and 'machine learning' in r['content'].lower() for r in results)
+
+    def test_fused_search_respects_top_n(self, mock_mem0_client, sample_memories):
+        """Test that the fused result count is bounded by top_n"""
+        from app.utils.memory import memory_cache
+        from app.utils.search import fused_hybrid_search, user_indexes
+
+        user_indexes.drop('fused_user')
+        memory_cache.invalidate('fused_user')
+        mock_mem0_client.search.return_value = {'results': sample_memories}
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            results = fused_hybrid_search("learning", 'fused_user', [], top_n=2)
+
+        assert len(results) == 2
+
+    def test_fused_search_vector_store_error(self, mock_mem0_client):
+        """Test that vector store failures degrade to lexical-only results"""
+        from app.utils.memory import memory_cache
+        from app.utils.search import fused_hybrid_search, user_indexes
+
+        user_indexes.drop('fused_user')
+        memory_cache.invalidate('fused_user')
+        mock_mem0_client.search.side_effect = Exception("Vector store down")
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            results = fused_hybrid_search("hello", 'fused_user', [('user', 'hello there', '1.0')], top_n=5)
+
+        assert results == [{'type': 'conversation', 'index': 0, 'role': 'user', 'timestamp': '1.0', 'content': 'hello there'}]
+
+
+    def test_fused_lexical_leg_searches_the_memory_index(self, mock_mem0_client, sample_memories):
+        """Test that the lexical leg lists memories once to build the index and then sees writes as deltas"""
+        from app.utils.memory import memory_cache
+        from app.utils.search import fused_hybrid_search, index_memories, user_indexes
+
+        user_indexes.drop('fused_user')
+        memory_cache.invalidate('fused_user')
+        mock_mem0_client.get_all.return_value = {'results': sample_memories}
+        mock_mem0_client.search.return_value = {'results': []}
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client), \
+             patch('app.utils.search._record_retrievals'):
+            first = fused_hybrid_search("machine learning", 'fused_user', [], top_n=3)
+            memory_cache.invalidate('fused_user')
+            index_memories('fused_user', [{'id': 'new', 'memory': 'machine learning machine learning notes'}])
+            second = fused_hybrid_search("machine learning", 'fused_user', [], top_n=3)
+
+        assert mock_mem0_client.get_all.call_count == 1
+        assert first[0]['id'] == 'mem_001'
+        assert second[0]['id'] == 'new'
+        assert second[0]['meta']['memory'] == 'machine learning machine learning notes'
+
+
+class TestRetrievalCache:
+    """Test the retrieval result cache"""
+
+    def test_normalized_prompts_share_entries(self):
+        """Test that casing, spacing and punctuation do not change the cache key"""
+        from app.utils.retrieval_cache import RetrievalCache
+
+        cache = RetrievalCache()
+        key, cached = cache.lookup('u1', 'What is  AI?', 5, scope='memory')
+        assert cached is None
+        cache.store(key, [{'id': 'mem_1'}])
+
+        _, cached = cache.lookup('u1', 'what is ai', 5, scope='memory')
+
+        assert cached == [{'id': 'mem_1'}]
+        assert cache.stats()['hit_rate'] == 0.5
+
+    def test_bump_invalidates_dependent_scopes_only(self):
+        """Test that a corpus bump only invalidates scopes reading that corpus"""
+        from app.utils.retrieval_cache import RetrievalCache
+
+        cache = RetrievalCache()
+        for scope in ('memory', 'conversation', 'all'):
+            key, _ = cache.lookup('u1', 'prompt', 5, scope=scope)
+            cache.store(key, [scope])
+
+        cache.bump('u1', 'conversation')
+
+        assert cache.lookup('u1', 'prompt', 5, scope='memory')[1] == ['memory']
+        assert cache.lookup('u1', 'prompt', 5, scope='conversation')[1] is None
+        assert cache.lookup('u1', 'prompt', 5, scope='all')[1] is None
+        assert cache.lookup('u2', 'prompt', 5, scope='memory')[1] is None
+
+    def test_results_computed_before_a_write_are_not_served_after_it(self):
+        """Test that storing under a stale key does not resurrect old results"""
+        from app.utils.retrieval_cache import RetrievalCache
+
+        cache = RetrievalCache()
+        key, _ = cache.lookup('u1', 'prompt', 5, scope='memory')
+        cache.bump('u1', 'memory')
+        cache.store(key, ['stale'])
+
+        assert cache.lookup('u1', 'prompt', 5, scope='memory')[1] is None
+
+    def test_own_write_keeps_prompt_entries(self):
+        """Test that a write made for a prompt invalidates other prompts but not that one"""
+        from app.utils.retrieval_cache import RetrievalCache
+
+        cache = RetrievalCache()
+        for prompt in ('What is AI?', 'other question'):
+            key, _ = cache.lookup('u1', prompt, 5, scope='all')
+            cache.store(key, [prompt])
+
+        cache.bump('u1', 'conversation', keep_prompts=['what is ai'])
+        cache.bump('u1', 'memory', keep_prompts=['What is AI?'])
+
+        assert cache.lookup('u1', 'What is AI?', 5, scope='all')[1] == ['What is AI?']
+        assert cache.lookup('u1', 'other question', 5, scope='all')[1] is None
+
+    def test_own_write_drops_entries_listing_pending_memories(self):
+        """Test that results showing a read-your-writes placeholder are not carried over"""
+        from app.utils.retrieval_cache import RetrievalCache
+
+        cache = RetrievalCache()
+        key, _ = cache.lookup('u1', 'What is AI?', 5, scope='memory')
+        cache.store(key, [{'type': 'memory', 'id': 'pending:abc', 'meta': {'id': 'pending:abc'}}])
+
+        cache.bump('u1', 'memory', keep_prompts=['What is AI?'])
+
+        assert cache.lookup('u1', 'What is AI?', 5, scope='memory')[1] is None
+
+    @pytest.mark.asyncio
+    async def test_repeated_turns_hit_across_requests(self, temp_db):
+        """Test that storing the pipeline's own exchange does not defeat the next lookup"""
+        from app.utils.database import store_conversation
+        from app.utils.retrieval_cache import retrieval_cache
+        from app.sequential_agent.agents import conversation_agent
+        from app.sequential_agent.agentic_state import ResearchState
+
+        retrieval_cache.clear()
+        with patch('app.utils.database.DB_PATH', temp_db), \
+             patch('app.sequential_agent.agents.abm25_hybrid_search', new_callable=AsyncMock, return_value=[]) as mock_search:
+            store_conversation("repeat_user", "Earlier question", "Earlier answer", durable=True)
+            for _ in range(3):
+                await conversation_agent(ResearchState(user_id="repeat_user", prompt="What is AI?"))
+                store_conversation("repeat_user", "What is AI?", "An answer", durable=True)
+            # An exchange for another prompt still invalidates
+            store_conversation("repeat_user", "A different prompt", "Another answer", durable=True)
+            await conversation_agent(ResearchState(user_id="repeat_user", prompt="What is AI?"))
+
+        assert mock_search.await_count == 2
+        assert retrieval_cache.stats()['hits'] == 2
+    def test_ttl_expiry(self):
+        """Test that expired entries are treated as misses"""
+        from app.utils.retrieval_cache import RetrievalCache
+
+        cache = RetrievalCache(ttl_seconds=10)
+        with patch('app.utils.retrieval_cache.time.monotonic', return_value=100.0):
+            key, _ = cache.lookup('u1', 'prompt', 5, scope='memory')
+            cache.store(key, ['result'])
+        with patch('app.utils.retrieval_cache.time.monotonic', return_value=111.0):
+            assert cache.lookup('u1', 'prompt', 5, scope='memory')[1] is None
+
+    def test_write_memory_bumps_only_on_change(self, mock_mem0_client):
+        """Test that mem0 NONE events leave cached memory results valid"""
+        from app.utils.retrieval_cache import retrieval_cache
+
+        with patch('app.utils.memory.mem0_client', mock_mem0_client):
+            mock_mem0_client.add.return_value = {'results': [{'id': 'm1', 'memory': 'x', 'event': 'NONE'}]}
+            write_memory("same prompt", "cache_user")
+            assert retrieval_cache.version("cache_user", "memory") == 0
+
+            mock_mem0_client.add.return_value = {'results': [{'id': 'm2', 'memory': 'y', 'event': 'ADD'}]}
+            write_memory("new prompt", "cache_user")
+            assert retrieval_cache.version("cache_user", "memory") == 1
+
+    @pytest.mark.asyncio
+    async def test_memory_agents_share_cached_results(self):
+        """Test that a repeated prompt skips get_all_memories across pipelines"""
+        from app.sequential_agent.agents import memory_agent as sequential_memory_agent
+        from app.sequential_agent.agentic_state import ResearchState
+        from app.multiagent.agents import memory_agent as multi_memory_agent
+        from app.multiagent.state import MultiAgentState
+
+        memories = [{'id': 'mem_1', 'memory': 'AI is intelligence.'}]
+        with patch('app.sequential_agent.agents.get_all_memories', return_value=memories) as seq_get_all, \
+             patch('app.sequential_agent.agents.write_memory'), \
+             patch('app.multiagent.agents.get_all_memories', return_value=memories) as multi_get_all, \
+             patch('app.multiagent.agents.write_memory'):
+            await sequential_memory_agent(ResearchState(user_id="cache_user", prompt="What is AI?"))
+            state = await multi_memory_agent(MultiAgentState(user_id="cache_user", prompt="what is AI"))
+
+        seq_get_all.assert_called_once()
+        multi_get_all.assert_not_called()
+        assert state.memories == memories
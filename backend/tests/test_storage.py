@@ -0,0 +1,211 @@
+import pytest
+import sqlite3
+from unittest.mock import Mock, AsyncMock, patch
+
+
+class TestConnectionManager:
+    """Test pooled SQLite connections"""
+
+    def test_sqlite_path_from_database_url(self):
+        """Test parsing of sqlite:/// URLs"""
+        from app.utils.connections import sqlite_path
+
+        assert sqlite_path("sqlite:///./research.db") == "./research.db"
+        assert sqlite_path("sqlite:////var/data/research.db") == "/var/data/research.db"
+        assert sqlite_path("sqlite:///:memory:") == ":memory:"
+        with pytest.raises(ValueError):
+            sqlite_path("postgresql://localhost/research")
+
+    def test_connection_reused_per_thread_and_schema_created_once(self, tmp_path):
+        """Test that each thread opens one connection and the schema runs once"""
+        import threading
+        from app.utils.connections import ConnectionManager
+
+        schema = Mock()
+        manager = ConnectionManager(schema=schema)
+        path = str(tmp_path / "pool.db")
+        main_conn = manager.connection(path)
+        assert manager.connection(path) is main_conn
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(manager.connection(path)))
+        thread.start()
+        thread.join()
+
+        assert other[0] is not main_conn
+        assert manager.opened == 2
+        schema.assert_called_once()
+        assert main_conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        manager.close_all()
+
+    def test_readers_do_not_block_behind_writer(self, tmp_path):
+        """Test that WAL lets a reader proceed while a write transaction is open"""
+        import threading
+        from app.utils.connections import ConnectionManager
+
+        manager = ConnectionManager(schema=lambda conn: conn.execute("CREATE TABLE t (x INTEGER)"), busy_timeout=0.1)
+        path = str(tmp_path / "wal.db")
+        writer = manager.connection(path)
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute("INSERT INTO t VALUES (1)")
+
+        rows = []
+        thread = threading.Thread(target=lambda: rows.append(manager.connection(path).execute("SELECT COUNT(*) FROM t").fetchone()[0]))
+        thread.start()
+        thread.join()
+        writer.commit()
+
+        assert rows == [0]
+        manager.close_all()
+
+
+class TestGroupCommitBuffer:
+    """Test group commit of conversation writes"""
+
+    def test_concurrent_writes_share_transactions(self):
+        """Test that writes from many threads are committed in few batches"""
+        import threading
+        from app.utils.write_buffer import GroupCommitBuffer
+
+        batches = []
+        buffer = GroupCommitBuffer(lambda key, items: batches.append((key, list(items))), max_rows=64, max_delay=0.05)
+        threads = [threading.Thread(target=lambda i=i: buffer.submit("db", i, user_id=f"u{i % 3}").result()) for i in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        buffer.shutdown()
+
+        assert sorted(item for _, items in batches for item in items) == list(range(40))
+        assert len(batches) < 40
+        assert buffer.committed == 40
+
+    def test_shutdown_flushes_pending_writes(self):
+        """Test that nothing buffered is lost at shutdown"""
+        from app.utils.write_buffer import GroupCommitBuffer
+
+        written = []
+        buffer = GroupCommitBuffer(lambda key, items: written.extend(items), max_delay=60)
+        future = buffer.submit("db", "exchange")
+        buffer.shutdown(timeout=5)
+
+        assert written == ["exchange"]
+        assert future.done()
+
+    def test_failed_batch_fails_futures(self):
+        """Test that durable callers see a write that could not be committed"""
+        from app.utils.write_buffer import GroupCommitBuffer
+
+        buffer = GroupCommitBuffer(Mock(side_effect=sqlite3.OperationalError("locked")), max_delay=0, max_retries=1, retry_backoff=0)
+        future = buffer.submit("db", "exchange")
+
+        with pytest.raises(sqlite3.OperationalError):
+            future.result(timeout=5)
+        assert buffer.failed == 1
+        buffer.shutdown()
+
+    def test_post_commit_failure_does_not_repeat_the_write(self):
+        """Test that a failing post-commit callback neither retries nor fails the batch"""
+        from app.utils.write_buffer import GroupCommitBuffer
+
+        write_fn = Mock()
+        buffer = GroupCommitBuffer(write_fn, max_delay=0, retry_backoff=0, on_committed=Mock(side_effect=RuntimeError("index down")))
+        future = buffer.submit("db", "exchange")
+
+        assert future.result(timeout=5) is None
+        write_fn.assert_called_once_with("db", ["exchange"])
+        assert buffer.committed == 1
+        buffer.shutdown()
+
+    def test_post_commit_error_keeps_single_copy_of_exchange(self, temp_db):
+        """Test that an error after the commit does not insert the exchange twice"""
+        from app.utils.database import store_conversation
+
+        with patch('app.utils.database.DB_PATH', temp_db), \
+             patch('app.utils.database.retrieval_cache.bump', side_effect=RuntimeError("cache down")):
+            store_conversation("index_user", "Hello", "Hi", durable=True)
+            conn = sqlite3.connect(temp_db)
+            rows = conn.execute("SELECT role FROM conversation_history WHERE user_id = 'index_user'").fetchall()
+            conn.close()
+
+        assert rows == [('user',), ('agent',)]
+
+    def test_durable_store_is_committed_on_return(self, temp_db):
+        """Test that a durable store_conversation returns only after the commit"""
+        from app.utils.database import store_conversation
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            store_conversation("durable_user", "Hello", "Hi", durable=True)
+            conn = sqlite3.connect(temp_db)
+            rows = conn.execute("SELECT role FROM conversation_history WHERE user_id = 'durable_user'").fetchall()
+            conn.close()
+
+        assert rows == [('user',), ('agent',)]
+
+
+class TestConversationFullTextSearch:
+    """Test FTS5-backed search over the full conversation history"""
+
+    def test_search_finds_old_turns(self, temp_db):
+        """Test that relevant turns outside the recency window are found"""
+        from app.utils.database import search_conversation_history, store_conversation
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            store_conversation("fts_user", "Tell me about quantum computing", "Qubits hold superpositions.")
+            for i in range(12):
+                store_conversation("fts_user", f"Filler question {i}", f"Filler answer {i}")
+
+            result = search_conversation_history("fts_user", "quantum qubits?", limit=5)
+
+        assert {content for _, content, _ in result} == {"Qubits hold superpositions.", "Tell me about quantum computing"}
+
+    def test_search_is_scoped_to_user(self, temp_db):
+        """Test that other users' turns are never returned"""
+        from app.utils.database import search_conversation_history, store_conversation
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            store_conversation("alice", "neural networks", "answer for alice")
+            store_conversation("alice_bob", "neural networks too", "answer for alice_bob")
+
+            result = search_conversation_history("alice", "neural", limit=10)
+
+        assert [content for _, content, _ in result] == ["neural networks"]
+
+    def test_existing_rows_are_indexed_on_first_search(self, temp_db):
+        """Test that rows written before the index existed are searchable"""
+        from app.utils.database import search_conversation_history
+
+        conn = sqlite3.connect(temp_db)
+        conn.execute("INSERT INTO conversation_history VALUES ('u1', 'user', 'legacy row about sqlite', '1.0')")
+        conn.commit()
+        conn.close()
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            result = search_conversation_history("u1", "sqlite", limit=10)
+
+        assert result == [('user', 'legacy row about sqlite', 1.0)]
+
+    def test_search_without_terms_falls_back_to_recent(self):
+        """Test that queries without searchable terms use the recency window"""
+        from app.utils.database import search_conversation_history
+
+        with patch('app.utils.database.fetch_conversation_history', return_value=[('user', 'Hi', '1')]) as mock_fetch:
+            result = search_conversation_history("u1", "?!", limit=3)
+
+        mock_fetch.assert_called_once_with("u1", limit=3)
+        assert result == [('user', 'Hi', '1')]
+
+    @pytest.mark.asyncio
+    async def test_conversation_agent_uses_fts(self):
+        """Test that the conversation agent can use full-text search"""
+        from app.sequential_agent.agents import conversation_agent
+        from app.sequential_agent.agentic_state import ResearchState
+
+        state = ResearchState(user_id="fts_user", prompt="quantum")
+        with patch('app.sequential_agent.agents.settings') as mock_settings, \
+             patch('app.sequential_agent.agents.asearch_conversation_history', new_callable=AsyncMock, return_value=[('user', 'quantum', '1')]) as mock_search:
+            mock_settings.CONVERSATION_RETRIEVAL = "fts"
+            new_state = await conversation_agent(state)
+
+        mock_search.assert_called_once_with("fts_user", "quantum", limit=10)
+        assert new_state.conversations == [('user', 'quantum', '1')]
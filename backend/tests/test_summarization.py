@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import patch
+
+
+class TestConversationSummarization:
+    """Test rolling old conversation turns into summaries"""
+
+    def test_old_turns_rolled_into_summaries(self, temp_db):
+        """Test that all but the newest turns become summaries and their rows are deleted"""
+        from app.utils.database import store_conversation, fetch_conversation_history, conversation_shard_stats
+        from app.utils.summarization import summarize_user
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            for i in range(25):
+                store_conversation("long_user", f"Question {i} about sqlite.", f"Answer {i}.")
+            preview = summarize_user("long_user", keep_turns=5, batch_turns=10, dry_run=True)
+            report = summarize_user("long_user", keep_turns=5, batch_turns=10)
+            history = fetch_conversation_history("long_user", limit=4, summaries=5)
+            stats = conversation_shard_stats()[0]
+
+        assert preview['rows_deleted'] == 40 and stats['summaries'] == 2
+        assert report == {'user_id': 'long_user', 'turns_summarized': 20, 'rows_deleted': 40, 'summaries_written': 2, 'summaries_merged': 0}
+        assert stats['rows'] == 10
+        assert [role for role, _, _ in history] == ['summary', 'summary', 'user', 'agent', 'user', 'agent']
+        assert "User: Question 0 about sqlite." in history[0][1]
+        assert history[-1][1] == "Answer 24."
+
+    def test_full_text_search_finds_summarized_turns(self, temp_db):
+        """Test that a topic whose turns were rolled into a summary is still found by FTS search"""
+        from app.utils.database import store_conversation, search_conversation_history
+        from app.utils.summarization import summarize_user
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            store_conversation("fts_long", "How do I tune sqlite write throughput?", "Batch writes into one transaction.")
+            for i in range(6):
+                store_conversation("fts_long", f"Filler question {i}", f"Filler answer {i}")
+            summarize_user("fts_long", keep_turns=3, batch_turns=10)
+            result = search_conversation_history("fts_long", "sqlite throughput", limit=3)
+            filler = search_conversation_history("fts_long", "filler", limit=10)
+
+        assert result[0][0] == 'summary'
+        assert "sqlite write throughput" in result[0][1]
+        assert [role for role, _, _ in filler].count('summary') == 1
+
+    def test_full_text_search_interleaves_turns_and_summaries_by_rank(self, temp_db):
+        """Test that turns and summaries are merged by rank, not by bm25 scores from different tables"""
+        from app.utils.database import store_conversation, search_conversation_history
+        from app.utils.summarization import summarize_user
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            for i in range(4):
+                store_conversation("fts_mix", f"Old sqlite question {i}", f"Old answer {i}")
+            summarize_user("fts_mix", keep_turns=0, batch_turns=10)
+            for i in range(3):
+                store_conversation("fts_mix", f"New sqlite question {i}", f"New answer {i}")
+            result = search_conversation_history("fts_mix", "sqlite", limit=3)
+
+        assert [role for role, _, _ in result] == ['user', 'summary', 'user']
+
+    def test_summaries_bounded_by_merging(self, temp_db):
+        """Test that the oldest summaries are merged once a user has too many"""
+        from app.utils.database import store_conversation, load_conversation_summaries
+        from app.utils.summarization import summarize_user
+
+        with patch('app.utils.database.DB_PATH', temp_db):
+            for i in range(12):
+                store_conversation("chatty", f"Prompt {i}", f"Reply {i}")
+                summarize_user("chatty", keep_turns=1, batch_turns=1, max_summaries=3)
+            summaries = load_conversation_summaries("chatty")
+
+        assert len(summaries) == 3
+        assert sum(s['turns'] for s in summaries) == 11
+        assert [s['first_timestamp'] <= s['last_timestamp'] for s in summaries] == [True] * 3
+
+    def test_extractive_summarizer_prefers_recurring_topics(self):
+        """Test that the extractive summary keeps central sentences within the length cap"""
+        from app.utils.summarization import extractive_summarizer
+
+        turns = [
+            ('user', "How do I tune sqlite write throughput? Asking for a friend.", 1.0),
+            ('agent', "Batch sqlite writes into one transaction for throughput.", 1.0),
+            ('user', "Thanks!", 2.0),
+        ]
+        summary = extractive_summarizer(turns, max_chars=120)
+
+        assert len(summary) <= 120
+        assert summary.splitlines()[0] == "User: How do I tune sqlite write throughput?"
+        assert "Thanks" not in summary
+
+    def test_custom_summarizer(self, temp_db):
+        """Test that a registered summarizer can be selected by name"""
+        from app.utils.database import store_conversation, load_conversation_summaries
+        from app.utils.summarization import summarize_user, register_summarizer, SUMMARIZERS
+
+        register_summarizer('count', lambda turns, max_chars: f"{len(turns)} messages")
+        try:
+            with patch('app.utils.database.DB_PATH', temp_db):
+                store_conversation("u1", "Hello", "Hi")
+                store_conversation("u1", "Bye", "See you")
+                summarize_user("u1", keep_turns=1, summarizer='count')
+                summaries = load_conversation_summaries("u1")
+        finally:
+            SUMMARIZERS.pop('count')
+
+        assert [s['summary'] for s in summaries] == ["2 messages"]
+        with pytest.raises(ValueError):
+            summarize_user("u1", summarizer='missing')